@@ -0,0 +1,109 @@
+"""
+Fake agent (local stand-in for `wa_agents.agent.Agent`) for offline tests.
+Renders every request into an Anthropic-style payload, records it and replies
+with a canned response (per agent name, optionally after a simulated provider
+latency) instead of calling a provider.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert( 0, str(ROOT))
+
+from wa_agents.basemodels import ( AssistantMsg,
+                                   Message,
+                                   ToolCall )
+
+
+class FakeAgent :
+    
+    api           = "anthropic"
+    response_text = "OK"
+    
+    # Simulated provider latency in seconds (mean and uniform jitter)
+    latency        = 0.0
+    latency_jitter = 0.0
+    
+    # Canned responses per agent name, as `AssistantMsg` fields; tool calls are given
+    # as dicts with keys `name` and `input` (ids are generated per response)
+    responses : dict[ str, dict[ str, Any]] = {}
+    
+    def __init__( self, name : str, models : list[str]) -> None :
+        
+        self.name   = name
+        self.models = models
+        
+        self.system          : list[str]            = []
+        self.tools           : list[ dict[ str, Any]] = []
+        self.post_processors : list                 = []
+        self.requests        : list[ dict[ str, Any]] = []
+        
+        return
+    
+    def load_prompts( self, prompts : list[ str | dict[ str, Any]]) -> None :
+        
+        for prompt in prompts :
+            if isinstance( prompt, str) :
+                prompt = { "path" : prompt, "replace" : {} }
+            text = ( ROOT / prompt["path"] ).read_text( encoding = "utf-8")
+            for old, new in prompt.get( "replace", {}).items() :
+                text = text.replace( old, new or "")
+            self.system.append(text)
+        
+        return
+    
+    def load_tools( self, tools : list[str]) -> None :
+        
+        for path in tools :
+            with open( ROOT / path, encoding = "utf-8") as f :
+                self.tools.extend(json.load(f))
+        
+        return
+    
+    @staticmethod
+    def render_message( message : Message) -> dict[ str, Any] :
+        
+        role    = "assistant" if isinstance( message, AssistantMsg) else "user"
+        content = getattr( message, "text", None) \
+               or message.model_dump_json( include = { "tool_calls", "tool_results" } )
+        
+        return { "role" : role, "content" : content }
+    
+    def build_payload( self, context : list[Message]) -> dict[ str, Any] :
+        
+        return { "model"    : self.models[0],
+                 "system"   : "\n\n".join(self.system),
+                 "tools"    : self.tools,
+                 "messages" : [ self.render_message(msg) for msg in context ] }
+    
+    def get_response( self,
+                      context    : list[Message],
+                      origin     : str | None = None,
+                      load_imgs  : bool = False,
+                      imgs_cache : dict[ str, bytes] | None = None,
+                      output_st  : Any = None,
+                      max_tokens : int | None = None,
+                      debug      : bool = False ) -> AssistantMsg :
+        
+        self.requests.append(self.build_payload(context))
+        
+        if self.latency or self.latency_jitter :
+            jitter = random.uniform( -self.latency_jitter, self.latency_jitter)
+            time.sleep(max( 0.0, self.latency + jitter))
+        
+        response = dict(self.responses.get( self.name, { "text" : self.response_text }))
+        if response.get("tool_calls") :
+            response["tool_calls"] = [ ToolCall( id = f"call_{uuid4().hex[:16]}", **tc)
+                                       for tc in response["tool_calls"] ]
+        
+        return AssistantMsg( origin = origin or "FakeAgent",
+                             agent  = self.name,
+                             **response )
@@ -0,0 +1,667 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the queue worker and `CaseHandler`, offline.
+Synthetic conversations (greeting, model choice, image and follow-ups) are posted as
+WhatsApp webhooks to the real listener app, which pushes them into a local queue
+database (in a temporary directory), and are drained by real `QueueWorker`s (one
+per thread), as `run_queue_worker.py` does. Handlers differ from `CaseHandler` only
+at the edges:
+* agents are replaced by the fake agent (configurable latency, canned image
+  analysis and tool calls),
+* outgoing messages are recorded by a fake sender instead of being sent, and
+* cases and media are kept in memory instead of the case storage (`BUCKET_*`),
+  see `MemoryCaseStore`.
+
+Reports throughput, per-state latency percentiles and queue depth over time.
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import os
+import random
+import signal
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from uuid import uuid4
+
+from dotenv import load_dotenv
+
+from fake_agent import ( FakeAgent,
+                         ROOT )
+
+load_dotenv(ROOT / ".env")
+
+# Keep the queue and the local SQLite stores of the case handler out of the repo
+TEMP_DIR = tempfile.mkdtemp( prefix = "load_test_")
+for prefix in ( "QUEUE", "CHECKPOINT", "IMAGE_INDEX", "USAGE") :
+    os.environ[f"{prefix}_DB_DIR"] = TEMP_DIR
+
+from PIL import Image
+from wa_agents.basemodels import ( InteractiveOption,
+                                   MediaContent,
+                                   MediaInfo,
+                                   Message,
+                                   UserContentMsg,
+                                   UserInteractiveReplyMsg,
+                                   WhatsAppMsg )
+from wa_agents.case_handler_base import CaseHandlerBase
+from wa_agents.listener import Listener
+from wa_agents.queue_db import QueueDB
+from wa_agents.queue_worker import QueueWorker
+
+from casehandler import CaseHandler
+from domain_knowledge.dk_database import DomainKnowledgeDataBase
+
+
+OPERATOR = { "display_phone_number" : "15550000000",
+             "phone_number_id"      : "000000000000000" }
+
+FOLLOW_UPS = [ "Hola", "Ya revise el motor, sigue igual", "Que mas puedo revisar?",
+               "Gracias" ]
+
+
+class FakeSender :
+    """
+    Records outgoing messages instead of sending them (shared by all handlers).
+    """
+    
+    def __init__(self) -> None :
+        
+        self.lock   = threading.Lock()
+        self.counts : dict[ str, int] = {}
+        
+        return
+    
+    def record( self, kind : str) -> None :
+        
+        with self.lock :
+            self.counts[kind] = self.counts.get( kind, 0) + 1
+        
+        return
+
+
+class MemoryStorage :
+    """
+    In-memory stand-in for the case storage calls made by `CaseHandler`.
+    """
+    
+    def __init__( self, media : dict[ str, MediaContent]) -> None :
+        
+        self.media = media
+        
+        return
+    
+    def manifest_write( self, manifest : Any) -> None :
+        return
+    
+    def media_get( self, name : str) -> bytes :
+        return self.media[name].content
+
+
+class MemoryCaseStore(CaseHandlerBase) :
+    """
+    Case context kept in memory (per user, shared by all handlers) instead of the case
+    storage. Placed between `CaseHandler` and `CaseHandlerBase` (see
+    `LoadTestCaseHandler`), so that `CaseHandler` overloads run unchanged on top. \\
+    Incoming WhatsApp messages are resolved to the messages registered by the load
+    test (see `register`), and media to the registered contents.
+    """
+    
+    memory_lock     = threading.Lock()
+    memory_cases    : dict[ str, dict[ str, Any]] = {}  # user -> { "messages", "model" }
+    memory_messages : dict[ str, Message]         = {}  # WhatsApp message id -> message
+    memory_media    : dict[ str, MediaContent]    = {}  # media name -> contents
+    
+    @classmethod
+    def register( cls,
+                  wa_msg_id : str,
+                  message   : Message,
+                  media     : MediaContent | None = None ) -> None :
+        
+        cls.memory_messages[wa_msg_id] = message
+        if media :
+            cls.memory_media[media.name] = media
+        
+        return
+    
+    def __init__( self, *args, **kwargs) -> None :
+        
+        super().__init__( *args, **kwargs)
+        self.storage = MemoryStorage(self.memory_media)
+        
+        return
+    
+    def memory_case(self) -> dict[ str, Any] :
+        
+        return self.memory_cases.setdefault( self.user.wa_id,
+                                             { "messages" : [], "model" : None })
+    
+    def context_build( self, truncate : bool = True) -> None :
+        
+        with self.memory_lock :
+            case     = self.memory_case()
+            messages = list(case["messages"])
+            self.case_manifest = SimpleNamespace( model = case["model"], status = "open")
+        
+        self.case_context = []
+        for message in messages :
+            self.case_context.append(message)
+            self.ingest_message(message)
+        
+        return
+    
+    def context_update( self, message : Message) -> None :
+        
+        with self.memory_lock :
+            case = self.memory_case()
+            case["messages"].append(message)
+            case["model"] = case["model"] or self.case_manifest.model
+        
+        self.case_context.append(message)
+        self.ingest_message(message)
+        
+        return
+    
+    def dedup_and_ingest_message( self,
+                                  message       : WhatsAppMsg,
+                                  media_content : MediaContent | None = None
+                                ) -> Message | None :
+        
+        if not self.case_context :
+            self.context_build()
+        
+        msg = self.memory_messages.get(message.id)
+        if ( msg is None ) or any( m is msg for m in self.case_context ) :
+            return None
+        
+        self.context_update(msg)
+        
+        return msg
+    
+    def case_mark_as_resolved(self) -> None :
+        
+        self.case_manifest.status = "resolved"
+        
+        return
+
+
+class LoadTestCaseHandler( CaseHandler, MemoryCaseStore) :
+    """
+    Case handler with fake agents, a fake sender and in-memory cases, timing every
+    step by FSM state.
+    """
+    
+    AGENT_CLASS = FakeAgent
+    sender      = FakeSender()
+    
+    # Load test being run (set by `LoadTest.run`)
+    load_test : LoadTest | None = None
+    
+    def send_text( self, message : Any) -> None :
+        return self.sender.record("text")
+    
+    def send_interactive( self, message : Any) -> None :
+        return self.sender.record("interactive")
+    
+    def process_message( self,
+                         message       : WhatsAppMsg,
+                         media_content : MediaContent | None = None
+                       ) -> bool :
+        
+        self.wa_msg_id = message.id
+        self.load_test.started(message.id)
+        
+        # Media cannot be downloaded from WhatsApp offline
+        msg = self.memory_messages.get(message.id)
+        if ( media_content is None ) and msg and getattr( msg, "media", None) :
+            media_content = self.memory_media.get(msg.media.name)
+        
+        return self.timed( "process_message", super().process_message,
+                           message, media_content)
+    
+    def generate_response( self, max_tokens : int | None = None) -> bool :
+        return self.timed( self.state, super().generate_response, max_tokens)
+    
+    def timed( self, label : str, method : Any, *args) -> bool :
+        """
+        Time a handler step; once a step needs no further response (or fails) the
+        message is done.
+        """
+        start = time.perf_counter()
+        try :
+            respond = method(*args)
+        except Exception :
+            self.load_test.finished( self.wa_msg_id, error = True)
+            raise
+        self.load_test.recorder.add( label, time.perf_counter() - start)
+        
+        if not respond :
+            self.load_test.finished(self.wa_msg_id)
+        
+        return respond
+
+
+class Recorder :
+    """
+    Thread-safe store of latency samples (seconds) per label.
+    """
+    
+    def __init__(self) -> None :
+        
+        self.lock    = threading.Lock()
+        self.samples : dict[ str, list[float]] = {}
+        
+        return
+    
+    def add( self, label : str, seconds : float) -> None :
+        
+        with self.lock :
+            self.samples.setdefault( label, []).append(seconds)
+        
+        return
+
+
+def percentile( values : list[float], p : float) -> float :
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    ordered = sorted(values)
+    rank    = max( 1, round( p / 100 * len(ordered) + 0.5 ))
+    
+    return ordered[ min( rank, len(ordered)) - 1 ]
+
+def make_image( seed : int) -> bytes :
+    """
+    Small random JPEG (distinct per seed, so image analyses are not reused).
+    """
+    rng   = random.Random(seed)
+    image = Image.new( "RGB", ( 64, 64))
+    image.putdata([ tuple( rng.randrange(256) for _ in range(3) ) for _ in range( 64 * 64) ])
+    buffer = BytesIO()
+    image.save( buffer, format = "JPEG")
+    
+    return buffer.getvalue()
+
+def make_webhook( wa_id : str, message : dict[ str, Any]) -> dict[ str, Any] :
+    """
+    WhatsApp Cloud API webhook payload with one incoming message.
+    """
+    value = { "messaging_product" : "whatsapp",
+              "metadata"          : OPERATOR,
+              "contacts"          : [ { "profile" : { "name" : "Load Test" },
+                                        "wa_id"   : wa_id } ],
+              "messages"          : [ message ] }
+    
+    return { "object" : "whatsapp_business_account",
+             "entry"  : [ { "id"      : OPERATOR["phone_number_id"],
+                            "changes" : [ { "field" : "messages",
+                                            "value" : value } ] } ] }
+
+def make_message( wa_id    : str,
+                  msg_type : str,
+                  payload  : dict[ str, Any],
+                  message  : Message,
+                  media    : MediaContent | None = None ) -> dict[ str, Any] :
+    """
+    Webhook payload of a WhatsApp message, registering the message it is ingested as
+    (see `MemoryCaseStore`).
+    """
+    wa_msg_id = f"wamid.{uuid4().hex}"
+    MemoryCaseStore.register( wa_msg_id, message, media)
+    
+    return make_webhook( wa_id, { "from"      : wa_id,
+                                  "id"        : wa_msg_id,
+                                  "timestamp" : str(int(time.time())),
+                                  "type"      : msg_type,
+                                  msg_type    : payload } )
+
+def make_conversation( user_index  : int,
+                       drone_model : str,
+                       n_follow_up : int,
+                       image_bytes : bytes | None
+                     ) -> list[ dict[ str, Any]] :
+    """
+    Synthetic conversation: greeting, model choice, image and follow-ups. \\
+    Returns:
+        List of webhook payloads
+    """
+    wa_id = f"5199{user_index:07d}"
+    image = MediaContent( name    = f"{uuid4().hex}.jpg",
+                          mime    = "image/jpeg",
+                          content = image_bytes or make_image(user_index) )
+    
+    greeting = "Hola, tengo un problema"
+    option   = InteractiveOption( id = drone_model, title = drone_model)
+    conversation = [
+        make_message( wa_id, "text", { "body" : greeting },
+                      UserContentMsg( text = greeting)),
+        make_message( wa_id, "interactive",
+                      { "type"         : "button_reply",
+                        "button_reply" : { "id"    : drone_model,
+                                           "title" : drone_model } },
+                      UserInteractiveReplyMsg( choice = option)),
+        make_message( wa_id, "image", { "id"        : image.name,
+                                        "mime_type" : image.mime },
+                      UserContentMsg( media = MediaInfo( name = image.name,
+                                                         mime = image.mime )),
+                      image ),
+    ]
+    for i in range(n_follow_up) :
+        text = FOLLOW_UPS[ i % len(FOLLOW_UPS) ]
+        conversation.append(make_message( wa_id, "text", { "body" : text },
+                                          UserContentMsg( text = text)))
+    
+    return conversation
+
+def set_canned_responses( drone_model : str, n_codes : int, seed : int) -> None :
+    """
+    Canned fake agent responses: image analysis with message codes from the DKDB and a
+    joint diagnosis tool call on the same codes.
+    """
+    dkdb = DomainKnowledgeDataBase()
+    dkdb.set_model(drone_model)
+    codes = random.Random(seed).sample( list(dkdb.dkb_msgs), n_codes)
+    
+    analysis = { "is_screen_photo" : True,
+                 "screen_type"     : "HMS",
+                 "language"        : "es",
+                 "error_messages"  : codes }
+    
+    FakeAgent.responses = {
+        "image" : { "text"       : json.dumps(analysis) },
+        "match" : { "tool_calls" : [ { "name"  : "get_joint_diagnosis",
+                                       "input" : { "message_codes" : codes } } ] },
+        "main"  : { "text"       : "Revise el motor y la ESC indicados." },
+    }
+    
+    return
+
+
+class LoadTest :
+    
+    def __init__( self,
+                  conversations : list[ list[ dict[ str, Any]]],
+                  n_workers     : int,
+                  arrival_rate  : float,
+                  think_time    : float,
+                  sample_period : float,
+                  webhook_path  : str,
+                  timeout       : float ) -> None :
+        
+        self.conversations = conversations
+        self.n_workers     = n_workers
+        self.arrival_rate  = arrival_rate
+        self.think_time    = think_time
+        self.sample_period = sample_period
+        self.webhook_path  = webhook_path
+        self.timeout       = timeout
+        
+        # Local queue, fed through the real listener app
+        self.queue_db = QueueDB(Path(TEMP_DIR) / "queue.sqlite3")
+        self.listener = Listener( __name__, self.queue_db).test_client()
+        
+        # Messages not yet due: heap of (due time, conversation index, step)
+        self.pending      : list[ tuple[ float, int, int]] = []
+        self.pending_lock = threading.Lock()
+        # Posted messages: WhatsApp message id -> (conversation index, step, post time)
+        self.posted : dict[ str, tuple[ int, int, float]] = {}
+        
+        self.recorder  = Recorder()
+        self.queued    = 0
+        self.in_flight = 0
+        self.remaining = sum( map( len, conversations) )
+        self.errors    = 0
+        self.counter   = threading.Lock()
+        self.done      = threading.Event()
+        
+        self.timeline : list[ tuple[ float, int, int]] = []
+        
+        return
+    
+    def schedule( self, due : float, conv_index : int, step : int) -> None :
+        
+        with self.pending_lock :
+            heapq.heappush( self.pending, ( due, conv_index, step))
+        
+        return
+    
+    def post( self, conv_index : int, step : int) -> None :
+        """
+        Post a message to the listener (as WhatsApp would).
+        """
+        payload   = self.conversations[conv_index][step]
+        wa_msg_id = payload["entry"][0]["changes"][0]["value"]["messages"][0]["id"]
+        with self.counter :
+            self.posted[wa_msg_id] = ( conv_index, step, time.perf_counter())
+            self.queued += 1
+        
+        response = self.listener.post( self.webhook_path, json = payload)
+        if response.status_code != 200 :
+            print(f"[ERROR] Conversation {conv_index} step {step}: "
+                  f"listener returned {response.status_code}")
+            self.finished( wa_msg_id, error = True, queued = True)
+        
+        return
+    
+    def feeder(self) -> None :
+        """
+        Post due messages to the listener.
+        """
+        while not self.done.is_set() :
+            now = time.perf_counter()
+            due = []
+            with self.pending_lock :
+                while self.pending and ( self.pending[0][0] <= now ) :
+                    due.append(heapq.heappop(self.pending)[1:])
+            for conv_index, step in due :
+                self.post( conv_index, step)
+            time.sleep(0.001)
+        
+        return
+    
+    def sampler( self, start : float) -> None :
+        
+        while not self.done.is_set() :
+            self.timeline.append( ( time.perf_counter() - start,
+                                    self.queued,
+                                    self.in_flight ) )
+            self.done.wait(self.sample_period)
+        
+        return
+    
+    def started( self, wa_msg_id : str) -> None :
+        """
+        A worker picked up a message (called by the handler).
+        """
+        with self.counter :
+            _, _, posted = self.posted[wa_msg_id]
+            self.queued    -= 1
+            self.in_flight += 1
+        self.recorder.add( "queue_wait", time.perf_counter() - posted)
+        
+        return
+    
+    def finished( self,
+                  wa_msg_id : str,
+                  error     : bool = False,
+                  queued    : bool = False ) -> None :
+        """
+        A message needs no further response (called by the handler), or failed.
+        """
+        end = time.perf_counter()
+        with self.counter :
+            if wa_msg_id not in self.posted :
+                return
+            conv_index, step, posted = self.posted.pop(wa_msg_id)
+            if queued :
+                self.queued    -= 1
+            else :
+                self.in_flight -= 1
+            self.remaining -= 1
+            self.errors    += int(error)
+            if not self.remaining :
+                self.done.set()
+        self.recorder.add( "end_to_end", end - posted)
+        
+        # Next message of the conversation arrives after the user's think time
+        if step + 1 < len(self.conversations[conv_index]) :
+            self.schedule( end + self.think_time, conv_index, step + 1)
+        
+        return
+    
+    def run(self) -> float :
+        """
+        Run the load test. \\
+        Returns:
+            Elapsed time in seconds
+        """
+        LoadTestCaseHandler.load_test = self
+        workers = [ QueueWorker( self.queue_db, LoadTestCaseHandler)
+                    for _ in range(self.n_workers) ]
+        
+        start = time.perf_counter()
+        for i in range(len(self.conversations)) :
+            self.schedule( start + i / self.arrival_rate, i, 0)
+        
+        threads = [ threading.Thread( target = self.feeder),
+                    threading.Thread( target = self.sampler, args = ( start,)) ]
+        threads.extend( threading.Thread( target = worker.serve_forever)
+                        for worker in workers )
+        for thread in threads :
+            thread.start()
+        
+        if not self.done.wait(self.timeout) :
+            with self.counter :
+                print(f"[ERROR] Timed out with {self.remaining} messages unanswered")
+                self.errors += self.remaining
+            self.done.set()
+        
+        for worker in workers :
+            worker.stop( signal.SIGTERM, None)
+        for thread in threads :
+            thread.join()
+        
+        return time.perf_counter() - start
+    
+    def report( self, elapsed : float) -> dict[ str, Any] :
+        
+        n_messages = sum( map( len, self.conversations) )
+        latencies  = {}
+        for label, values in self.recorder.samples.items() :
+            latencies[label] = { "n"   : len(values),
+                                 "p50" : percentile( values, 50),
+                                 "p90" : percentile( values, 90),
+                                 "p99" : percentile( values, 99),
+                                 "max" : max(values) }
+        
+        return { "conversations" : len(self.conversations),
+                 "messages"      : n_messages,
+                 "errors"        : self.errors,
+                 "elapsed_s"     : elapsed,
+                 "throughput"    : n_messages / elapsed,
+                 "sent"          : dict(LoadTestCaseHandler.sender.counts),
+                 "latency_s"     : latencies,
+                 "queue_depth"   : [ { "t" : t, "queued" : q, "in_flight" : f }
+                                     for t, q, f in self.timeline ] }
+
+
+def print_report( report : dict[ str, Any]) -> None :
+    
+    print(f"Conversations: {report["conversations"]}  Messages: {report["messages"]}  "
+          f"Errors: {report["errors"]}")
+    print(f"Elapsed: {report["elapsed_s"]:.2f} s  "
+          f"Throughput: {report["throughput"]:.2f} messages/s")
+    print(f"Sent: {report["sent"]}")
+    print()
+    
+    print(f"{'STATE':<22} {'N':>6} {'P50 [ms]':>10} {'P90 [ms]':>10} "
+          f"{'P99 [ms]':>10} {'MAX [ms]':>10}")
+    for label, stats in report["latency_s"].items() :
+        print(f"{label:<22} {stats["n"]:>6} {1e3 * stats["p50"]:>10.1f} "
+              f"{1e3 * stats["p90"]:>10.1f} {1e3 * stats["p99"]:>10.1f} "
+              f"{1e3 * stats["max"]:>10.1f}")
+    print()
+    
+    timeline = report["queue_depth"]
+    if timeline :
+        depths = [ point["queued"] for point in timeline ]
+        print(f"Queue depth: max {max(depths)}  mean {sum(depths) / len(depths):.1f}")
+        print(f"{'T [s]':>8} {'QUEUED':>8} {'IN FLIGHT':>10}")
+        step = max( 1, len(timeline) // 20)
+        for point in timeline[::step] :
+            print(f"{point["t"]:>8.2f} {point["queued"]:>8} {point["in_flight"]:>10}")
+    
+    return
+
+
+def main() -> None :
+    
+    parser = argparse.ArgumentParser( description = __doc__,
+                                      formatter_class = argparse.RawDescriptionHelpFormatter )
+    parser.add_argument( "--users", type = int, default = 20,
+                         help = "Number of synthetic conversations" )
+    parser.add_argument( "--follow-ups", type = int, default = 3,
+                         help = "Follow-up messages per conversation (after the image)" )
+    parser.add_argument( "--workers", type = int, default = 4,
+                         help = "Concurrent queue workers" )
+    parser.add_argument( "--arrival-rate", type = float, default = 5.0,
+                         help = "New conversations per second" )
+    parser.add_argument( "--think-time", type = float, default = 0.5,
+                         help = "Seconds between a response and the user's next message" )
+    parser.add_argument( "--latency", type = float, default = 0.5,
+                         help = "Mean fake agent latency in seconds" )
+    parser.add_argument( "--jitter", type = float, default = 0.2,
+                         help = "Uniform jitter of the fake agent latency in seconds" )
+    parser.add_argument( "--model", default = "T50",
+                         choices = list(DomainKnowledgeDataBase.MODELS_AVAILABLE),
+                         help = "Drone model chosen in every conversation" )
+    parser.add_argument( "--codes", type = int, default = 3,
+                         help = "Message codes in the canned image analysis" )
+    parser.add_argument( "--image", type = Path, default = None,
+                         help = "Image sent in every conversation (default: random)" )
+    parser.add_argument( "--sample", type = float, default = 0.25,
+                         help = "Queue depth sampling period in seconds" )
+    parser.add_argument( "--webhook-path", default = "/webhook",
+                         help = "Route of the listener's webhook" )
+    parser.add_argument( "--timeout", type = float, default = 600.0,
+                         help = "Seconds to wait for every message to be answered" )
+    parser.add_argument( "--seed", type = int, default = 0,
+                         help = "Random seed" )
+    parser.add_argument( "--json", type = Path, default = None,
+                         help = "Also write the report to this JSON file" )
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    FakeAgent.latency        = args.latency
+    FakeAgent.latency_jitter = args.jitter
+    set_canned_responses( args.model, args.codes, args.seed)
+    
+    image_bytes   = args.image.read_bytes() if args.image else None
+    conversations = [ make_conversation( i, args.model, args.follow_ups, image_bytes)
+                      for i in range(args.users) ]
+    
+    load_test = LoadTest( conversations, args.workers, args.arrival_rate,
+                          args.think_time, args.sample, args.webhook_path,
+                          args.timeout )
+    elapsed   = load_test.run()
+    report    = load_test.report(elapsed)
+    
+    print_report(report)
+    if args.json :
+        args.json.write_text( json.dumps( report, indent = 1), encoding = "utf-8")
+        print(f"Wrote report to {args.json}")
+    
+    if report["errors"] :
+        raise SystemExit(1)
+
+
+if __name__ == "__main__" :
+    main()
@@ -0,0 +1,52 @@
+"""
+Prompt Cache (test helpers)
+-----
+* Split request payloads into system prompt and conversation messages, and
+  fingerprint their prefix (tools, system prompt and optionally the first messages)
+  to check that it is byte-identical across cases (see `test_prompt_prefix`).
+* Only payloads rendered by `fake_agent.FakeAgent` are checked: the requests sent by
+  `wa_agents.Agent` are rendered there and are not verified by these helpers.
+"""
+
+import json
+from hashlib import sha1
+from typing import Any
+
+
+def as_blocks( content : str | list[ dict[ str, Any]]) -> list[ dict[ str, Any]] :
+    """
+    Content as a (copied) list of content blocks.
+    """
+    if isinstance( content, str) :
+        return [ { "type" : "text", "text" : content } ]
+    
+    return [ dict(block) for block in content ]
+
+def split_system( payload : dict[ str, Any]) -> tuple[ list, list] :
+    """
+    Split a request payload into system prompt and conversation messages. \\
+    Handles both Anthropic payloads (`system` field) and OpenAI-style payloads
+    (leading messages with role `system`).
+    """
+    messages = payload.get( "messages", [])
+    
+    if payload.get("system") :
+        return as_blocks(payload["system"]), messages
+    
+    n_system = 0
+    while ( n_system < len(messages) ) and ( messages[n_system].get("role") == "system" ) :
+        n_system += 1
+    
+    return messages[:n_system], messages[n_system:]
+
+def prefix_fingerprint( payload : dict[ str, Any], n_prefix : int = 0) -> str :
+    """
+    Fingerprint of the stable prefix of a request payload: tools, system prompt and
+    first `n_prefix` conversation messages.
+    """
+    system, messages = split_system(payload)
+    prefix = { "tools"    : payload.get( "tools", []),
+               "system"   : system,
+               "messages" : messages[:n_prefix] }
+    
+    return sha1(json.dumps( prefix, ensure_ascii = False).encode()).hexdigest()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Check that a `CaseHandler` restored from a case checkpoint ends up with the same FSM
+state, model choice and agent contexts as the handler that saved it, both when the
+whole case is reloaded and when `context_build` truncates its oldest messages, and
+that it restores from the checkpoint instead of replaying the case. The messages are
+round-tripped through JSON, as the case storage would (also dropping `origin`, to
+stand for fields that do not survive storage), and fed as `context_build` feeds
+them, so no case storage or provider is needed; checkpoints go to a temporary
+database.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert( 0, str(Path(__file__).resolve().parent.parent))
+
+# Keep the local SQLite stores of the case handler out of the repo
+TEMP_DIR = tempfile.mkdtemp( prefix = "test_checkpoints_")
+for prefix in ( "CHECKPOINT", "IMAGE_INDEX", "USAGE") :
+    os.environ[f"{prefix}_DB_DIR"] = TEMP_DIR
+
+from wa_agents.basemodels import ( AssistantMsg,
+                                   InteractiveOption,
+                                   MediaInfo,
+                                   Message,
+                                   ServerTextMsg,
+                                   ToolCall,
+                                   UserContentMsg,
+                                   UserInteractiveReplyMsg,
+                                   WhatsAppContact,
+                                   WhatsAppMetaData )
+
+from casehandler import CaseHandler
+
+
+OPERATOR = { "display_phone_number" : "15550000000",
+             "phone_number_id"      : "000000000000000" }
+
+TRUNCATIONS = [ 0, 1, 3, 6 ]
+
+# Round trips through the case storage: fields excluded from the stored JSON
+STORAGE_EXCLUDES = { "json" : None, "json without origin" : { "origin" } }
+
+
+class CheckpointTestCaseHandler(CaseHandler) :
+    """
+    Case handler that counts the messages run through the state machine.
+    """
+    
+    def __init__( self, operator : WhatsAppMetaData, user : WhatsAppContact) -> None :
+        
+        super().__init__( operator, user)
+        self.n_replayed = 0
+        
+        return
+    
+    def ingest_message( self, message : Message) -> None :
+        
+        if not self.replay_checkpoint :
+            self.n_replayed += 1
+        
+        return super().ingest_message(message)
+
+
+def make_conversation() -> list[Message] :
+    """
+    Case through the image, match and main agents (messages are all distinct, so
+    that their fingerprints are too).
+    """
+    _orig_ = "test_checkpoints"
+    
+    return [
+        UserContentMsg( text = "Hola, tengo un problema"),
+        UserInteractiveReplyMsg( choice = InteractiveOption( id = "T40", title = "T40")),
+        UserContentMsg( text  = "Mire la pantalla",
+                        media = MediaInfo( name = "screen.jpg", mime = "image/jpeg")),
+        AssistantMsg( origin = _orig_, agent = "image", text = "Image analysis"),
+        ServerTextMsg( origin = _orig_, text = "Message catalog"),
+        AssistantMsg( origin     = _orig_,
+                      agent      = "match",
+                      tool_calls = [ ToolCall( id    = "call_0",
+                                               name  = "get_joint_diagnosis",
+                                               input = { "message_codes" : [] }) ]),
+        AssistantMsg( origin = _orig_, agent = "main", text = "Revise el motor"),
+        UserContentMsg( text = "Ya revise el motor, sigue igual"),
+    ]
+
+def stored( messages : list[Message], exclude : set[str] | None) -> list[Message] :
+    """
+    Messages as reloaded from the case storage (new objects, from their JSON).
+    """
+    return [ type(message).model_validate_json(message.model_dump_json( exclude = exclude))
+             for message in messages ]
+
+def new_handler( wa_id : str) -> CheckpointTestCaseHandler :
+    
+    operator = WhatsAppMetaData.model_validate(OPERATOR)
+    user     = WhatsAppContact.model_validate( { "profile" : { "name" : "Checkpoint Test" },
+                                                 "wa_id"   : wa_id } )
+    
+    return CheckpointTestCaseHandler( operator, user)
+
+def replay( handler  : CaseHandler,
+            messages : list[Message]) -> None :
+    """
+    Feed messages to a handler the way `CaseHandler.context_build` does.
+    """
+    handler.replay_checkpoint = handler.checkpoints.load(handler.user_id)
+    handler.replay_buffer     = []
+    for message in messages :
+        handler.ingest_message(message)
+    handler.checkpoint_restore()
+    
+    return
+
+def snapshot( handler  : CaseHandler,
+              messages : list[Message],
+              dropped  : int = 0) -> dict :
+    """
+    FSM state, model choice and agent contexts, as positions in the conversation
+    `messages` (without its first `dropped` messages).
+    """
+    position = { id(msg) : i for i, msg in enumerate(messages) }
+    def kept( context : list[Message]) -> list[int] :
+        return [ position[id(msg)] for msg in context if position[id(msg)] >= dropped ]
+    
+    return { "state"        : handler.state,
+             "model_choice" : handler.model_choice,
+             "image"        : kept(handler.image_agent_context),
+             "match"        : kept(handler.match_agent_context),
+             "main"         : kept(handler.main_agent_context) }
+
+
+def run_test( debug : bool = False) -> bool :
+    
+    all_ok = True
+    
+    cases = [ ( storage, exclude, n_dropped) for storage, exclude in STORAGE_EXCLUDES.items()
+                                             for n_dropped in TRUNCATIONS ]
+    for i, ( storage, exclude, n_dropped ) in enumerate(cases) :
+        wa_id    = f"5199{i:07d}"
+        messages = make_conversation()
+        saved    = messages[:-1]
+        
+        # Original handler ingests the case and saves its checkpoint
+        original = new_handler(wa_id)
+        for message in saved :
+            original.ingest_message(message)
+        original.checkpoint_dirty = True
+        original.checkpoint_save()
+        original.ingest_message(messages[-1])
+        
+        # New handler reloads the case from storage without its oldest messages
+        reloaded = stored( messages, exclude)
+        restored = new_handler(wa_id)
+        replay( restored, reloaded[n_dropped:])
+        
+        expected = snapshot( original, messages, n_dropped)
+        actual   = snapshot( restored, reloaded)
+        ok       = ( actual == expected ) \
+                   and ( len(restored.ingested) == len(messages) - n_dropped ) \
+                   and ( restored.n_replayed == 1 )
+        all_ok   = all_ok and ok
+        
+        status = "OK  " if ok else "FAIL"
+        print(f"[{status}] Restore after {storage} storage with {n_dropped} truncated "
+              f"messages (state: {restored.state}, replayed: {restored.n_replayed})")
+        if debug or not ok :
+            print(f"       Expected: {expected}")
+            print(f"       Actual:   {actual}")
+    
+    # Checkpoint whose last message is not in the case: full replay
+    wa_id    = "5199" + "9" * 7
+    original = new_handler(wa_id)
+    for message in make_conversation()[:-1] + [ UserContentMsg( text = "Otro caso") ] :
+        original.ingest_message(message)
+    original.checkpoint_dirty = True
+    original.checkpoint_save()
+    
+    messages = make_conversation()
+    restored = new_handler(wa_id)
+    replay( restored, messages)
+    fresh = new_handler("5199" + "8" * 7)
+    for message in messages :
+        fresh.ingest_message(message)
+    
+    ok     = ( snapshot( restored, messages) == snapshot( fresh, messages) ) \
+             and ( restored.n_replayed == len(messages) )
+    all_ok = all_ok and ok
+    
+    status = "OK  " if ok else "FAIL"
+    print(f"[{status}] Full replay when the checkpoint anchor is missing "
+          f"(state: {restored.state})")
+    
+    return all_ok
+
+
+def main() -> None :
+    
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument( "--debug",
+                         action = "store_true",
+                         help   = "Print handler snapshots" )
+    args = parser.parse_args()
+    
+    if not run_test( debug = args.debug) :
+        raise SystemExit(1)
+
+
+if __name__ == "__main__" :
+    main()
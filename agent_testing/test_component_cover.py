@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Check that `ComponentCoverIndex` returns the smallest cover of the messages, and the
+riskiest one among covers of equal size, both when solved exactly and greedily. The
+index is built from small synthetic records, so no DKB is needed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert( 0, str(Path(__file__).resolve().parent.parent))
+
+from domain_knowledge.dk_component_cover import ComponentCoverIndex
+from domain_knowledge.dk_records import ( RT_Component,
+                                          RT_Message,
+                                          RT_Signal )
+
+
+MESSAGES = [ f"m{i}" for i in range( 1, 7) ]
+
+# Name -> ( components, messages each component explains, candidate order, expected )
+CASES = {
+    # A and B (low risk) against X, Y and Z (high risk), both covering all messages
+    "fewer components beat riskier ones" : (
+        { "A" : 1, "B" : 1, "X" : 5, "Y" : 5, "Z" : 5 },
+        { "A" : [ "m1", "m2", "m3" ],
+          "B" : [ "m4", "m5", "m6" ],
+          "X" : [ "m1", "m2" ],
+          "Y" : [ "m3", "m4" ],
+          "Z" : [ "m5", "m6" ] },
+        [ "X", "Y", "Z", "A", "B" ],
+        [ "A", "B" ] ),
+    # Two covers of two components: the riskier one wins
+    "riskier components among equal sizes" : (
+        { "A" : 1, "B" : 1, "C" : 5, "D" : 5 },
+        { "A" : [ "m1", "m2", "m3" ],
+          "B" : [ "m4", "m5", "m6" ],
+          "C" : [ "m1", "m2", "m3", "m4" ],
+          "D" : [ "m5", "m6" ] },
+        [ "A", "B", "C", "D" ],
+        [ "C", "D" ] ),
+}
+
+
+def build_index( risks    : dict[ str, float],
+                 explains : dict[ str, list[str]] ) -> ComponentCoverIndex :
+    """
+    Cover index where every component has one signal (whose path is the component)
+    and every message is caused by the signals of the components that explain it.
+    """
+    dkb_comp = { comp : RT_Component( comp, float(risk)) for comp, risk in risks.items() }
+    dkb_sign = { f"s_{comp}" : RT_Signal( f"s_{comp}", ( comp,)) for comp in risks }
+    dkb_msgs = { msg_key : RT_Message( key           = msg_key,
+                                       name          = msg_key,
+                                       name_spanish  = None,
+                                       signals       = tuple( f"s_{comp}"
+                                                              for comp, msgs in explains.items()
+                                                              if msg_key in msgs ),
+                                       issues        = (),
+                                       disaggregate_ = () )
+                 for msg_key in MESSAGES }
+    
+    return ComponentCoverIndex( dkb_msgs, dkb_sign, dkb_comp)
+
+
+def run_test( debug : bool = False) -> bool :
+    
+    all_ok = True
+    
+    for name, ( risks, explains, candidates, expected ) in CASES.items() :
+        index  = build_index( risks, explains)
+        cover, exact = index.solve( MESSAGES, candidates)
+        
+        target = ComponentCoverIndex.union( index.msg_bits.values())
+        cands  = [ ( comp, index.comp_bits[comp], index.comp_cost[comp])
+                   for comp in candidates ]
+        greedy = sorted( ComponentCoverIndex.solve_greedy( target, cands),
+                         key = candidates.index)
+        
+        for solver, result, solved in ( ( "exact ", cover,  exact),
+                                        ( "greedy", greedy, True) ) :
+            ok     = ( result == expected ) and solved
+            all_ok = all_ok and ok
+            
+            status = "OK  " if ok else "FAIL"
+            print(f"[{status}] {solver} {name}: {result}")
+            if debug or not ok :
+                print(f"       Expected: {expected}  Costs: {index.comp_cost}")
+    
+    return all_ok
+
+
+def main() -> None :
+    
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument( "--debug",
+                         action = "store_true",
+                         help   = "Print component costs" )
+    args = parser.parse_args()
+    
+    if not run_test( debug = args.debug) :
+        raise SystemExit(1)
+
+
+if __name__ == "__main__" :
+    main()
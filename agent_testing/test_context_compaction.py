@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Check `compact_context` on a synthetic main agent context (user questions, tool calls
+with large structured results and answers), as it grows one message at a time: the
+verbatim window fits the token budget, the newest messages are kept verbatim, tool
+calls and results stay paired, compacted results have the expected payload, and
+compaction is sticky (a compacted result stays compacted and the history changes
+only when a chunk is compacted).
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert( 0, str(Path(__file__).resolve().parent.parent))
+
+from wa_agents.basemodels import ( AssistantMsg,
+                                   Message,
+                                   ToolCall,
+                                   ToolResult,
+                                   ToolResultsMsg,
+                                   UserContentMsg )
+
+from context_compaction import ( COMPACTION_NOTE,
+                                 compact_content,
+                                 compact_context,
+                                 estimate_tokens )
+
+
+MAX_TOKENS = 2000
+KEEP_LAST  = 4
+N_TURNS    = 12
+
+
+def make_context() -> list[Message] :
+    """
+    Turns of a user question, a tool call, its results (a joint diagnosis and an
+    error) and an answer.
+    """
+    _orig_  = "test_context_compaction"
+    context = []
+    for turn in range(N_TURNS) :
+        diagnosis = { "messages"   : [ { "key"   : f"msg_{turn}_{i}",
+                                         "name"  : f"Message {turn} {i} " * 4,
+                                         "notes" : "Check the connector. " * 6 }
+                                       for i in range(3) ],
+                      "components" : [ { "key"  : f"comp_{turn}_{i}",
+                                         "name" : f"Component {turn} {i}",
+                                         "risk" : 0.1 * i }
+                                       for i in range(4) ] }
+        context += [
+            UserContentMsg( text = f"Pregunta {turn}"),
+            AssistantMsg( origin     = _orig_,
+                          agent      = "main",
+                          tool_calls = [ ToolCall( id    = f"call_{turn}_0",
+                                                   name  = "get_joint_diagnosis",
+                                                   input = { "message_codes" : [] }),
+                                         ToolCall( id    = f"call_{turn}_1",
+                                                   name  = "get_component_data",
+                                                   input = { "component" : "x" }) ]),
+            ToolResultsMsg( origin       = _orig_,
+                            tool_results = [ ToolResult( id      = f"call_{turn}_0",
+                                                         error   = False,
+                                                         content = diagnosis),
+                                             ToolResult( id      = f"call_{turn}_1",
+                                                         error   = True,
+                                                         content = "Unknown component") ]),
+            AssistantMsg( origin = _orig_, agent = "main", text = f"Respuesta {turn}"),
+        ]
+    
+    return context
+
+def is_compacted( message : Message) -> bool :
+    
+    return isinstance( message, ToolResultsMsg) \
+           and any( isinstance( tr.content, dict) and "compacted" in tr.content
+                    for tr in message.tool_results )
+
+def check( context : list[Message], result : list[Message]) -> list[str] :
+    """
+    Failed checks of a compacted context (empty if all passed).
+    """
+    failed = []
+    
+    # Same messages, in the same order and with the same tool call and result ids
+    paired = len(result) == len(context)
+    for original, message in zip( context, result) :
+        paired = paired and ( type(message) is type(original) )
+        if isinstance( original, ToolResultsMsg) :
+            paired = paired and [ tr.id for tr in message.tool_results ] \
+                             == [ tr.id for tr in original.tool_results ]
+        elif not ( message is original ) :
+            paired = False
+    if not paired :
+        failed.append("tool calls and results paired")
+    
+    # Newest messages verbatim
+    if any( m is not o for m, o in zip( result[-KEEP_LAST:], context[-KEEP_LAST:]) ) :
+        failed.append("keep_last verbatim")
+    
+    # Compacted payloads: structured results reduced to keys, errors untouched
+    for original, message in zip( context, result) :
+        if not is_compacted(message) :
+            continue
+        for tr_orig, tr in zip( original.tool_results, message.tool_results) :
+            expected = tr_orig.content if tr_orig.error \
+                       else { "compacted" : compact_content(tr_orig.content),
+                              "note"      : COMPACTION_NOTE }
+            if tr.content != expected :
+                failed.append("compacted payload")
+                break
+    
+    # Verbatim window (from the first verbatim tool result after the last compacted
+    # one) fits the budget, unless it is within the newest messages
+    last  = max( [ i for i, m in enumerate(result) if is_compacted(m) ], default = -1)
+    first = next( ( i for i in range( last + 1, len(result))
+                    if isinstance( result[i], ToolResultsMsg) ), len(result))
+    tail  = sum( map( estimate_tokens, result[first:]) )
+    if ( tail > MAX_TOKENS ) and ( len(result) - first > KEEP_LAST ) :
+        failed.append(f"budget ({tail} > {MAX_TOKENS} tokens)")
+    
+    return failed
+
+
+def run_test( debug : bool = False) -> bool :
+    
+    all_ok   = True
+    context  = make_context()
+    previous : list[Message] = []
+    changes  = 0
+    
+    for n in range( 1, len(context) + 1) :
+        result = compact_context( context[:n], MAX_TOKENS, KEEP_LAST)
+        failed = check( context[:n], result)
+        
+        # Sticky: the previous turn's compacted results stay compacted, and the
+        # history only changes when a chunk is compacted
+        if any( is_compacted(p) and not is_compacted(r) for p, r in zip( previous, result) ) :
+            failed.append("sticky")
+        if any( p.model_dump_json() != r.model_dump_json() for p, r in zip( previous, result) ) :
+            changes += 1
+        previous = result
+        
+        all_ok = all_ok and not failed
+        if debug or failed :
+            status = "OK  " if not failed else "FAIL"
+            print(f"[{status}] {n} messages, compacted: "
+                  f"{sum( map( is_compacted, result) )} {failed or ''}")
+    
+    n_compacted = sum( map( is_compacted, previous) )
+    ok          = ( n_compacted > 0 ) and ( changes < n_compacted )
+    all_ok      = all_ok and ok
+    
+    status = "OK  " if ok else "FAIL"
+    print(f"[{status}] {len(context)} messages: {n_compacted} tool results compacted "
+          f"in {changes} history changes")
+    status = "OK  " if all_ok else "FAIL"
+    print(f"[{status}] Budget, keep_last, pairing, payload and stickiness on every prefix")
+    
+    return all_ok
+
+
+def main() -> None :
+    
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument( "--debug",
+                         action = "store_true",
+                         help   = "Print every prefix" )
+    args = parser.parse_args()
+    
+    if not run_test( debug = args.debug) :
+        raise SystemExit(1)
+
+
+if __name__ == "__main__" :
+    main()
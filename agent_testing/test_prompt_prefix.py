@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Check that match and main agent requests share a byte-identical prefix (tools and
+system prompt) across cases of the same drone model, country and language, and that
+every request ends with a user turn. Each case is driven through the real
+`CaseHandler` agent calls with the fake agent instead of a provider; the case is
+kept in memory instead of the case storage. Payloads are those rendered by the fake
+agent, not the requests `wa_agents` sends.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert( 0, str(Path(__file__).resolve().parent.parent))
+
+# Keep the local SQLite stores of the case handler out of the repo
+TEMP_DIR = tempfile.mkdtemp( prefix = "test_prompt_prefix_")
+for prefix in ( "CHECKPOINT", "IMAGE_INDEX", "USAGE") :
+    os.environ[f"{prefix}_DB_DIR"] = TEMP_DIR
+
+from wa_agents.basemodels import ( InteractiveOption,
+                                   MediaInfo,
+                                   Message,
+                                   UserContentMsg,
+                                   UserInteractiveReplyMsg,
+                                   WhatsAppContact,
+                                   WhatsAppMetaData )
+
+from casehandler import CaseHandler
+from domain_knowledge.dk_database import DomainKnowledgeDataBase
+from fake_agent import FakeAgent
+from prompt_cache import ( prefix_fingerprint,
+                           split_system )
+
+
+OPERATOR = { "display_phone_number" : "15550000000",
+             "phone_number_id"      : "000000000000000" }
+
+LANGUAGES = [ ( "Peru", "Spanish"), ( "United States", "English") ]
+N_CASES   = 3
+
+
+class PrefixTestCaseHandler(CaseHandler) :
+    """
+    Case handler with fake agents, no sender and an in-memory case.
+    """
+    
+    AGENT_CLASS = FakeAgent
+    
+    def context_update( self, message : Message) -> None :
+        return self.ingest_message(message)
+    
+    def send_text( self, message : Message) -> None :
+        return
+    
+    def send_interactive( self, message : Message) -> None :
+        return
+
+
+def run_case( drone_model : str,
+              country     : str,
+              language    : str,
+              case_index  : int,
+              codes       : list[str] ) -> dict[ str, dict] :
+    """
+    Run one case (image analysis with the given message codes) up to the main agent's
+    first response. \\
+    Returns:
+        Dict of last request payload per agent name ('match' and 'main')
+    """
+    FakeAgent.responses = {
+        "image" : { "text"       : json.dumps( { "is_screen_photo" : True,
+                                                 "screen_type"     : "HMS",
+                                                 "language"        : "es",
+                                                 "error_messages"  : codes } ) },
+        "match" : { "tool_calls" : [ { "name"  : "get_joint_diagnosis",
+                                       "input" : { "message_codes" : codes } } ] },
+        "main"  : { "text"       : f"Respuesta del caso {case_index}" },
+    }
+    
+    wa_id    = f"5198{case_index:07d}"
+    operator = WhatsAppMetaData.model_validate(OPERATOR)
+    user     = WhatsAppContact.model_validate( { "profile" : { "name" : "Prefix Test" },
+                                                 "wa_id"   : wa_id } )
+    handler  = PrefixTestCaseHandler( operator, user)
+    handler.user_data.country  = country
+    handler.user_data.language = language
+    
+    # Greeting, model choice and image
+    image = MediaInfo( name = f"case_{case_index}.jpg", mime = "image/jpeg")
+    handler.imgs_cache[image.name] = b""
+    for message in [ UserContentMsg( text = f"Hola, caso {case_index}"),
+                     UserInteractiveReplyMsg( choice = InteractiveOption( id    = drone_model,
+                                                                          title = drone_model)),
+                     UserContentMsg( text = "Mire la pantalla", media = image) ] :
+        handler.ingest_message(message)
+    
+    handler.call_image_agent()
+    handler.call_match_agent()
+    handler.call_main_agent()
+    
+    return { "match" : handler.match_agent.requests[-1],
+             "main"  : handler.main_agent.requests[-1] }
+
+
+def run_test( debug : bool = False) -> bool :
+    
+    all_ok = True
+    
+    for drone_model in DomainKnowledgeDataBase.MODELS_AVAILABLE :
+        dkdb = DomainKnowledgeDataBase()
+        dkdb.set_model(drone_model)
+        rng  = random.Random(drone_model)
+        
+        for country, language in LANGUAGES :
+            cases = [ run_case( drone_model, country, language, i,
+                                rng.sample( list(dkdb.dkb_msgs), 3))
+                      for i in range(N_CASES) ]
+            
+            for agent_name in ( "match", "main") :
+                payloads = [ case[agent_name] for case in cases ]
+                prefixes = { prefix_fingerprint(p) for p in payloads }
+                causal   = all( split_system(p)[1][-1]["role"] == "user" for p in payloads )
+                ok       = ( len(prefixes) == 1 ) and causal
+                all_ok   = all_ok and ok
+                
+                status = "OK  " if ok else "FAIL"
+                print(f"[{status}] {drone_model} {agent_name:5} {language:7} "
+                      f"prefixes: {len(prefixes)} / {N_CASES} cases, "
+                      f"ends with user turn: {causal}")
+                if debug :
+                    system, messages = split_system(payloads[0])
+                    print(f"       System blocks: {len(system)} "
+                          f"Messages: {len(messages)} Prefix: {sorted(prefixes)}")
+    
+    return all_ok
+
+
+def main() -> None :
+    
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument( "--debug",
+                         action = "store_true",
+                         help   = "Print payload details" )
+    args = parser.parse_args()
+    
+    if not run_test( debug = args.debug) :
+        raise SystemExit(1)
+
+
+if __name__ == "__main__" :
+    main()
@@ -1,13 +1,133 @@
 #!/usr/bin/env python3
+"""
+Agent Tool Schema Translator
+-----
+* Translate tool definitions from the canonical (Anthropic) format into every
+  provider format (Mistral, OpenAI and OpenRouter) in a single pass over the
+  parsed JSON.
+* Write tool schema files in the layout of the hand-written files: objects open on
+  their own line below their key, one indentation level deeper.
+* Batch mode regenerates every tool schema file in `agent_tools/` from the
+  `ToolServer` tool registry.
+"""
 
+import json
 import os
 import sys
+from pathlib import Path
+from typing import Any
 
 dir_current  = os.path.dirname(os.path.realpath(__file__))
 dir_parent   = os.path.dirname(dir_current)
 sys.path.append(dir_parent)
 
-from sofia_utils.printing import str_ind
+
+API_FORMATS  = ( "anthropic", "mistral", "openai", "openrouter")
+API_DEFAULTS = ( "anthropic", "openrouter")
+
+
+def format_json_value( key    : str | None,
+                       value  : Any,
+                       indent : int,
+                       width  : int ) -> str :
+    """
+    Format a (key, value) pair: objects open on their own line below the key, one
+    indentation level deeper.
+    """
+    pad    = " " * indent
+    prefix = pad + ( f"{json.dumps(key).ljust(width)} : " if key is not None else "" )
+    
+    if isinstance( value, dict) and value :
+        head = prefix.rstrip() + "\n" + " " * ( indent + 4 ) if key is not None else pad
+        return head + format_json_object( value, indent + 4 if key is not None else indent)
+    
+    return prefix + json.dumps( value, ensure_ascii = False)
+
+def format_json_object( obj    : dict[ str, Any],
+                        indent : int,
+                        align  : bool = True ) -> str :
+    """
+    Format a non-empty object. \\
+    If `align` then keys are aligned in groups, each group closed by a key whose value
+    is an object; else every key keeps its own width.
+    """
+    pad   = " " * indent
+    keys  = list(obj)
+    lines = []
+    
+    group = []
+    for key in keys :
+        group.append(key)
+        if ( not align ) or isinstance( obj[key], dict) or ( key == keys[-1] ) :
+            width = max( len(json.dumps(k)) for k in group )
+            lines.extend( format_json_value( k, obj[k], indent, width) for k in group )
+            group = []
+    
+    return "{\n" + ",\n".join(lines) + "\n" + pad + "}"
+
+def format_tools_json( tools : list[ dict[ str, Any]], target_api : str) -> str :
+    """
+    Format a list of tool definitions (already in the target API format).
+    """
+    # The function wrapper of Mistral and OpenRouter tools is not aligned
+    align = target_api not in ( "mistral", "openrouter")
+    
+    return "[\n" + ",\n".join( format_json_object( tool, 0, align) for tool in tools ) \
+         + "\n]\n"
+
+def translate_tool( tool : dict[ str, Any], target_api : str) -> dict[ str, Any] :
+    """
+    Translate a tool definition from Anthropic format to the target API format.
+    """
+    name         = tool["name"]
+    description  = tool["description"]
+    input_schema = tool["input_schema"]
+    
+    match target_api :
+        
+        case "anthropic" :
+            return tool
+        
+        case "openai" :
+            # Strict mode requires every property to be required
+            strict = set(input_schema.get( "required", [])) \
+                  == set(input_schema.get( "properties", {}))
+            return { "type"        : "function",
+                     "name"        : name,
+                     "description" : description,
+                     "parameters"  : input_schema,
+                     "strict"      : strict }
+        
+        case "mistral" | "openrouter" :
+            return { "type"     : "function",
+                     "function" : { "name"        : name,
+                                    "description" : description,
+                                    "parameters"  : input_schema } }
+    
+    raise ValueError(f"Invalid target_api: {target_api}")
+
+def translate_tools( tools       : list[ dict[ str, Any]],
+                     target_apis : tuple[str] | list[str] = API_FORMATS
+                   ) -> dict[ str, str] :
+    """
+    Translate tool definitions to every target API in a single pass. \\
+    Args:
+        tools       : Tool definitions (Anthropic format)
+        target_apis : Target APIs
+    Returns:
+        Dict mapping each target API to its formatted JSON file contents
+    """
+    for api in target_apis :
+        if api not in API_FORMATS :
+            raise ValueError(f"Invalid target_api: {api}")
+    
+    translated = { api : [] for api in target_apis }
+    for tool in tools :
+        for api in target_apis :
+            translated[api].append(translate_tool( tool, api))
+    
+    return { api : format_tools_json( api_tools, api)
+             for api, api_tools in translated.items() }
 
 def translate_tools_anthropic( target_api : str,
                                fname_in   : str,
@@ -23,148 +143,58 @@ def translate_tools_anthropic( target_api : str,
     if target_api not in ( 'mistral', 'openai', 'openrouter') :
         raise ValueError(f"Invalid target_api: {target_api}")
     
-    # Load input file as string to preserve formatting
     with open( fname_in, 'r') as f :
-        content = f.read()
-    
-    # Remove the outer array brackets and split into individual tool blocks
-    content = content.strip()
-    if content.startswith( '[') and content.endswith( ']') :
-        content = content[ 1 : -1].strip()
-    
-    # Split by tool blocks (looking for the pattern that starts each tool)
-    # Each tool starts with { and ends with } at the same nesting level
-    list_tools = []
-    current_tool = ""
-    brace_count = 0
-    in_tool = False
-    i = 0
-    
-    while i < len( content) :
-        char = content[ i]
-        
-        if char == '{' :
-            if not in_tool :
-                in_tool = True
-                current_tool = char
-            else :
-                current_tool += char
-            brace_count += 1
-        elif char == '}' :
-            current_tool += char
-            brace_count -= 1
-            if brace_count == 0 and in_tool :
-                list_tools.append(current_tool.strip())
-                current_tool = ""
-                in_tool = False
-        else :
-            if in_tool :
-                current_tool += char
-        
-        i += 1
-    
-    # Process each tool to convert to OpenAI format
-    list_output_str = []
-    for tool in list_tools :
-        if tool.strip() :
-            # Extract the name and description from the tool
-            # Find the name field
-            name_start = tool.find( '"name"')
-            if name_start == -1 :
-                continue
-            
-            # Find the name value
-            name_value_start = tool.find( ':', name_start) + 1
-            name_value_end = tool.find( ',', name_value_start)
-            if name_value_end == -1 :
-                name_value_end = tool.find( '\n', name_value_start)
-            name = tool[ name_value_start : name_value_end].strip().strip( '"')
-            
-            # Find the description field
-            desc_start = tool.find( '"description"')
-            if desc_start == -1 :
-                continue
-            
-            # Find the description value
-            desc_value_start = tool.find( ':', desc_start) + 1
-            desc_value_end = tool.find( ',', desc_value_start)
-            if desc_value_end == -1 :
-                desc_value_end = tool.find( '\n', desc_value_start)
-            description = tool[ desc_value_start : desc_value_end].strip().strip( '"')
-            
-            # Find the input_schema section
-            schema_start = tool.find( '"input_schema"')
-            if schema_start == -1 :
-                continue
-            
-            # Extract the entire schema object
-            schema_brace_start = tool.find( '{', schema_start)
-            schema_brace_count = 0
-            schema_end = schema_start
-            
-            for j in range( schema_brace_start, len( tool)) :
-                if tool[ j] == '{' :
-                    schema_brace_count += 1
-                elif tool[ j] == '}' :
-                    schema_brace_count -= 1
-                    if schema_brace_count == 0 :
-                        schema_end = j + 1
-                        break
-            
-            schema_content = tool[ schema_brace_start : schema_end]
-            
-            # Create the OpenAI format tool
-            if target_api == 'openai' :
-                output_str = f'''{{
-"type" : "function",
-"name" : "{name}",
-"description" : "{description}",
-"parameters"  :
-    {{
-''' + str_ind( schema_content[2:-1].rstrip(), 0, 'spaces') + f'''
-    }},
-"strict" : true
-}}'''
-            elif target_api in ( "mistral", "openrouter" ) :
-                output_str = f'''{{
-"type" : "function",
-"function" :
-    {{
-    "name"        : "{name}",
-    "description" : "{description}",
-    "parameters"  :
-        {{
-''' + str_ind( schema_content[2:-1].rstrip(), 1, 'spaces') + f'''
-        }}
-    }}
-}}'''
-            list_output_str.append(output_str)
-    
-    # Write the output
+        tools = json.load(f)
+    
     with open( fname_out, 'w') as f :
-        f.write('[\n')
-        for i, tool in enumerate(list_output_str) :
-            f.write(tool)
-            if i < len(list_output_str) - 1 :
-                f.write(',')
-            f.write('\n')
-        f.write(']\n')
+        f.write(translate_tools( tools, [ target_api ])[target_api])
+    
+    return
+
+def write_tools_from_registry( dir_out : str) -> None :
+    """
+    Batch mode: write the tool schema files of every agent from the `ToolServer` tool
+    registry, for the default APIs plus every API that already has files in `dir_out`.
+    """
+    from tool_server import ToolServer
+    
+    target_apis = list(API_DEFAULTS)
+    for path in sorted(Path(dir_out).glob("*_*.json")) :
+        api = path.stem.rsplit( "_", 1)[-1]
+        if ( api in API_FORMATS ) and ( api not in target_apis ) :
+            target_apis.append(api)
+    
+    for agent in ToolServer.tool_agents() :
+        tools      = ToolServer.tool_definitions(agent)
+        translated = translate_tools( tools, target_apis)
+        for api, content in translated.items() :
+            fname_out = os.path.join( dir_out, f"{agent}_{api}.json")
+            with open( fname_out, 'w') as f :
+                f.write(content)
+            print(f"Wrote {fname_out}")
+    
+    return
 
 
 def main() :
     """Main function to run the script from command line."""
-    import sys
+    
+    if ( len(sys.argv) == 2 ) and ( sys.argv[1] == "registry" ) :
+        write_tools_from_registry(dir_current)
+        return
     
     if len(sys.argv) != 4 :
         print("Usage: python translate_tools.py <target_API> <input_file.json> <output_file.json>")
+        print("       python translate_tools.py registry")
         print("Target API: 'mistral' | 'openai' | 'openrouter'")
         print("Example: python openai translate_tools.py agent_tools_anthropic.json agent_tools_openai.json")
+        print("Mode 'registry' writes every agent tool file from the ToolServer tool registry")
         sys.exit(1)
     
     target_api  = sys.argv[1]
     input_file  = sys.argv[2]
     output_file = sys.argv[3]
-
+    
     if not input_file.endswith(".json") :
         raise ValueError(f"Invalid input file: '{input_file}'")
     if not output_file.endswith(".json") :
@@ -3,4 +3,5 @@
 bash dk_processing.sh T40
 bash dk_processing.sh T50
 python3 parse_agent_prompts.py
+python3 agent_tools/translate_tools.py registry
 echo ""
@@ -0,0 +1,110 @@
+"""
+Case Checkpoints
+-----
+* Snapshot the CaseHandler FSM state, drone model choice and agent contexts as of
+  the last ingested message (once per turn), so that a new handler can restore
+  them instead of re-running `ingest_message` over the whole case.
+* The checkpoint is anchored on the fingerprint of its last message, which is
+  looked up wherever it appears among the reloaded messages, so it still applies
+  when `context_build` truncates the oldest messages of the case. The fingerprint
+  covers only fields that survive the case storage unchanged (message class, agent,
+  text, media name, interactive choice and tool call/result ids), not the whole
+  serialized message, whose defaults, extras and formatting may change on reload.
+* Agent contexts are stored as ages (number of messages ingested after each one,
+  up to the anchor), not as messages, because the messages themselves are already
+  persisted by the case storage and get reloaded by `context_build`.
+* If the anchor is not found (or the stored checkpoint is from an older format)
+  the handler falls back to a full replay; anchor misses are logged.
+"""
+
+import json
+from hashlib import sha1
+from pathlib import Path
+from pydantic import ( BaseModel,
+                       ValidationError )
+
+from wa_agents.basemodels import Message
+
+from sqlite_store import ( db_path_from_env,
+                           SQLiteStore )
+
+
+# Set checkpoints database path
+CHECKPOINT_DB_PATH = db_path_from_env( "CHECKPOINT", "checkpoints.sqlite3")
+
+
+def message_fingerprint( message : Message) -> str :
+    """
+    Fingerprint of the fields of a message that identify it after a round trip
+    through the case storage (see module docstring).
+    """
+    media  = getattr( message, "media", None)
+    choice = getattr( message, "choice", None)
+    fields = { "class"        : type(message).__name__,
+               "agent"        : getattr( message, "agent", None),
+               "text"         : getattr( message, "text", None),
+               "media"        : getattr( media, "name", None),
+               "choice"       : getattr( choice, "id", None),
+               "tool_calls"   : [ [ tc.id, tc.name ]
+                                  for tc in getattr( message, "tool_calls", None) or [] ],
+               "tool_results" : [ tr.id
+                                  for tr in getattr( message, "tool_results", None) or [] ] }
+    
+    return sha1(json.dumps( fields, ensure_ascii = False).encode()).hexdigest()
+
+
+class CaseCheckpoint(BaseModel) :
+    
+    fingerprint  : str
+    state        : str
+    model_choice : str | None = None
+    
+    # Agent contexts as ages: messages ingested after each one, up to the anchor
+    # (required, so that checkpoints of the older positional format do not validate)
+    image_agent_ages : list[int]
+    match_agent_ages : list[int]
+    main_agent_ages  : list[int]
+
+
+class CheckpointStore(SQLiteStore) :
+    """
+    Latest case checkpoint per user, in a local SQLite database.
+    """
+    
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            user       TEXT PRIMARY KEY,
+            checkpoint TEXT NOT NULL
+        )
+        """, )
+    
+    def __init__( self, db_path : str | Path = CHECKPOINT_DB_PATH) -> None :
+        
+        super().__init__(db_path)
+        
+        return
+    
+    def load( self, user : str) -> CaseCheckpoint | None :
+        
+        with self.connect() as conn :
+            row = conn.execute( "SELECT checkpoint FROM checkpoints WHERE user = ?",
+                                ( user,) ).fetchone()
+        
+        if not row :
+            return None
+        
+        # Checkpoints saved in an older format are ignored (full replay instead)
+        try :
+            return CaseCheckpoint.model_validate_json(row[0])
+        except ValidationError :
+            return None
+    
+    def save( self, user : str, checkpoint : CaseCheckpoint) -> None :
+        
+        with self.connect() as conn :
+            conn.execute( "INSERT OR REPLACE INTO checkpoints ( user, checkpoint) "
+                          "VALUES ( ?, ?)",
+                          ( user, checkpoint.model_dump_json()) )
+        
+        return
@@ -10,6 +10,7 @@ Case Handler
 """
 
 from inspect import currentframe
+from pydantic import ValidationError
 
 from sofia_utils.io import load_json_file
 from sofia_utils.printing import (
@@ -25,8 +26,18 @@ from wa_agents.case_handler_base import (
 )
 from wa_agents.whatsapp_functions import markdown_to_whatsapp
 
+from case_checkpoints import ( CaseCheckpoint,
+                               CheckpointStore,
+                               message_fingerprint )
+from context_compaction import ( compact_context,
+                                 estimate_tokens )
 from domain_knowledge.dk_basemodels import RCImageAnalysis
+from domain_knowledge.dk_database import DomainKnowledgeDataBase
+from image_index import ( compute_dhash,
+                          ImageIndex )
+from metrics import METRICS
 from tool_server import ToolServer
+from usage_ledger import UsageLedger
 
 
 class CaseHandler(CaseHandlerBase) :
@@ -41,6 +52,22 @@ class CaseHandler(CaseHandlerBase) :
                            "qwen/qwen2.5-vl-32b-instruct:free",
                            "mistralai/pixtral-12b" ]
     
+    # Token budget for verbatim messages in the main agent context
+    MAIN_AGENT_CONTEXT_TOKENS = 12000
+    
+    # Agent class (can be replaced, e.g., by a fake provider for testing)
+    AGENT_CLASS = Agent
+    
+    # Agent called by each manually-dispatched action (for metrics labels)
+    ACTION_AGENTS = { "call_image_agent" : "image",
+                      "call_match_agent" : "match",
+                      "call_main_agent"  : "main" }
+    
+    # System message files, loaded once per process (see `load_system_message`)
+    SYSTEM_MESSAGE_FILES = ( "agent_updates.json", "ask_for_image.json",
+                             "ask_for_model.json", "unsupported.json" )
+    SYSTEM_MESSAGES : dict[ str, dict] = {}
+    
     # =====================================================================================
     # STATE MACHINE DEFINITION, CONSTRUCTOR AND RESET METHOD
     # =====================================================================================
@@ -157,6 +184,9 @@ class CaseHandler(CaseHandlerBase) :
         
         super().__init__( operator, user, debug)
         
+        # User identifier (for per-user caches)
+        self.user_id : str = user.wa_id
+        
         # Drone model choice
         self.model_choice : str | None = None
         
@@ -172,13 +202,30 @@ class CaseHandler(CaseHandlerBase) :
         
         # Images cache (for image agent)
         self.imgs_cache : dict[ str, bytes] = {}
+        # Perceptual-hash index of previously analysed images
+        self.image_index = ImageIndex()
+        
+        # Ingested messages and their positions (for checkpoints)
+        self.ingested   : list[Message]  = []
+        self.ingest_pos : dict[ int, int] = {}
+        # Checkpoint store, checkpoint being restored (during context build) and
+        # whether messages were ingested since the last checkpoint save
+        self.checkpoints       = CheckpointStore()
+        self.replay_checkpoint : CaseCheckpoint | None = None
+        self.replay_buffer     : list[Message]         = []
+        self.checkpoint_dirty  : bool                  = False
         
         # Initialize state machine from method `define_state_machine_config`
         self.init_machine()
+        # State of the action being dispatched (for metrics labels)
+        self.action_state : str | None = None
         
         # Tool server
         self.tool_server = ToolServer(debug)
         
+        # Token usage ledger
+        self.usage_ledger = UsageLedger()
+        
         return
     
     def reset_state_machine(self) -> None :
@@ -188,6 +235,8 @@ class CaseHandler(CaseHandlerBase) :
         self.image_agent_context.clear()
         self.match_agent_context.clear()
         self.main_agent_context.clear()
+        self.ingested.clear()
+        self.ingest_pos.clear()
         
         return
     
@@ -199,12 +248,18 @@ class CaseHandler(CaseHandlerBase) :
         """
         Build context. \\
         Overloads method `CaseHandlerBase.context_build` by calling the original method and then initializing the Domain Knowledge Database (DKDB). \\
+        If a checkpoint is available then messages up to the checkpoint are not replayed through the state machine (see `checkpoint_restore`). \\
         Args:
             truncate: Whether or not to enforce the max content length
         """
         
+        self.replay_checkpoint = self.checkpoints.load(self.user_id)
+        self.replay_buffer     = []
+        
         super().context_build(truncate)
         
+        self.checkpoint_restore()
+        
         # Initialize DKDB
         if (
         self.case_manifest and self.case_manifest.model
@@ -214,6 +269,20 @@ class CaseHandler(CaseHandlerBase) :
         
         return
     
+    def context_update( self, message : Message) -> None :
+        """
+        Update context. \\
+        Overloads method `CaseHandlerBase.context_update` by calling the original method and then flagging the checkpoint as outdated (it is saved once per turn, see `checkpoint_save`). \\
+        Args:
+            message : Instance of a subclass of Message
+        """
+        
+        super().context_update(message)
+        
+        self.checkpoint_dirty = True
+        
+        return
+    
     def ingest_message( self, message : Message) -> None :
         """
         Ingest a single message and fire corresponding triggers \\
@@ -222,6 +291,14 @@ class CaseHandler(CaseHandlerBase) :
             message : Instance of a subclass of Message
         """
         
+        # If restoring from a checkpoint then buffer message instead
+        if self.replay_checkpoint :
+            return self.replay_buffer.append(message)
+        
+        # Record message position in ingestion sequence
+        self.ingest_pos[id(message)] = len(self.ingested)
+        self.ingested.append(message)
+        
         # ---------------------------------------------------------------------------------
         # BEFORE TRANSITION
         
@@ -279,6 +356,88 @@ class CaseHandler(CaseHandlerBase) :
         
         return
     
+    # =====================================================================================
+    # CHECKPOINTS
+    # =====================================================================================
+    
+    def checkpoint_save(self) -> None :
+        """
+        Save FSM state, model choice and agent contexts as of the last ingested message,
+        if any message was ingested since the last save.
+        """
+        if not ( self.checkpoint_dirty and self.ingested ) :
+            return
+        
+        last = len(self.ingested) - 1
+        def ages( context : list[Message]) -> list[int] :
+            return [ last - self.ingest_pos[id(msg)] for msg in context ]
+        
+        checkpoint = CaseCheckpoint(
+            fingerprint      = message_fingerprint(self.ingested[-1]),
+            state            = self.state,
+            model_choice     = self.model_choice,
+            image_agent_ages = ages(self.image_agent_context),
+            match_agent_ages = ages(self.match_agent_context),
+            main_agent_ages  = ages(self.main_agent_context),
+        )
+        self.checkpoints.save( self.user_id, checkpoint)
+        self.checkpoint_dirty = False
+        
+        return
+    
+    def checkpoint_restore(self) -> None :
+        """
+        Restore from the checkpoint the messages buffered during context build. \\
+        The checkpoint's last message is looked up from the end of the buffer (so that
+        it is found even if the oldest messages were truncated); messages up to it are
+        restored from the checkpoint and later messages are ingested normally. Agent
+        context messages that were truncated away are dropped. If the checkpoint's last
+        message is not found then all buffered messages are ingested (and the miss is
+        logged).
+        """
+        checkpoint = self.replay_checkpoint
+        buffer     = self.replay_buffer
+        self.replay_checkpoint = None
+        self.replay_buffer     = []
+        
+        anchor = None
+        if checkpoint :
+            for i in range( len(buffer) - 1, -1, -1) :
+                if message_fingerprint(buffer[i]) == checkpoint.fingerprint :
+                    anchor = i
+                    break
+        
+        if anchor is None :
+            if checkpoint :
+                print_ind( f"⚠️ Checkpoint anchor of user {self.user_id} not found: "
+                           f"full replay of {len(buffer)} messages", 1)
+            for message in buffer :
+                self.ingest_message(message)
+            return
+        
+        self.ingested   = buffer[ : anchor + 1 ]
+        self.ingest_pos = { id(msg) : i for i, msg in enumerate(self.ingested) }
+        
+        def messages( ages : list[int]) -> list[Message] :
+            return [ self.ingested[ anchor - age ] for age in ages if age <= anchor ]
+        
+        self.state               = checkpoint.state
+        self.model_choice        = checkpoint.model_choice
+        self.image_agent_context = messages(checkpoint.image_agent_ages)
+        self.match_agent_context = messages(checkpoint.match_agent_ages)
+        self.main_agent_context  = messages(checkpoint.main_agent_ages)
+        
+        if self.debug :
+            print_sep()
+            print("State Machine Restored From Checkpoint")
+            print_ind( f"[>] Messages skipped: {anchor + 1}", 1)
+            print_ind( f"[>] State: {self.state}", 1)
+        
+        for message in buffer[ anchor + 1 : ] :
+            self.ingest_message(message)
+        
+        return
+    
     # =====================================================================================
     # ON ENTER AND ON EXIT METHODS
     # =====================================================================================
@@ -299,7 +458,7 @@ class CaseHandler(CaseHandlerBase) :
             if not self.case_manifest.model :
                 self.case_manifest.model = self.model_choice
                 self.storage.manifest_write(self.case_manifest)
-        
+            
             if not self.tool_server.dkdb.model :
                     self.tool_server.dkdb.set_model(self.model_choice)
         
@@ -338,11 +497,15 @@ class CaseHandler(CaseHandlerBase) :
             self.send_text(msg_reply)
             # Write reply message to storage and update manifest
             self.context_update(msg_reply)
+            self.checkpoint_save()
             
             # Signal need to wait for user's reply
             return False
         
-        # Signal need to generate a response
+        # Signal need to generate a response (else save the turn's checkpoint)
+        if not msg :
+            self.checkpoint_save()
+        
         return True if msg else False
     
     # =====================================================================================
@@ -352,33 +515,45 @@ class CaseHandler(CaseHandlerBase) :
     def generate_response( self,
                            max_tokens : int | None = None ) -> bool :
         
+        # Export metrics of earlier responses (at most once per flush period)
+        METRICS.flush()
+        
         # If necessary then build context
         if not self.case_context :
             self.context_build()
         
-        # Retrieve manually-dispatched actions from current state
-        state   = self.machine.get_state(self.state)
-        actions = getattr( state, "while_in", [] )
-        
-        for action in actions :
-            
-            if action == "ask_for_model_having_nothing" :
-                return self.ask_user_for("model_having_nothing")
-            
-            elif action == "ask_for_model_having_image" :
-                return self.ask_user_for("model_having_image")
+        # Save the turn's checkpoint once the action is done
+        try :
+            # Retrieve manually-dispatched actions from current state
+            state   = self.machine.get_state(self.state)
+            actions = getattr( state, "while_in", [] )
             
-            elif action == "ask_for_image" :
-                return self.ask_user_for("image")
-            
-            elif action == "call_image_agent" :
-                return self.call_image_agent(max_tokens)
-            
-            elif action == "call_match_agent" :
-                return self.call_match_agent(max_tokens)
-            
-            elif action == "call_main_agent" :
-                return self.call_main_agent(max_tokens)
+            for action in actions :
+                
+                # Time the action (and its phases) tagged with the state it was dispatched
+                # from, since the state may change during the action
+                self.action_state = self.state
+                with self.span( action, self.ACTION_AGENTS.get(action)) :
+                    
+                    if action == "ask_for_model_having_nothing" :
+                        return self.ask_user_for("model_having_nothing")
+                    
+                    elif action == "ask_for_model_having_image" :
+                        return self.ask_user_for("model_having_image")
+                    
+                    elif action == "ask_for_image" :
+                        return self.ask_user_for("image")
+                    
+                    elif action == "call_image_agent" :
+                        return self.call_image_agent(max_tokens)
+                    
+                    elif action == "call_match_agent" :
+                        return self.call_match_agent(max_tokens)
+                    
+                    elif action == "call_main_agent" :
+                        return self.call_main_agent(max_tokens)
+        finally :
+            self.checkpoint_save()
         
         return False
     
@@ -443,7 +618,7 @@ class CaseHandler(CaseHandlerBase) :
     
     def setup_image_agent(self) -> None :
         
-        self.image_agent = Agent( "image", self.IMAGE_AGENT_MODELS)
+        self.image_agent = self.AGENT_CLASS( "image", self.IMAGE_AGENT_MODELS)
         
         drone_model = self.tool_server.dkdb.model
         self.image_agent.load_prompts([f"agent_prompts/image_{drone_model}.md"])
@@ -469,24 +644,41 @@ class CaseHandler(CaseHandlerBase) :
         # Prepare image analysis agent context
         image_agent_context = self.image_agent_context
         # Prepare images cache
-        for msg_with_image in image_agent_context :
-            image_filename = msg_with_image.media.name
-            if image_filename not in self.imgs_cache :
-                image_content = self.storage.media_get(image_filename)
-                self.imgs_cache[image_filename] = image_content
-        
-        # Generate response
-        message = self.image_agent.get_response( context    = image_agent_context,
-                                                 origin     = f"{_orig_}/stage-1",
-                                                 load_imgs  = True,
-                                                 imgs_cache = self.imgs_cache,
-                                                 output_st  = RCImageAnalysis,
-                                                 max_tokens = max_tokens,
-                                                 debug      = self.debug )
-        
-        # If the agent did not respond then simply return False
-        if not message or message.is_empty() :
-           return False
+        with self.span( "call_image_agent/image_fetch", "image") :
+            for msg_with_image in image_agent_context :
+                image_filename = msg_with_image.media.name
+                if image_filename not in self.imgs_cache :
+                    image_content = self.storage.media_get(image_filename)
+                    self.imgs_cache[image_filename] = image_content
+        
+        # Reuse the analysis of an earlier near-identical image, if any
+        image_hash = self.get_image_hash(image_agent_context)
+        message    = self.reuse_image_analysis( image_hash, f"{_orig_}/stage-1")
+        
+        # Else generate response
+        if not message :
+            with self.span( "call_image_agent/stage-1", "image") :
+                message = self.image_agent.get_response( context    = image_agent_context,
+                                                         origin     = f"{_orig_}/stage-1",
+                                                         load_imgs  = True,
+                                                         imgs_cache = self.imgs_cache,
+                                                         output_st  = RCImageAnalysis,
+                                                         max_tokens = max_tokens,
+                                                         debug      = self.debug )
+            
+            # If the agent did not respond then simply return False
+            if not message or message.is_empty() :
+               return False
+            
+            # Record token usage
+            self.record_usage( "image", image_agent_context, message)
+            
+            # Index image analysis for future resends
+            if image_hash is not None :
+                self.image_index.insert( self.user_id,
+                                         self.tool_server.dkdb.model,
+                                         image_hash,
+                                         message.model_dump_json() )
         
         # DEBUG: Print message
         message.print()
@@ -498,8 +690,13 @@ class CaseHandler(CaseHandlerBase) :
         # ---------------------------------------------------------------------------------
         # PHASE 2: INJECT MESSAGE FOR MATCH AGENT
         
-        # Retrive data from Domain Knowledge Database
-        data_str = self.tool_server.dkdb.list_messages()
+        # Retrive data from Domain Knowledge Database (catalog in the screen language,
+        # restricted to the partitions of the error messages on screen). The catalog
+        # is per-case content, so it follows the image analysis in the match agent
+        # context instead of extending the stable prefix (see `get_agent_prompts`)
+        with self.span("call_image_agent/stage-2") :
+            language, partitions = self.get_catalog_options(message)
+            data_str = self.tool_server.dkdb.list_messages( language, partitions)
         # Construct message
         msg_with_data = ServerTextMsg( origin = f"{_orig_}/stage-2",
                                        text   = data_str )
@@ -517,21 +714,86 @@ class CaseHandler(CaseHandlerBase) :
         # Signal need for another response
         return True
     
+    def get_catalog_options( self,
+                             message : AssistantMsg,
+                           ) -> tuple[ str | None, list[str] | None] :
+        """
+        Message catalog options from the image analysis: catalog language ('english'
+        or 'spanish') of the screen language, and catalog partitions routed from the
+        screen type and error messages. \\
+        Each option is None (both languages, all partitions) if it cannot be
+        determined, e.g., if the image analysis cannot be parsed.
+        """
+        try :
+            analysis = RCImageAnalysis.model_validate_json(message.text or "")
+        except ValidationError :
+            return None, None
+        
+        dkdb = self.tool_server.dkdb
+        
+        return ( dkdb.catalog_language(analysis.language),
+                 dkdb.route_partitions( analysis.screen_type, analysis.error_messages) )
+    
+    def get_image_hash( self, image_agent_context : list[Message]) -> int | None :
+        """
+        Perceptual hash of the image to be analysed. \\
+        Only computed when the context holds exactly one image, since the analysis of
+        several images at once cannot be attributed to any single one of them.
+        """
+        if len(image_agent_context) != 1 :
+            return None
+        
+        image_filename = image_agent_context[0].media.name
+        image_content  = self.imgs_cache.get(image_filename)
+        
+        return compute_dhash(image_content) if image_content else None
+    
+    def reuse_image_analysis( self,
+                              image_hash : int | None,
+                              origin     : str ) -> AssistantMsg | None :
+        """
+        Look up an earlier analysis of a near-identical image by the same user for the
+        same drone model. On a hit, log it as a server message and return a copy of the
+        earlier image agent response; else return None.
+        """
+        if image_hash is None :
+            return None
+        
+        hit = self.image_index.lookup( self.user_id,
+                                       self.tool_server.dkdb.model,
+                                       image_hash )
+        if not hit :
+            return None
+        
+        response, distance = hit
+        message = AssistantMsg.model_validate_json(response)
+        message = message.model_copy( update = { "origin" : origin } )
+        if message.is_empty() :
+            return None
+        
+        # Log cache hit
+        msg_log = ServerTextMsg( origin = f"{origin}/cache-hit",
+                                 text   = f"Reused image analysis of an earlier image "
+                                          f"(Hamming distance {distance})" )
+        msg_log.print()
+        # DEBUG: Send message to human
+        self.send_text(msg_log) if self.debug else None
+        # Write message to storage and update manifest
+        self.context_update(msg_log)
+        
+        return message
+    
     # =====================================================================================
     # SETUP AND CALL MATCH AGENT
     # =====================================================================================
     
     def setup_match_agent(self) -> None :
         
-        self.match_agent = Agent( "match", self.MAIN_AGENT_MODELS)
+        self.match_agent = self.AGENT_CLASS( "match", self.MAIN_AGENT_MODELS)
         
-        match_ag_prompts = [ { "path"    : "agent_prompts/match.md",
-                               "replace" : {} },
-                             { "path"    : "agent_prompts/user_profile.md",
-                               "replace" : { "{COUNTRY}"  : self.user_data.country,
-                                             "{LANGUAGE}" : self.user_data.language } },
-                             { "path"    : "agent_prompts/spanish.md",
-                               "replace" : {} } ]
+        match_ag_prompts = self.get_agent_prompts( "agent_prompts/match.md",
+                                                   self.user_data.country,
+                                                   self.user_data.language )
         match_ag_tools   = [ f"agent_tools/match_{self.match_agent.api}.json" ]
         
         self.match_agent.load_prompts(match_ag_prompts)
@@ -560,15 +822,19 @@ class CaseHandler(CaseHandlerBase) :
         match_agent_context = self.match_agent_context
         
         # Generate response
-        message = self.match_agent.get_response( context    = match_agent_context,
-                                                 origin     = f"{_orig_}/stage-1",
-                                                 max_tokens = max_tokens,
-                                                 debug      = self.debug )
+        with self.span( "call_match_agent/stage-1", "match") :
+            message = self.match_agent.get_response( context    = match_agent_context,
+                                                     origin     = f"{_orig_}/stage-1",
+                                                     max_tokens = max_tokens,
+                                                     debug      = self.debug )
         
         # If the agent did not respond then simply return False
         if not message or message.is_empty() :
            return False
         
+        # Record token usage
+        self.record_usage( "match", match_agent_context, message)
+        
         # DEBUG: Print message
         message.print()
         # If message contains text or debug mode is on then send message to human
@@ -584,7 +850,8 @@ class CaseHandler(CaseHandlerBase) :
         # ---------------------------------------------------------------------------------
         # STAGE 2: PROCESS TOOL CALLS, WRITE RESULTS TO CONTEXT, AND RETURN TRUE.
         
-        tool_results = self.tool_server.process(message.tool_calls)
+        with self.span( "call_match_agent/stage-2", "match") :
+            tool_results = self.tool_server.process(message.tool_calls)
         if tool_results :
             # Construct message
             message = ToolResultsMsg( origin       = f"{_orig_}/stage-2",
@@ -609,16 +876,12 @@ class CaseHandler(CaseHandlerBase) :
     
     def setup_main_agent(self) -> None :
         
-        self.main_agent = Agent( "main", self.MAIN_AGENT_MODELS)
+        self.main_agent = self.AGENT_CLASS( "main", self.MAIN_AGENT_MODELS)
         
         drone_model     = self.tool_server.dkdb.model
-        main_ag_prompts = [ { "path"    : f"agent_prompts/main_{drone_model}.md",
-                              "replace" : {} },
-                            { "path"    : "agent_prompts/user_profile.md",
-                              "replace" : { "{COUNTRY}"  : self.user_data.country,
-                                            "{LANGUAGE}" : self.user_data.language } },
-                            { "path"    : "agent_prompts/spanish.md",
-                              "replace" : {} } ]
+        main_ag_prompts = self.get_agent_prompts( f"agent_prompts/main_{drone_model}.md",
+                                                  self.user_data.country,
+                                                  self.user_data.language )
         main_ag_tools   = [ f"agent_tools/main_{self.main_agent.api}.json" ]
         
         self.main_agent.load_prompts(main_ag_prompts)
@@ -649,19 +912,31 @@ class CaseHandler(CaseHandlerBase) :
         if not self.main_agent :
             self.setup_main_agent()
         
-        # Prepare main agent context
-        main_agent_context = self.main_agent_context
+        # Prepare main agent context (older tool results compacted to fit budget)
+        main_agent_context = compact_context( self.main_agent_context,
+                                              self.MAIN_AGENT_CONTEXT_TOKENS )
+        
+        if self.debug :
+            tokens_full    = sum( map( estimate_tokens, self.main_agent_context) )
+            tokens_compact = sum( map( estimate_tokens, main_agent_context) )
+            print_sep()
+            print("Main Agent Context Compaction")
+            print_ind( f"[>] Estimated tokens: {tokens_full} -> {tokens_compact}", 1)
         
         # Generate main agent response
-        message = self.main_agent.get_response( context    = main_agent_context,
-                                                origin     = f"{_orig_}/stage-1",
-                                                max_tokens = max_tokens,
-                                                debug      = self.debug )
+        with self.span( "call_main_agent/stage-1", "main") :
+            message = self.main_agent.get_response( context    = main_agent_context,
+                                                    origin     = f"{_orig_}/stage-1",
+                                                    max_tokens = max_tokens,
+                                                    debug      = self.debug )
         
         # If the agent did not respond then simply return False
         if not message or message.is_empty() :
            return False
         
+        # Record token usage
+        self.record_usage( "main", main_agent_context, message)
+        
         # DEBUG: Print message
         message.print()
         # Send message to user
@@ -681,7 +956,8 @@ class CaseHandler(CaseHandlerBase) :
             if tc.name == "mark_as_resolved" :
                 self.case_mark_as_resolved()
         # Process low level tool calls
-        tool_results = self.tool_server.process(message.tool_calls)
+        with self.span( "call_main_agent/stage-2", "main") :
+            tool_results = self.tool_server.process(message.tool_calls)
         
         # Process tool results
         if tool_results :
@@ -701,9 +977,98 @@ class CaseHandler(CaseHandlerBase) :
     # OTHER HELPERS
     # =====================================================================================
     
+    def span( self, name : str, agent : str | None = None) :
+        """
+        Metrics span tagged with the FSM state of the action being dispatched (else
+        the current state) and the drone model (see module `metrics`).
+        """
+        return METRICS.span( name,
+                             state = self.action_state or self.state,
+                             model = self.tool_server.dkdb.model,
+                             agent = agent )
+    
+    def record_usage( self,
+                      agent   : str,
+                      context : list[Message],
+                      message : AssistantMsg ) -> None :
+        """
+        Record the token usage of an agent call, tagged with the user, case, agent role
+        and the model that answered ('unknown' if the response does not name it, since
+        any model of the fallback list may have answered). See module `usage_ledger`.
+        """
+        model = getattr( message, "model", None) or "unknown"
+        self.usage_ledger.record( self.user_id,
+                                  getattr( self.case_manifest, "case_id", None),
+                                  agent,
+                                  model,
+                                  context,
+                                  message )
+        
+        return
+    
+    def send_text( self, message : Message) -> None :
+        """
+        Send a text message. \\
+        Overloads method `CaseHandlerBase.send_text` by timing the original method.
+        """
+        with self.span("send_text") :
+            return super().send_text(message)
+    
+    def send_interactive( self, message : ServerInteractiveOptsMsg) -> None :
+        """
+        Send an interactive message. \\
+        Overloads method `CaseHandlerBase.send_interactive` by timing the original method.
+        """
+        with self.span("send_interactive") :
+            return super().send_interactive(message)
+    
+    @classmethod
+    def get_agent_prompts( cls,
+                           prompt_path : str,
+                           country     : str,
+                           language    : str ) -> list[ dict[ str, str | dict]] :
+        """
+        Prompt files of the match and main agents. \\
+        Static prompts come first and the user profile last, so that the rendered system
+        prompt is byte-identical for every case of the same drone model, country and
+        language (checked offline by `agent_testing/test_prompt_prefix.py`).
+        """
+        return [ { "path"    : prompt_path,
+                   "replace" : {} },
+                 { "path"    : "agent_prompts/spanish.md",
+                   "replace" : {} },
+                 { "path"    : "agent_prompts/user_profile.md",
+                   "replace" : { "{COUNTRY}"  : country,
+                                 "{LANGUAGE}" : language } } ]
+    
+    @classmethod
+    def preload(cls) -> None :
+        """
+        Load what every case handler of the process shares: the domain knowledge of
+        every drone model (with its message catalogs, materialized joint diagnoses and
+        matchers) and the system message files. Meant to run once before forking
+        worker processes (see `run_queue_worker`), which then share it.
+        """
+        for model in DomainKnowledgeDataBase.MODELS_AVAILABLE :
+            dkdb = DomainKnowledgeDataBase()
+            dkdb.set_model(model)
+            dkdb.preload()
+        for json_file in cls.SYSTEM_MESSAGE_FILES :
+            cls.get_system_messages(json_file)
+        
+        return
+    
+    @classmethod
+    def get_system_messages( cls, json_file : str) -> dict[ str, dict] :
+        
+        if json_file not in cls.SYSTEM_MESSAGES :
+            cls.SYSTEM_MESSAGES[json_file] = load_json_file(f"agent_prompts/{json_file}")
+        
+        return cls.SYSTEM_MESSAGES[json_file]
+    
     def load_system_message( self, json_file : str) -> dict[ str, str] :
         
-        file_dict : dict = load_json_file(f"agent_prompts/{json_file}")
+        file_dict : dict = self.get_system_messages(json_file)
         data_dict : dict = file_dict.get(self.user_data.code_lan)
         if not data_dict :
             data_dict = file_dict.get("en")
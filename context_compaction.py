@@ -0,0 +1,102 @@
+"""
+Context Compaction
+-----
+* Estimate the token size of each message in an agent context.
+* Keep the newest messages verbatim up to a token budget.
+* Replace the content of older tool results with compact references (the keys
+  of the messages, components and issues they contain), which the agent can
+  re-expand through the DKDB tools if needed.
+* Compaction is sticky and done in chunks: whether a message is compacted depends
+  only on the messages up to the point where the budget was exceeded, so a
+  compacted result stays compacted as the context grows, and the request history
+  changes only when a chunk is compacted (not on every turn).
+"""
+
+from typing import Any
+
+from wa_agents.basemodels import ( Message,
+                                   ToolResultsMsg )
+
+
+CHARS_PER_TOKEN = 4
+
+# Fraction of the token budget left verbatim after compacting a chunk
+COMPACTION_LOW_WATER = 0.5
+
+COMPACTION_NOTE = "Older tool result compacted to keys only. " \
+                  "Use tools 'get_component_data' and 'get_issue_data' " \
+                  "to re-expand them if needed."
+
+
+def estimate_tokens( message : Message) -> int :
+    """
+    Rough token count of a message, from the length of its JSON serialization.
+    """
+    return len(message.model_dump_json()) // CHARS_PER_TOKEN + 1
+
+def compact_content( content : Any) -> Any :
+    """
+    Reduce tool result content to keys: every object with a `key` field becomes its
+    key, lists are compacted item by item and other objects keep only their nested
+    lists and objects. Strings (e.g., error messages) and scalars are left as-is.
+    """
+    if isinstance( content, dict) :
+        if "key" in content :
+            return content["key"]
+        return { field : compact_content(value) for field, value in content.items()
+                 if isinstance( value, ( dict, list)) }
+    
+    if isinstance( content, list) :
+        return [ compact_content(item) for item in content ]
+    
+    return content
+
+def compact_tool_results( message : ToolResultsMsg) -> ToolResultsMsg :
+    """
+    Copy of a tool results message with every successful structured result compacted.
+    """
+    tool_results = []
+    for tr in message.tool_results :
+        if ( not tr.error ) and isinstance( tr.content, ( dict, list)) :
+            content = { "compacted" : compact_content(tr.content),
+                        "note"      : COMPACTION_NOTE }
+            tr = tr.model_copy( update = { "content" : content } )
+        tool_results.append(tr)
+    
+    return message.model_copy( update = { "tool_results" : tool_results } )
+
+def compact_context( context    : list[Message],
+                     max_tokens : int,
+                     keep_last  : int = 4 ) -> list[Message] :
+    """
+    Compact an agent context to (approximately) fit a token budget. \\
+    Walking from the oldest message forwards, as if the context grew one message at
+    a time, messages join a verbatim window. Whenever the window exceeds
+    `max_tokens`, its oldest messages leave it until it fits `COMPACTION_LOW_WATER`
+    of the budget, except the newest `keep_last` messages at that point. Tool results
+    that left the window are compacted; all other messages are kept as they are, so
+    tool calls and tool results stay paired. \\
+    Since the window only moves forward, a context that grows by appending messages
+    keeps its compacted results, and its history only changes when the window moves. \\
+    Args:
+        context    : Agent context, oldest message first
+        max_tokens : Token budget for verbatim messages
+        keep_last  : Number of newest messages always kept verbatim
+    Returns:
+        New list of messages (the original messages are not modified)
+    """
+    tokens = [ estimate_tokens(message) for message in context ]
+    start  = 0   # First message of the verbatim window
+    total  = 0   # Tokens of the verbatim window
+    
+    for n in range(len(context)) :
+        total += tokens[n]
+        if total > max_tokens :
+            while ( start <= n - keep_last ) \
+            and ( total > max_tokens * COMPACTION_LOW_WATER ) :
+                total -= tokens[start]
+                start += 1
+    
+    return [ compact_tool_results(message)
+             if ( i < start ) and isinstance( message, ToolResultsMsg) else message
+             for i, message in enumerate(context) ]
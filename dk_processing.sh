@@ -27,4 +27,9 @@ echo ""
 # DKB: Parse components graph and run checkers
 python3 -m domain_knowledge.dkb_parse_graph $DIR_OUTPUT
 echo ""
+python3 -m domain_knowledge.dkb_parse_messages $DIR_OUTPUT
+echo ""
 python3 -m domain_knowledge.dkb_checkers $DIR_OUTPUT --everything
+echo ""
+# DKB: Materialize joint diagnoses (last, fingerprints every other DKB file)
+python3 -m domain_knowledge.dkb_build_jd_table $MODEL
@@ -153,6 +153,8 @@ class DKB_MessageEntry(BaseModel) :
     disaggregate : list[NE_str]          | None = Field( serialization_alias =
                                                          "disaggregated_into_messages",
                                                          default             = None )
+    # Transitive closure of 'disaggregate' (see `dkb_parse_messages`)
+    disaggregate_ : list[NE_str]         | None = None
     
     notes        : list[NoteData] | None = None
     more_info    : MoreInfo       | None = None
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Domain Knowledge Database Benchmark
+-----
+* Time the main `DomainKnowledgeDataBase` operations for both drone models: model
+  load, `get_match` (exact and fuzzy), `list_messages`, `get_components` and
+  `get_joint_diagnosis` (verbose and compact) over code sets of 1, 5, 20 and 100
+  codes, and measure the peak allocation of each operation with `tracemalloc`.
+* Compare outputs against golden files (committed with the repo), so that
+  performance changes can be checked to leave results untouched.
+* Compare timings and allocations against a stored baseline (local to the machine,
+  not committed) and report regressions beyond a tolerance.
+* Report the memory held by the loaded topics of each model, as pydantic models
+  (what the database used to keep) and as runtime records (see `dk_records`): growth
+  of the resident size of a fresh process, and bytes retained per `tracemalloc`.
+
+Usage:
+    python3 -m domain_knowledge.dk_benchmark                     # Run and compare
+    python3 -m domain_knowledge.dk_benchmark --update-golden     # Store outputs
+    python3 -m domain_knowledge.dk_benchmark --update-baseline   # Store timings
+    python3 -m domain_knowledge.dk_benchmark --memory            # Memory report
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from statistics import median
+from typing import ( Any,
+                     Callable )
+
+from .dk_basemodels import ( load_dka_components,
+                             load_dka_issues,
+                             load_dka_messages,
+                             load_dka_signals,
+                             load_dkb_components,
+                             load_dkb_issues,
+                             load_dkb_messages,
+                             load_dkb_signals )
+from .dk_catalog_router import PARTITION_PREFIX
+from .dk_database import DomainKnowledgeDataBase
+from .dk_records import build_records
+
+
+CODE_SET_SIZES = ( 1, 5, 20, 100 )
+REPRESENTATIONS = ( "pydantic", "records" )
+SEED           = 0
+BENCH_DIR      = Path(__file__).resolve().parent / "benchmarks"
+
+# Absolute increases below these floors are timer/allocator noise, not regressions
+MIN_DELTA = { "us" : 5.0, "peak" : 1024 }
+
+
+def make_code_sets( keys : list[str], sizes : tuple[int] = CODE_SET_SIZES
+                  ) -> dict[ int, list[str]] :
+    """
+    Deterministic code sets (sampled with a fixed seed) of each size, capped at the
+    number of available keys.
+    """
+    rng = random.Random(SEED)
+    
+    return { size : rng.sample( keys, min( size, len(keys))) for size in sizes }
+
+def measure( func : Callable, repeat : int) -> tuple[ float, int, Any] :
+    """
+    Run a function `repeat` times. \\
+    Returns:
+        Tuple with the median time in microseconds, the peak allocation in bytes
+        (of one extra traced run) and the output of the last run.
+    """
+    timings = []
+    output  = None
+    for _ in range(repeat) :
+        start  = time.perf_counter()
+        output = func()
+        timings.append(time.perf_counter() - start)
+    
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return median(timings) * 1e6, peak, output
+
+def run_benchmarks( model : str, repeat : int) -> tuple[ dict, dict] :
+    """
+    Run every benchmark for a drone model. \\
+    Returns:
+        Tuple with the measurements (name -> { "us", "peak" }) and the outputs
+        (name -> output) of every benchmark.
+    """
+    results : dict[ str, dict] = {}
+    outputs : dict[ str, Any]  = {}
+    
+    def record( name : str, func : Callable, n : int = repeat, golden : bool = True) :
+        us, peak, output = measure( func, n)
+        results[name] = { "us" : round( us, 1), "peak" : peak }
+        if golden :
+            outputs[name] = output
+        return
+    
+    # Model load (cold)
+    def load() -> None :
+        DomainKnowledgeDataBase.clear_caches()
+        DomainKnowledgeDataBase().set_model(model)
+        return
+    
+    record( "load", load, max( 1, repeat // 20), golden = False)
+    
+    dkdb = DomainKnowledgeDataBase()
+    dkdb.set_model(model)
+    
+    msg_keys  = list(dkdb.dkb_msgs)
+    comp_keys = list(dkdb.dkb_comp)
+    msg_sets  = make_code_sets(msg_keys)
+    comp_sets = make_code_sets(comp_keys)
+    
+    # Matching: exact keys and keys with a typo (last character dropped)
+    sample_keys = msg_sets[ max(CODE_SET_SIZES) ]
+    record( "get_match/exact",
+            lambda : [ dkdb.get_match( k, dkdb.dkb_msgs.keys()) for k in sample_keys[:20] ])
+    record( "get_match/fuzzy",
+            lambda : [ dkdb.get_match( k[:-1], dkdb.dkb_msgs.keys())
+                       for k in sample_keys[:20] ])
+    
+    # Message catalog
+    record( "list_messages", dkdb.list_messages)
+    
+    # Component data and joint diagnoses per code set size
+    for size, codes in comp_sets.items() :
+        record( f"get_components/{size}", lambda codes = codes : dkdb.get_components(codes))
+    for size, codes in msg_sets.items() :
+        record( f"get_joint_diagnosis/{size}/verbose",
+                lambda codes = codes : dkdb.get_joint_diagnosis( codes, True))
+        record( f"get_joint_diagnosis/{size}/compact",
+                lambda codes = codes : dkdb.get_joint_diagnosis( codes, False))
+    
+    return results, outputs
+
+def load_representation( model : str, representation : str) -> Any :
+    """
+    Loaded topics of a drone model: every DKA and DKB topic as pydantic models
+    ('pydantic'), or the runtime records built from them ('records').
+    """
+    dk_dir  = DomainKnowledgeDataBase().dk_dir
+    dir_dka = dk_dir / f"{model}_dka"
+    dir_dkb = dk_dir / f"{model}_dkb"
+    dkb     = ( load_dkb_components(dir_dkb), load_dkb_issues(dir_dkb),
+                load_dkb_signals(dir_dkb),    load_dkb_messages(dir_dkb) )
+    
+    if representation == "pydantic" :
+        return ( *dkb, load_dka_components(dir_dka), load_dka_issues(dir_dka),
+                       load_dka_signals(dir_dka),    load_dka_messages(dir_dka) )
+    
+    return build_records( *dkb, load_dka_messages(dir_dka), PARTITION_PREFIX)
+
+def resident_bytes() -> int | None :
+    """
+    Resident set size of this process (Linux only, else None).
+    """
+    try :
+        with open("/proc/self/statm") as f :
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except ( OSError, ValueError) :
+        return None
+
+def resident_growth( model : str, representation : str) -> int | None :
+    """
+    Growth of the resident size of this process when loading (and keeping) a
+    representation. Meant to run in a fresh process. Includes one-off costs (e.g.,
+    validator construction) and memory freed to the allocator but not to the system.
+    """
+    gc.collect()
+    before = resident_bytes()
+    data   = load_representation( model, representation)
+    gc.collect()
+    after  = resident_bytes()
+    del data
+    
+    return None if ( before is None ) or ( after is None ) else after - before
+
+def retained_bytes( model : str, representation : str) -> int :
+    """
+    Bytes allocated by loading a representation that are still held once loaded.
+    """
+    gc.collect()
+    tracemalloc.start()
+    data = load_representation( model, representation)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    
+    return current
+
+def memory_report( models : list[str]) -> None :
+    
+    print(f"{'MODEL':<8} {'REPRESENTATION':<16} {'RESIDENT [KB]':>14} {'RETAINED [KB]':>14}")
+    for model in models :
+        resident = {}
+        retained = {}
+        for representation in REPRESENTATIONS :
+            with ProcessPoolExecutor( max_workers = 1,
+                                      mp_context  = get_context("spawn")) as pool :
+                resident[representation] = \
+                    pool.submit( resident_growth, model, representation).result()
+            retained[representation] = retained_bytes( model, representation)
+            rss = resident[representation]
+            rss = f"{rss / 1024:.0f}" if rss is not None else "n/a"
+            print(f"{model:<8} {representation:<16} {rss:>14} "
+                  f"{retained[representation] / 1024:>14.0f}")
+        ratio = retained["records"] / retained["pydantic"]
+        print(f"{model:<8} {'records/pydantic':<16} {'':>14} {ratio:>14.1%}")
+    
+    return
+
+def load_json( path : Path) -> Any :
+    
+    if not path.exists() :
+        return None
+    with open( path, encoding = "utf-8") as f :
+        return json.load(f)
+
+def write_json( path : Path, data : Any) -> None :
+    
+    path.parent.mkdir( parents = True, exist_ok = True)
+    with open( path, "w", encoding = "utf-8") as f :
+        json.dump( data, f, ensure_ascii = False, indent = 1)
+        f.write("\n")
+    
+    return
+
+def compare_goldens( outputs : dict[ str, Any], golden : dict[ str, Any] | None) -> list[str] :
+    """
+    Names of the benchmarks whose (JSON-normalized) output differs from the golden.
+    """
+    if golden is None :
+        return []
+    
+    outputs = json.loads(json.dumps( outputs, ensure_ascii = False))
+    
+    return [ name for name, output in outputs.items()
+             if ( name in golden ) and ( golden[name] != output ) ]
+
+def compare_baseline( results   : dict[ str, dict],
+                      baseline  : dict[ str, dict] | None,
+                      tolerance : float ) -> list[ tuple[ str, str, float, float] ] :
+    """
+    Regressions with respect to the baseline: time or peak allocation above the
+    baseline by more than `tolerance` (relative) and by more than `MIN_DELTA`. \\
+    Returns:
+        List of tuples (benchmark name, metric, baseline value, current value)
+    """
+    regressions = []
+    if baseline is None :
+        return regressions
+    
+    for name, result in results.items() :
+        if name not in baseline :
+            continue
+        for metric in ( "us", "peak") :
+            base, current = baseline[name][metric], result[metric]
+            if ( current > base * ( 1 + tolerance ) ) \
+            and ( current - base > MIN_DELTA[metric] ) :
+                regressions.append( ( name, metric, base, current) )
+    
+    return regressions
+
+def print_report( model    : str,
+                  results  : dict[ str, dict],
+                  baseline : dict[ str, dict] | None ) -> None :
+    
+    print(f"MODEL {model}")
+    print(f"{'BENCHMARK':<36} {'TIME [us]':>12} {'PEAK [KB]':>10} {'VS BASELINE':>12}")
+    for name, result in results.items() :
+        delta = ""
+        if baseline and ( name in baseline ) and baseline[name]["us"] :
+            delta = f"{100 * ( result["us"] / baseline[name]["us"] - 1 ):+.1f}%"
+        print(f"{name:<36} {result["us"]:>12.1f} {result["peak"] / 1024:>10.1f} {delta:>12}")
+    
+    return
+
+
+def parse_args() -> argparse.Namespace :
+    
+    parser = argparse.ArgumentParser( description = "Benchmark the domain knowledge database." )
+    parser.add_argument( "--models",
+                         nargs   = "+",
+                         default = list(DomainKnowledgeDataBase.MODELS_AVAILABLE),
+                         help    = "Drone models to benchmark." )
+    parser.add_argument( "--repeat",
+                         type    = int,
+                         default = 50,
+                         help    = "Runs per benchmark (median time is reported)." )
+    parser.add_argument( "--tolerance",
+                         type    = float,
+                         default = 0.25,
+                         help    = "Relative time/allocation increase flagged as a regression." )
+    parser.add_argument( "--dir",
+                         type    = Path,
+                         default = BENCH_DIR,
+                         help    = "Directory of golden outputs and baselines." )
+    parser.add_argument( "--update-golden",
+                         action = "store_true",
+                         help   = "Store current outputs as golden outputs." )
+    parser.add_argument( "--update-baseline",
+                         action = "store_true",
+                         help   = "Store current timings and allocations as baseline." )
+    parser.add_argument( "--memory",
+                         action = "store_true",
+                         help   = "Only report the memory of the loaded topics." )
+    
+    return parser.parse_args()
+
+def main() -> None :
+    
+    args   = parse_args()
+    failed = False
+    
+    if args.memory :
+        memory_report(args.models)
+        return
+    
+    for model in args.models :
+        path_golden   = args.dir / f"{model}_golden.json"
+        path_baseline = args.dir / f"{model}_baseline.json"
+        
+        results, outputs = run_benchmarks( model, args.repeat)
+        golden   = load_json(path_golden)
+        baseline = load_json(path_baseline)
+        
+        print_report( model, results, baseline)
+        
+        mismatches  = compare_goldens( outputs, golden)
+        regressions = compare_baseline( results, baseline, args.tolerance)
+        for name in mismatches :
+            print(f"[GOLDEN MISMATCH] {name}")
+        for name, metric, base, current in regressions :
+            print(f"[REGRESSION] {name} {metric}: {base} -> {current}")
+        if golden is None :
+            print(f"No golden outputs at {path_golden} (use --update-golden)")
+        if baseline is None :
+            print(f"No baseline at {path_baseline} (use --update-baseline)")
+        print()
+        
+        failed = failed or bool(mismatches) or bool(regressions)
+        
+        if args.update_golden :
+            write_json( path_golden, outputs)
+            print(f"Wrote golden outputs to {path_golden}")
+        if args.update_baseline :
+            write_json( path_baseline, results)
+            print(f"Wrote baseline to {path_baseline}")
+    
+    if failed and not ( args.update_golden or args.update_baseline ) :
+        raise SystemExit(1)
+    
+    return
+
+
+if __name__ == "__main__" :
+    main()
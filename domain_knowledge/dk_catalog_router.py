@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Message catalog router
+-----
+* Message catalog partitions are the DKA message files (e.g., `messages_propulsion`
+  is partition 'propulsion'), described in `abc_messages.json`.
+* Route the error messages read from a screen to the partitions they most likely
+  belong to: an inverted index maps every distinctive word of the message names
+  and keys (English and Spanish, placeholders removed) to its partitions, and each
+  error message goes to its best scoring partitions.
+* The screen type adds the partitions of messages shown on that screen regardless
+  of their words (e.g., ribbon and warning messages on the main operating screen).
+* If any error message cannot be routed (e.g., a screen in another language) then
+  there is no routing and the full catalog should be used.
+"""
+
+from .dk_records import RT_CatalogEntry
+from .dka_placeholder_database import PAT_PH
+from .dk_text_extractor import normalize
+
+
+PARTITION_PREFIX = "messages_"
+
+
+class MessageCatalogRouter :
+    """
+    Router of error messages to message catalog partitions.
+    """
+    
+    # Partitions added by screen type
+    SCREEN_PARTITIONS = { "MOS" : ( "ribbon", "warning") }
+    # Words in more than this share of partitions are not distinctive
+    MAX_WORD_SHARE    = 0.25
+    # Partitions scoring at least this share of the best score are kept
+    MIN_SCORE_SHARE   = 0.5
+    
+    def __init__( self, catalog : dict[ str, tuple[ RT_CatalogEntry, ...]]) -> None :
+        
+        # Partitions in file order
+        self.partitions = list(catalog)
+        
+        # Word -> partitions
+        word_partitions : dict[ str, set[str]] = {}
+        for partition, entries in catalog.items() :
+            for entry in entries :
+                texts = [ entry.key, entry.name ]
+                if isinstance( entry.name_spanish, list) :
+                    texts.extend(entry.name_spanish)
+                elif entry.name_spanish :
+                    texts.append(entry.name_spanish)
+                for word in self.words(" ".join(texts)) :
+                    word_partitions.setdefault( word, set()).add(partition)
+        
+        # Distinctive words only, weighted by inverse partition count
+        max_partitions = max( 1, int( self.MAX_WORD_SHARE * len(self.partitions)))
+        self.index : dict[ str, dict[ str, float]] = {}
+        for word, partitions in word_partitions.items() :
+            if len(partitions) <= max_partitions :
+                self.index[word] = { p : 1.0 / len(partitions) for p in partitions }
+        
+        return
+    
+    @staticmethod
+    def words( text : str) -> set[str] :
+        """
+        Normalized words of a text without placeholders, numbers or short words.
+        """
+        text = PAT_PH.sub( " ", text)
+        
+        return { word for word in normalize(text).split()
+                      if len(word) > 2 and not word.isdigit() }
+    
+    def route( self,
+               screen_type    : str | None,
+               error_messages : list[str] ) -> list[str] | None :
+        """
+        Partitions of the error messages of a screen. \\
+        Args:
+            screen_type    : Screen type from the image analysis ('MOS', 'HMS', ...)
+            error_messages : Error messages read from the screen
+        Returns:
+            Partitions in catalog order, or None if there are no error messages or
+            any of them cannot be routed
+        """
+        if not error_messages :
+            return None
+        
+        selected = set(self.SCREEN_PARTITIONS.get( screen_type or "", ()))
+        
+        for error_message in error_messages :
+            scores : dict[ str, float] = {}
+            for word in self.words(error_message) :
+                for partition, weight in self.index.get( word, {}).items() :
+                    scores[partition] = scores.get( partition, 0.0) + weight
+            if not scores :
+                return None
+            best = max(scores.values())
+            selected.update( p for p, score in scores.items()
+                               if score >= self.MIN_SCORE_SHARE * best )
+        
+        return [ p for p in self.partitions if p in selected ]
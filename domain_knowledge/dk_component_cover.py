@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Minimal component cover
+-----
+* Alternative to ranking components by the number of messages they may explain:
+  find the smallest set of components whose faults explain every observed message,
+  preferring risky components among sets of equal size, i.e., a weighted set cover
+  where a component costs `1 + ε / (1 + risk)`. With ε below one over the number of
+  components, the risk terms of any cover add up to less than one component, so
+  fewer components always win.
+* Message coverage is precomputed per model as integer bitsets (bit i = message i
+  of the DKB), one per component, from the signal paths of every message. A query
+  only ANDs and ORs integers.
+* Solved exactly (branch and bound on the lowest uncovered message) for up to
+  `EXACT_MAX_CANDIDATES` candidate components, else greedily (best coverage per
+  cost first).
+"""
+
+from math import inf
+
+from .dk_records import ( RT_Component,
+                          RT_Message,
+                          RT_Signal )
+
+
+EXACT_MAX_CANDIDATES = 24
+
+
+class ComponentCoverIndex :
+    """
+    Message coverage bitsets of the components of a drone model.
+    """
+    
+    def __init__( self,
+                  dkb_msgs : dict[ str, RT_Message],
+                  dkb_sign : dict[ str, RT_Signal],
+                  dkb_comp : dict[ str, RT_Component] ) -> None :
+        
+        # Message key -> bit
+        self.msg_bits : dict[ str, int] = { msg_key : 1 << i
+                                            for i, msg_key in enumerate(dkb_msgs) }
+        
+        # Component -> bitset of the messages whose signal paths contain it
+        self.comp_bits : dict[ str, int] = {}
+        for msg_key, msg_entry in dkb_msgs.items() :
+            for signal_ in msg_entry.signals :
+                for comp in dkb_sign[signal_].path_ :
+                    self.comp_bits[comp] = self.comp_bits.get( comp, 0) \
+                                         | self.msg_bits[msg_key]
+        
+        # Component -> cost (cardinality first, then risk; see module docstring)
+        epsilon = 1.0 / ( 1.0 + len(dkb_comp) )
+        self.comp_cost : dict[ str, float] = { comp : 1.0 + epsilon / ( 1.0 + entry.risk )
+                                               for comp, entry in dkb_comp.items() }
+        
+        return
+    
+    def solve( self,
+               msg_keys   : list[str],
+               candidates : list[str] ) -> tuple[ list[str], bool] :
+        """
+        Minimal weighted cover of the messages by the candidate components. \\
+        Args:
+            msg_keys   : Messages to explain (only those of known signal causes count)
+            candidates : Candidate components, in tie-breaking order
+        Returns:
+            Tuple with the cover (components in candidate order) and whether it was
+            solved exactly
+        """
+        target = 0
+        for msg_key in msg_keys :
+            target |= self.msg_bits.get( msg_key, 0)
+        
+        cands = [ ( comp, self.comp_bits.get( comp, 0) & target, self.comp_cost[comp])
+                  for comp in candidates ]
+        cands = [ cand for cand in cands if cand[1] ]
+        target &= self.union( cand[1] for cand in cands )
+        if not target :
+            return [], True
+        
+        # Too many candidates: drop those dominated by another one (same or larger
+        # coverage, same or lower cost), cheapest and largest first
+        if len(cands) > EXACT_MAX_CANDIDATES :
+            kept = []
+            for cand in sorted( cands, key = lambda c : ( c[2], -c[1].bit_count()) ) :
+                if not any( k[1] & cand[1] == cand[1] for k in kept ) :
+                    kept.append(cand)
+            cands = [ cand for cand in cands if cand in kept ]
+        
+        exact = len(cands) <= EXACT_MAX_CANDIDATES
+        cover = self.solve_exact( target, cands) if exact \
+                else self.solve_greedy( target, cands)
+        order = { comp : i for i, comp in enumerate(candidates) }
+        
+        return sorted( cover, key = order.get), exact
+    
+    @staticmethod
+    def union( bitsets) -> int :
+        
+        result = 0
+        for bits in bitsets :
+            result |= bits
+        
+        return result
+    
+    @staticmethod
+    def solve_greedy( target : int, cands : list[ tuple[ str, int, float]]) -> list[str] :
+        
+        cover     = []
+        uncovered = target
+        while uncovered :
+            comp, bits, _ = max( cands,
+                                 key = lambda c : ( c[1] & uncovered ).bit_count() / c[2] )
+            cover.append(comp)
+            uncovered &= ~bits
+        
+        return cover
+    
+    @staticmethod
+    def solve_exact( target : int, cands : list[ tuple[ str, int, float]]) -> list[str] :
+        
+        best_cost  = inf
+        best_cover = []
+        
+        def branch( uncovered : int, cost : float, cover : list[str]) -> None :
+            nonlocal best_cost, best_cover
+            if not uncovered :
+                if cost < best_cost :
+                    best_cost, best_cover = cost, list(cover)
+                return
+            # Some candidate must cover the lowest uncovered message
+            lowest = uncovered & -uncovered
+            for comp, bits, comp_cost in cands :
+                if ( bits & lowest ) and ( cost + comp_cost < best_cost ) :
+                    cover.append(comp)
+                    branch( uncovered & ~bits, cost + comp_cost, cover)
+                    cover.pop()
+            return
+        
+        branch( target, 0.0, [])
+        
+        return best_cover
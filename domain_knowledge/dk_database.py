@@ -3,6 +3,8 @@
 Domain Knowledge Database
 """
 
+import hashlib
+import json
 from functools import wraps
 from math import inf
 from pathlib import Path
@@ -11,13 +13,26 @@ from thefuzz.fuzz import ratio
 from typing import ( Any,
                      Callable )
 
-from sofia_utils.io import write_to_json_string
+from sofia_utils.io import ( load_json_file,
+                             write_to_json_string )
 from sofia_utils.printing import ( print_ind,
                                    print_sep )
 from wa_agents.basemodels import InteractiveOption
 
 from .dk_basemodels import *
 from .dka_placeholder_database import PlaceHolderDatabase
+from .dk_component_cover import ComponentCoverIndex
+from .dk_records import ( DK_Records,
+                          RT_Component,
+                          RT_Issue,
+                          RT_Message,
+                          build_records )
+from .dk_catalog_router import ( MessageCatalogRouter,
+                                 PARTITION_PREFIX )
+from .dk_template_matcher import MessageTemplateMatcher
+from .dk_text_extractor import ( LANGUAGES,
+                                 MessageTextExtractor,
+                                 normalize )
 
 
 class DomainKnowledgeDataBase :
@@ -42,16 +57,72 @@ class DomainKnowledgeDataBase :
                            "notes", "solutions", "errors" } },
     }
     
-    def __init__( self, debug : bool = False) -> None :
+    # Compact joint diagnosis: number of components/issues presented in full detail
+    JD_TOP_N        = 3
+    JD_COMPACT_NOTE = "Only the first components and issues are shown in full detail. " \
+                      "Use tools 'get_component_data' and 'get_issue_data' for the rest."
+    
+    # Pre-serialized component and issue details, per (model, topic) pair
+    # (shared by all instances, see method `preserialize`)
+    DETAILS_CACHE : dict[ tuple[ str, str], dict[ str, dict] ] = {}
+    # Pre-dumped joint diagnosis fragments, per (model, topic) pair
+    # (shared by all instances, see method `prebuild_fragments`)
+    JD_CACHE      : dict[ tuple[ str, str], dict[ str, dict] ] = {}
+    # Message catalog per model, language and partitions (see method `list_messages`)
+    CATALOG_CACHE  : dict[ tuple[ str, str | None, tuple | None], str] = {}
+    # Message catalog slices per model, language and partition
+    CATALOG_SLICES : dict[ tuple[ str, str | None, str], str] = {}
+    # Message catalog router per model (see method `route_partitions`)
+    ROUTER_CACHE   : dict[ str, MessageCatalogRouter] = {}
+    # Message coverage bitsets of components per model (see `compute_joint_diagnosis`)
+    COVER_CACHE    : dict[ str, ComponentCoverIndex] = {}
+    # Runtime records per model (see method `load_records`), which also fills
+    # `DETAILS_CACHE` and `JD_CACHE` (use `clear_caches` to clear them together)
+    RECORDS_CACHE  : dict[ str, DK_Records] = {}
+    # Materialized joint diagnoses per model (see method `get_jd_table`)
+    JD_TABLE_NAME  = "jd_table.json"
+    JD_TABLE_CACHE : dict[ str, dict[ str, tuple[ dict, dict]] ] = {}
+    # Message template matcher per model (see method `match_message`)
+    MATCHER_CACHE : dict[ str, MessageTemplateMatcher] = {}
+    # Message name automaton per model and language (see method `extract_messages`)
+    EXTRACTOR_CACHE : dict[ tuple[ str, str], MessageTextExtractor] = {}
+    
+    def __init__( self,
+                  debug     : bool = False,
+                  use_table : bool = True ) -> None :
         
-        self.debug = debug
-        self.model = None
+        self.debug     = debug
+        self.use_table = use_table   # See `get_joint_diagnosis`
+        self.model     = None
         self.dk_dir = Path(__file__).resolve().parent
         
         return
     
-    def get_model_options(self) -> list[InteractiveOption] :
+    @classmethod
+    def clear_caches( cls, model : str | None = None) -> None :
+        """
+        Clear the caches shared by all instances (class attributes named `*_CACHE` or
+        `*_SLICES`, keyed by model or by tuples starting with the model), so that the
+        next `set_model` loads from disk. \\
+        Args:
+            model : Model whose entries are cleared; by default every model's
+        """
+        for name, cache in vars(cls).items() :
+            if not ( name.endswith(( "_CACHE", "_SLICES")) and isinstance( cache, dict) ) :
+                continue
+            
+            if model is None :
+                cache.clear()
+                continue
+            
+            for key in [ key for key in cache
+                         if ( key[0] if isinstance( key, tuple) else key ) == model ] :
+                del cache[key]
+        
+        return
     
+    def get_model_options(self) -> list[InteractiveOption] :
+        
         return [ InteractiveOption( id = model, title = f"DJI Agras {model}")
                  for model in self.MODELS_AVAILABLE ]
     
@@ -67,43 +138,117 @@ class DomainKnowledgeDataBase :
             self.dir_dka = self.dk_dir / f"{model}_dka"
             self.dir_dkb = self.dk_dir / f"{model}_dkb"
             
-            # DKA: Load topics
-            self.dka_comp = load_dka_components(self.dir_dka)
-            self.dka_issu = load_dka_issues(self.dir_dka)
-            self.dka_sign = load_dka_signals(self.dir_dka)
-            self.dka_msgs = load_dka_messages(self.dir_dka)
-            # DKB: Load topics
-            self.dkb_comp = load_dkb_components(self.dir_dkb)
-            self.dkb_issu = load_dkb_issues(self.dir_dkb)
-            self.dkb_sign = load_dkb_signals(self.dir_dkb)
-            self.dkb_msgs = load_dkb_messages(self.dir_dkb)
+            # Load topics once per model (shared by all instances, see `load_records`)
+            if model not in self.RECORDS_CACHE :
+                self.RECORDS_CACHE[model] = self.load_records()
+            records       = self.RECORDS_CACHE[model]
+            self.dkb_comp = records.comp
+            self.dkb_issu = records.issu
+            self.dkb_sign = records.sign
+            self.dkb_msgs = records.msgs
             
-            # DKA: Populate 'key' fields
-            for cat_key, cat_components_file in self.dka_comp.items() :
-                for comp_key in cat_components_file :
-                    self.dka_comp[cat_key][comp_key].key = comp_key
-            for cat_key, cat_issues_file in self.dka_issu.items() :
-                for issue_key in cat_issues_file :
-                    self.dka_issu[cat_key][issue_key].key = issue_key
-            
-            # DKB: Populate 'key' fields
-            for comp_key in self.dkb_comp :
-                self.dkb_comp[comp_key].key = comp_key
-            for issue_key in self.dkb_issu :
-                self.dkb_issu[issue_key].key = issue_key
-            for signal_key in self.dkb_sign :
-                self.dkb_sign[signal_key].key = signal_key
-            for msg_key in self.dkb_msgs :
-                self.dkb_msgs[msg_key].key = msg_key
+            # Message catalog partitions (one per DKA messages file) and descriptions
+            self.msg_catalog        = records.catalog
+            self.msg_partitions     = list(records.catalog)
+            self.msg_partition_info = load_json_file(self.dir_dka / "abc_messages.json")
             
             # Initalize placeholder database
             ph_path   = self.dir_dka / "placeholders.jsonc"
             self.phDB = PlaceHolderDatabase(ph_path)
             
+            # Pre-serialized component and issue details (static for a model)
+            self.comp_details = self.DETAILS_CACHE[( model, "components")]
+            self.issu_details = self.DETAILS_CACHE[( model, "issues")]
+            
+            # Pre-dumped joint diagnosis fragments (see `get_joint_diagnosis`)
+            self.jd_msgs = self.JD_CACHE[( model, "messages")]
+            self.jd_comp = self.JD_CACHE[( model, "components")]
+            self.jd_issu = self.JD_CACHE[( model, "issues")]
+            
             return False, f"Successfully set model to {model}"
         
         return True, f"Tool 'set_model' called with invalid model '{model}'"
     
+    def load_records(self) -> DK_Records :
+        """
+        Load and validate the DKB topics and DKA messages of the current model,
+        pre-serialize the tool payloads (see `preserialize` and `prebuild_fragments`)
+        and keep only compact runtime records (see `dk_records`). The pydantic models
+        are dropped on return. \
+        Returns:
+            DK_Records object
+        """
+        # DKB: Load topics
+        dkb_comp = load_dkb_components(self.dir_dkb)
+        dkb_issu = load_dkb_issues(self.dir_dkb)
+        dkb_sign = load_dkb_signals(self.dir_dkb)
+        dkb_msgs = load_dkb_messages(self.dir_dkb)
+        # DKA: Load messages (the catalog)
+        dka_msgs = load_dka_messages(self.dir_dka)
+        
+        # DKB: Populate 'key' fields
+        for topic in ( dkb_comp, dkb_issu, dkb_sign, dkb_msgs) :
+            for key, entry in topic.items() :
+                entry.key = key
+        
+        # Pre-serialize component and issue details
+        self.preserialize( "components", dkb_comp, { "risk" })
+        self.preserialize( "issues", dkb_issu)
+        
+        # Pre-dump joint diagnosis fragments
+        self.prebuild_fragments( "messages",   dkb_msgs, JD_Message)
+        self.prebuild_fragments( "components", dkb_comp, JD_Component)
+        self.prebuild_fragments( "issues",     dkb_issu, JD_Issue)
+        
+        return build_records( dkb_comp, dkb_issu, dkb_sign, dkb_msgs,
+                              dka_msgs, PARTITION_PREFIX)
+    
+    def preserialize( self,
+                      topic   : str,
+                      entries : dict[ str, Any],
+                      exclude : set[str] | None = None
+                    ) -> dict[ str, dict] :
+        """
+        Serialize every entry of a DKB topic once per model. \\
+        Returns:
+            Dict mapping each key to its serialized entry. The dict and its entries are
+            shared and must not be modified.
+        """
+        cache_key = ( self.model, topic)
+        if cache_key not in self.DETAILS_CACHE :
+            self.DETAILS_CACHE[cache_key] = {
+                key : entry.model_dump( exclude       = exclude,
+                                        exclude_unset = True,
+                                        exclude_none  = True )
+                for key, entry in entries.items() }
+        
+        return self.DETAILS_CACHE[cache_key]
+    
+    def prebuild_fragments( self,
+                            topic    : str,
+                            entries  : dict[ str, Any],
+                            jd_class : type[BaseModel]
+                          ) -> dict[ str, dict] :
+        """
+        Dump every entry of a DKB topic once per model, exactly as it appears in the
+        output of `get_joint_diagnosis` but without the per-call fields (`errors` and
+        `ignore`), which are always last. \\
+        Returns:
+            Dict mapping each key to its fragment. Fragments are shared and must not be
+            modified.
+        """
+        cache_key = ( self.model, topic)
+        if cache_key not in self.JD_CACHE :
+            include = self.JD_FIELDS[topic]["__all__"] - { "errors", "ignore" }
+            self.JD_CACHE[cache_key] = {
+                key : jd_class(**entry.model_dump()).model_dump( include       = include,
+                                                                 by_alias      = True,
+                                                                 exclude_unset = True,
+                                                                 exclude_none  = True )
+                for key, entry in entries.items() }
+        
+        return self.JD_CACHE[cache_key]
+    
     def check_model_initialization(func) :
         @wraps(func)
         def wrapper( self, *args, **kwargs) :
@@ -113,12 +258,35 @@ class DomainKnowledgeDataBase :
                 return True, "Drone model has not been set. Use tool 'set_model' to specify the drone model before using this tool."
         return wrapper
     
+    @check_model_initialization
+    def preload(self) -> tuple[ bool, str] :
+        """
+        Build now every cache of the current model that is otherwise built on first use
+        (materialized joint diagnoses, message catalogs, catalog router, template
+        matcher, name automata and component cover index), e.g., before forking worker
+        processes that then share them.
+        """
+        self.get_jd_table()
+        for language in ( None, *LANGUAGES ) :
+            self.list_messages(language)
+        self.get_router()
+        self.get_matcher()
+        for language in LANGUAGES :
+            self.get_extractor(language)
+        self.get_cover_index()
+        
+        return False, f"Preloaded model {self.model}"
+    
     def get_match( self,
                    str_input : str,
                    list_str  : list[str] | tuple[str],
                    score_fun : Callable = ratio
                  ) -> str | None :
         
+        # Fast path: exact match
+        if list_str and ( str_input in list_str ) :
+            return str_input
+        
         if list_str :
             list_matches = process.extract( query   = str_input,
                                             choices = list_str,
@@ -146,32 +314,141 @@ class DomainKnowledgeDataBase :
         
         return None
     
+    @staticmethod
+    def catalog_language( language : str | None) -> str | None :
+        """
+        Message catalog language ('english' or 'spanish') of a screen language as
+        reported by the image agent (e.g., 'Spanish', 'es' or 'Español (Latam)'), or
+        None if it is unknown or mixed.
+        """
+        names     = { "en" : "english", "eng" : "english", "english" : "english",
+                      "ingles" : "english",
+                      "es" : "spanish", "spa" : "spanish", "spanish" : "spanish",
+                      "espanol" : "spanish", "castellano" : "spanish" }
+        languages = { names[word] for word in normalize( language or "").split()
+                                  if word in names }
+        
+        return languages.pop() if len(languages) == 1 else None
+    
     @check_model_initialization
-    def list_messages(self) -> str :
+    def list_messages( self,
+                       language   : str | None       = None,
+                       partitions : list[str] | None = None ) -> str :
+        """
+        Message catalog (placeholders plus key and names of every message) in pseudo-XML.
+        Static for a model, language and set of partitions, so it is built once for
+        each, from slices pre-rendered per partition. \\
+        Args:
+            language   : 'english' or 'spanish' to list the message names in that
+                         language only; by default names in both languages are listed
+            partitions : Catalog partitions to list (see `msg_partitions`), e.g., as
+                         routed by `route_partitions`; by default all of them
+        """
+        selected  = [ p for p in self.msg_partitions if p in ( partitions or [] ) ] \
+                    or self.msg_partitions
+        partial   = len(selected) < len(self.msg_partitions)
+        cache_key = ( self.model, language, tuple(selected) if partial else None)
+        if cache_key in self.CATALOG_CACHE :
+            return self.CATALOG_CACHE[cache_key]
         
         result_rows = [ "PLACEHOLDERS" ]
         for set_name, set_elements in self.phDB.set_map.items() :
             result_rows.append( f"<{set_name}> = {", ".join(set_elements)}" )
         
+        # Partial catalog: say which partitions are missing and how to get them
+        if partial :
+            result_rows.append( f"PARTIAL DATABASE: ONLY PARTITIONS {", ".join(selected)}" )
+            result_rows.append( "OTHER PARTITIONS (use tool 'get_message_catalog' if a "
+                                "message matches no key below): "
+                              + " | ".join( f"{p} = {self.msg_partition_info.get( p, p)}"
+                                            for p in self.msg_partitions
+                                            if p not in selected ) )
+        
         result_rows.append( "DATABASE IN CSV FORMAT"  )
-        result_rows.append( "**KEY**, NAME, NAME_SPANISH" )
+        if language == "english" :
+            result_rows.append( "**KEY**, NAME" )
+        elif language == "spanish" :
+            result_rows.append( "**KEY**, NAME_SPANISH" )
+        else :
+            result_rows.append( "**KEY**, NAME, NAME_SPANISH" )
         
-        for dka_msgs_file in self.dka_msgs.values() :
-            for dka_msgs_group in dka_msgs_file :
-                for dka_msg_key in dka_msgs_group.messages :
-                    row = ", ".join( [ dka_msg_key.key,
-                                       dka_msg_key.name,
-                                       str(dka_msg_key.name_spanish) ] )
-                    result_rows.append(row)
+        result_str = self.phDB.pseudo_XML("; ".join(result_rows))
+        for partition in selected :
+            catalog_slice = self.list_messages_slice( language, partition)
+            if catalog_slice :
+                result_str += "; " + catalog_slice
         
-        result_str = "; ".join(result_rows)
-        result_str = self.phDB.pseudo_XML(result_str)
+        self.CATALOG_CACHE[cache_key] = result_str
         
         return result_str
     
+    def list_messages_slice( self, language : str | None, partition : str) -> str :
+        """
+        Rows of the messages of one catalog partition (see `list_messages`),
+        pre-rendered once per model and language.
+        """
+        cache_key = ( self.model, language, partition)
+        if cache_key in self.CATALOG_SLICES :
+            return self.CATALOG_SLICES[cache_key]
+        
+        result_rows = []
+        for entry in self.msg_catalog[partition] :
+            # Messages without Spanish name keep their English name
+            if language == "english" :
+                names = [ entry.name ]
+            elif language == "spanish" :
+                names = [ str( entry.name_spanish or entry.name) ]
+            else :
+                names = [ entry.name, str(entry.name_spanish) ]
+            row = ", ".join( [ entry.key, *names ] )
+            result_rows.append(row)
+        
+        result_str = self.phDB.pseudo_XML("; ".join(result_rows))
+        
+        self.CATALOG_SLICES[cache_key] = result_str
+        
+        return result_str
+    
+    @check_model_initialization
+    def get_message_catalog( self,
+                             partitions : list[str],
+                             language   : str | None = None,
+                           ) -> tuple[ bool, Any] :
+        """
+        Message catalog of one or more partitions (see `list_messages`).
+        """
+        invalid = [ p for p in partitions if p not in self.msg_partitions ]
+        if invalid or not partitions :
+            msg = f"Invalid partitions: {invalid}. Valid partitions: {self.msg_partitions}"
+            return True, f"In DomainKnowledgeDataBase.get_message_catalog: {msg}"
+        if language and ( language not in LANGUAGES ) :
+            return True, f"In DomainKnowledgeDataBase.get_message_catalog: Invalid language '{language}'"
+        
+        return False, self.list_messages( language, partitions)
+    
+    @check_model_initialization
+    def route_partitions( self,
+                          screen_type    : str | None,
+                          error_messages : list[str] ) -> list[str] | None :
+        """
+        Catalog partitions of the error messages read from a screen (see
+        `MessageCatalogRouter`), or None if the full catalog should be used.
+        """
+        return self.get_router().route( screen_type, error_messages)
+    
+    def get_router(self) -> MessageCatalogRouter :
+        """
+        Message catalog router of the current model, built on first use and shared by
+        all instances.
+        """
+        if self.model not in self.ROUTER_CACHE :
+            self.ROUTER_CACHE[self.model] = MessageCatalogRouter(self.msg_catalog)
+        
+        return self.ROUTER_CACHE[self.model]
+    
     def match_component( self,
                          component : str,
-                       ) -> tuple[ bool, str | DKB_Component ] :
+                       ) -> tuple[ bool, str | RT_Component ] :
         
         matched_comp = self.get_match( component, self.dkb_comp.keys())
         if not matched_comp :
@@ -185,52 +462,218 @@ class DomainKnowledgeDataBase :
                         components : list[str]
                       ) -> tuple[ bool, Any] :
         
-        result : list[ DKB_Component ] = []
+        result : list[ dict ] = []
         for comp_ in components :
             query_error, matched_comp = self.match_component(comp_)
             if not query_error :
-                result.append(matched_comp)
+                result.append(self.comp_details[matched_comp.key])
+        
+        return False, result
+    
+    def match_issue( self,
+                     issue : str,
+                   ) -> tuple[ bool, str | RT_Issue ] :
         
-        return False, [ comp.model_dump( exclude       = {"risk"},
-                                         exclude_unset = True,
-                                         exclude_none  = True) for comp in result ]
+        matched_issue = self.get_match( issue, self.dkb_issu.keys())
+        if not matched_issue :
+            msg = f"Invalid issue: {issue}"
+            return True, f"In DomainKnowledgeDataBase.match_issue: {msg}"
+        
+        return False, self.dkb_issu.get(matched_issue)
+    
+    @check_model_initialization
+    def get_issues( self,
+                    issues : list[str]
+                  ) -> tuple[ bool, Any] :
+        
+        result : list[ dict ] = []
+        for issue_ in issues :
+            query_error, matched_issue = self.match_issue(issue_)
+            if not query_error :
+                result.append(self.issu_details[matched_issue.key])
+        
+        return False, result
     
     def match_message( self,
                        message : str,
-                     ) -> tuple[ bool, str | DKB_MessageEntry ] :
+                     ) -> tuple[ bool, str | RT_Message ] :
+        """
+        Match a message code (or screen string) to a DKB message: exact key, else the
+        message templates with typed slots (so the number on screen picks the numbered
+        variant), else fuzzy match of the keys.
+        """
+        if message in self.dkb_msgs :
+            return False, self.dkb_msgs[message]
         
-        matched_msg = self.get_match( message, self.dkb_msgs.keys())
+        matched_msg = self.get_matcher().match(message) \
+                   or self.get_match( message, self.dkb_msgs.keys())
         if not matched_msg :
             msg = f"Invalid message: {message}"
             return True, f"In DomainKnowledgeDataBase.match_message: {msg}"
         
         return False, self.dkb_msgs.get(matched_msg)
     
+    def get_matcher(self) -> MessageTemplateMatcher :
+        """
+        Message template matcher of the current model, compiled on first use and shared
+        by all instances.
+        """
+        if self.model not in self.MATCHER_CACHE :
+            self.MATCHER_CACHE[self.model] = MessageTemplateMatcher( self.msg_catalog,
+                                                                     self.phDB,
+                                                                     self.dkb_msgs.keys(),
+                                                                     self.MIN_MATCH_SCORE )
+        
+        return self.MATCHER_CACHE[self.model]
+    
+    @check_model_initialization
+    def extract_messages( self,
+                          text     : str,
+                          language : str | None = None,
+                        ) -> tuple[ bool, Any] :
+        """
+        Extract every known message from free text (e.g., several error messages typed
+        or pasted by the user, or the text of a whole screen) in one pass. \\
+        Args:
+            text     : Free text
+            language : 'english' or 'spanish' to match the message names of one
+                       language only; by default both are matched
+        Returns:
+            List of dicts with the message code, the matched text and its span, in
+            text order
+        """
+        if language and ( language not in LANGUAGES ) :
+            return True, f"In DomainKnowledgeDataBase.extract_messages: Invalid language '{language}'"
+        
+        result = []
+        for lang in ( [language] if language else LANGUAGES ) :
+            result.extend(self.get_extractor(lang).extract(text))
+        if not language :
+            result.sort( key = lambda hit : hit["span"])
+        
+        return False, result
+    
+    def get_extractor( self, language : str) -> MessageTextExtractor :
+        """
+        Message name automaton of the current model in a language, built on first use
+        and shared by all instances.
+        """
+        cache_key = ( self.model, language)
+        if cache_key in self.EXTRACTOR_CACHE :
+            return self.EXTRACTOR_CACHE[cache_key]
+        
+        names = []
+        for key, dkb_msg in self.dkb_msgs.items() :
+            if language == "english" :
+                names.append( ( key, dkb_msg.name) )
+            elif isinstance( dkb_msg.name_spanish, list) :
+                names.extend( ( key, alias) for alias in dkb_msg.name_spanish )
+            elif dkb_msg.name_spanish :
+                names.append( ( key, dkb_msg.name_spanish) )
+        
+        self.EXTRACTOR_CACHE[cache_key] = MessageTextExtractor(names)
+        
+        return self.EXTRACTOR_CACHE[cache_key]
+    
+    @staticmethod
+    def jd_table_key( messages : list[str]) -> str :
+        return "|".join(messages)
+    
+    def dkb_fingerprint(self) -> str :
+        """
+        Fingerprint of the DKB files of the current model and of the modules that
+        compute joint diagnoses, to detect stale materialized joint diagnoses.
+        """
+        digest = hashlib.sha256()
+        for module in ( "dk_database.py", "dk_records.py", "dk_component_cover.py") :
+            digest.update(( self.dk_dir / module).read_bytes())
+        for path in sorted(self.dir_dkb.iterdir()) :
+            if path.is_file() and ( path.name != self.JD_TABLE_NAME ) :
+                digest.update(path.name.encode())
+                digest.update(path.read_bytes())
+        
+        return digest.hexdigest()
+    
+    def get_jd_table(self) -> dict[ str, tuple[ dict, dict]] :
+        """
+        Materialized joint diagnoses of the current model (see `dkb_build_jd_table`),
+        loaded once per model. A table built from other DKB files or code is ignored. \\
+        Returns:
+            Dict mapping each key (see `jd_table_key`) to the verbose and compact joint
+            diagnoses. Results are shared and must not be modified.
+        """
+        if self.model in self.JD_TABLE_CACHE :
+            return self.JD_TABLE_CACHE[self.model]
+        
+        table = {}
+        path  = self.dir_dkb / self.JD_TABLE_NAME
+        if path.exists() :
+            with open( path, encoding = "utf-8") as f :
+                data = json.load(f)
+            if data.get("fingerprint") == self.dkb_fingerprint() :
+                table = { key : ( result, self.compact_joint_diagnosis(result))
+                          for key, result in data["results"].items() }
+            else :
+                print_ind( f"⚠️ Ignoring stale {path} (rebuild the DKB)", 1)
+        
+        self.JD_TABLE_CACHE[self.model] = table
+        
+        return table
+    
     @check_model_initialization
     def get_joint_diagnosis( self,
                              messages : list[str],
+                             verbose  : bool = False,
                            ) -> tuple[ bool, Any] :
+        """
+        Joint diagnosis of one or more messages. \\
+        Answered from the materialized joint diagnoses (see `get_jd_table`) when they
+        hold these exact message keys and `use_table` is set, else computed. \\
+        Args:
+            messages : Message keys
+            verbose  : If True then present every component and issue in full detail,
+                       else only the first `JD_TOP_N` of each (see `compact_joint_diagnosis`)
+        """
+        if self.use_table :
+            materialized = self.get_jd_table().get(self.jd_table_key(messages))
+            if materialized :
+                if self.debug :
+                    print_ind( f"Joint diagnosis of {messages} from {self.JD_TABLE_NAME}")
+                return False, materialized[0] if verbose else materialized[1]
         
-        # Populate list of joint diagnosis message objects
-        JD_messages : list[ JD_Message ] = []
+        return self.compute_joint_diagnosis( messages, verbose)
+    
+    def compute_joint_diagnosis( self,
+                                 messages : list[str],
+                                 verbose  : bool = False,
+                               ) -> tuple[ bool, Any] :
+        """
+        Joint diagnosis of one or more messages, computed live (see
+        `get_joint_diagnosis`).
+        """
+        
+        # Populate list of joint diagnosis messages and their output fragments
+        JD_messages : list[ RT_Message ]       = []
+        JD_ignored  : list[ bool ]             = []
+        msgs_output : list[ dict[ str, Any] ]  = []
         for message_ in messages :
             # Match message
             query_error, matched_msg = self.match_message(message_)
             if not query_error :
-                # Instantiate joint diagnosis message object
-                msg_obj = JD_Message(**(matched_msg.model_dump()))
+                msg_fragment = self.jd_msgs[matched_msg.key]
                 # Flag ribbons and warnings
-                if msg_obj.key.startswith( ( 'ribbon_', 'warning_')) :
-                    msg_obj.ignore = True
+                msg_ignored  = matched_msg.key.startswith( ( 'ribbon_', 'warning_'))
+                if msg_ignored :
+                    msg_fragment = { **msg_fragment, "ignored" : True }
                 # Append to joint diagnosis messages
-                JD_messages.append(msg_obj)
-                # If necessary then disaggregate messages
-                if msg_obj.disaggregate :
-                    for da_message_ in msg_obj.disaggregate :
-                        da_qe, da_mm = self.match_message(da_message_)
-                        if not da_qe :
-                            da_msg_obj = JD_Message(**(da_mm.model_dump()))
-                            JD_messages.append(da_msg_obj)
+                JD_messages.append(matched_msg)
+                JD_ignored.append(msg_ignored)
+                msgs_output.append(msg_fragment)
+                # If necessary then disaggregate messages (see `dk_records.disaggregations`)
+                for da_message_ in matched_msg.disaggregate_ :
+                    JD_messages.append(self.dkb_msgs[da_message_])
+                    JD_ignored.append(False)
+                    msgs_output.append(self.jd_msgs[da_message_])
         
         # Initialize data structures
         component_cards  : dict[ str, int]       = {}
@@ -239,18 +682,20 @@ class DomainKnowledgeDataBase :
         issue_cards      : dict[ str, int]       = {}
         issue_errors     : dict[ str, list[str]] = {}
         
-        # Iterate through joint diagnosis message objects
-        for message_obj in JD_messages :
-            if ( not message_obj.ignore ) and message_obj.causes :
+        # Iterate through joint diagnosis messages
+        for message_obj, msg_ignored in zip( JD_messages, JD_ignored) :
+            if not msg_ignored :
                 
                 # Initialize and accumulate component cardinalities, errors and hops
-                signals = message_obj.causes.signals
+                signals = message_obj.signals
                 if signals :
                     
-                    deduped_components_in_signals : set[str] = set()
+                    # Insertion-ordered (not a set) so that ties in the inspection
+                    # ordering do not depend on string hash randomization
+                    deduped_components_in_signals : dict[ str, None] = {}
                     for signal_ in signals :
                         signal_path_ = self.dkb_sign.get(signal_).path_
-                        deduped_components_in_signals.update(signal_path_)
+                        deduped_components_in_signals.update(dict.fromkeys(signal_path_))
                     
                     for comp in deduped_components_in_signals :
                         component_cards[comp]  = component_cards.get( comp, 0) + 1
@@ -264,7 +709,7 @@ class DomainKnowledgeDataBase :
                                     component_hops[comp] = hops
                 
                 # Initialize and accumulate issue cardinalities and errors
-                issues = message_obj.causes.issues
+                issues = message_obj.issues
                 if issues :
                     for issue_ in issues :
                         if not issue_ in issue_cards :
@@ -275,7 +720,7 @@ class DomainKnowledgeDataBase :
                         issue_errors[issue_].append(message_obj.key)
         
         # Establish component inspection ordering
-        comp_io : list[ tuple[ str, int, Decimal] ]
+        comp_io : list[ tuple[ str, int, float, int] ]
         comp_io = [ ( comp,
                       component_cards.get(comp),
                       self.dkb_comp.get(comp).risk,
@@ -294,11 +739,9 @@ class DomainKnowledgeDataBase :
             print_sep()
         
         # Present component and errors triggered when faulty
-        JD_components : list[JD_Component] = []
-        for comp, _, _, _ in comp_io :
-            comp_obj = JD_Component( **(self.dkb_comp.get(comp).model_dump()) )
-            comp_obj.errors = component_errors.get(comp)
-            JD_components.append(comp_obj)
+        comps_output = [ { **self.jd_comp[comp],
+                           "errors_triggered_when_faulty" : component_errors[comp] }
+                         for comp, _, _, _ in comp_io ]
         
         # Establish issues inspection ordering
         issues_io : list[ tuple[ str, int] ]
@@ -312,19 +755,78 @@ class DomainKnowledgeDataBase :
             print_sep()
         
         # Present issue and errors triggered when present
-        JD_issues : list[JD_Issue] = []
-        for issue, _ in issues_io :
-            issue_obj = JD_Issue( **(self.dkb_issu.get(issue).model_dump()) )
-            issue_obj.errors = issue_errors.get(issue)
-            JD_issues.append(issue_obj)
-        
-        # Populate results dict
-        result = JointDiagnosis( messages   = JD_messages,
-                                 components = JD_components,
-                                 issues     = JD_issues )
-        
-        # The grand finale
-        return False, result.model_dump( include       = self.JD_FIELDS,
-                                         by_alias      = True,
-                                         exclude_unset = True,
-                                         exclude_none  = True )
+        issues_output = [ { **self.jd_issu[issue],
+                            "errors_triggered_when_present" : issue_errors[issue] }
+                          for issue, _ in issues_io ]
+        
+        # Smallest set of components explaining every message, riskiest first (see
+        # `ComponentCoverIndex`), among the components in inspection order
+        cover_msgs = [ message_obj.key for message_obj, msg_ignored
+                       in zip( JD_messages, JD_ignored) if not msg_ignored ]
+        cover, _   = self.get_cover_index().solve( cover_msgs,
+                                                   [ ct[0] for ct in comp_io ] )
+        cover_output = [ { field : self.jd_comp[comp][field]
+                           for field in ( "key", "name", "name_spanish")
+                           if field in self.jd_comp[comp] }
+                         | { "errors_triggered_when_faulty" : component_errors[comp] }
+                         for comp in cover ]
+        
+        # The grand finale (same shape as dumping a `JointDiagnosis` with `JD_FIELDS`,
+        # plus the component cover)
+        result = { "messages"                             : msgs_output,
+                   "suggested_component_inspection_order" : comps_output,
+                   "suggested_issue_inspection_order"     : issues_output,
+                   "minimal_component_cover"              : cover_output }
+        
+        return False, result if verbose else self.compact_joint_diagnosis(result)
+    
+    def get_cover_index(self) -> ComponentCoverIndex :
+        """
+        Component cover index of the current model, built on first use and shared by
+        all instances.
+        """
+        if self.model not in self.COVER_CACHE :
+            self.COVER_CACHE[self.model] = ComponentCoverIndex( self.dkb_msgs,
+                                                                self.dkb_sign,
+                                                                self.dkb_comp )
+        
+        return self.COVER_CACHE[self.model]
+    
+    def compact_joint_diagnosis( self, result : dict[ str, Any]) -> dict[ str, Any] :
+        """
+        Compact a (verbose) joint diagnosis result. \\
+        Every component and issue keeps its key, name(s) and score (number of messages
+        it may explain) in inspection order, but only the first `JD_TOP_N` of each keep
+        their remaining fields (notes, solutions and triggered errors). The minimal
+        component cover is already compact.
+        """
+        def compact_list( entries : list[ dict[ str, Any]], errors_field : str) -> list :
+            
+            compacted = []
+            for i, entry in enumerate(entries) :
+                entry_ = { field : entry[field] for field in
+                           ( "key", "name", "name_spanish") if field in entry }
+                entry_["score"] = len(entry.get( errors_field, []))
+                if i < self.JD_TOP_N :
+                    entry_.update(entry)
+                compacted.append(entry_)
+            
+            return compacted
+        
+        comps_field  = "suggested_component_inspection_order"
+        issues_field = "suggested_issue_inspection_order"
+        cover_field  = "minimal_component_cover"
+        compacted    = {
+            "messages"   : result["messages"],
+            comps_field  : compact_list( result[comps_field],
+                                         "errors_triggered_when_faulty" ),
+            issues_field : compact_list( result[issues_field],
+                                         "errors_triggered_when_present" ),
+            cover_field  : result[cover_field],
+        }
+        
+        if ( len(result[comps_field])  > self.JD_TOP_N ) \
+        or ( len(result[issues_field]) > self.JD_TOP_N ) :
+            compacted["note"] = self.JD_COMPACT_NOTE
+        
+        return compacted
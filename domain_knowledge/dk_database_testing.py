@@ -16,7 +16,8 @@ MODEL   = "T40"
 OPTIONS = { "list_messages"       : False,
             "get_joint_diagnosis" : False,
             "get_components"      : False,
-            "debug"               : True }
+            "debug"               : True,
+            "use_table"           : False }
 
 messages = {}
 messages["T40"] = {
@@ -66,7 +67,8 @@ if __name__ == "__main__" :
     
     dkdb  = DomainKnowledgeDataBase()
     dkdb.set_model(MODEL)
-    dkdb.debug = OPTIONS["debug"]
+    dkdb.debug     = OPTIONS["debug"]
+    dkdb.use_table = OPTIONS["use_table"]
     
     def show_result( label : str, error : bool, payload : Any) -> None :
         print_sep()
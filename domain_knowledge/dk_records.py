@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Domain Knowledge Runtime Records
+-----
+* Compact, read-only representation of the loaded knowledge of a drone model:
+  slotted dataclasses holding only the fields used after the model is loaded, with
+  lists turned into tuples and every key interned (so each key string is stored
+  once, however many records refer to it).
+* Built once per model from the pydantic models, which validate the files and
+  pre-serialize the tool payloads (see `DomainKnowledgeDataBase.load_records`) and
+  are then dropped.
+"""
+
+from dataclasses import dataclass
+from sys import intern
+
+from .dk_basemodels import ( DKA_Messages_File,
+                             DKB_Component,
+                             DKB_Issue,
+                             DKB_MessageEntry,
+                             DKB_SignalEntry )
+
+
+@dataclass( slots = True, frozen = True)
+class RT_Component :
+    
+    key  : str
+    risk : float
+
+@dataclass( slots = True, frozen = True)
+class RT_Issue :
+    
+    key : str
+
+@dataclass( slots = True, frozen = True)
+class RT_Signal :
+    
+    key   : str
+    path_ : tuple[ str, ...]
+
+@dataclass( slots = True, frozen = True)
+class RT_Message :
+    
+    key           : str
+    name          : str
+    name_spanish  : str | list[str] | None
+    signals       : tuple[ str, ...]    # Signal causes
+    issues        : tuple[ str, ...]    # Issue causes
+    disaggregate_ : tuple[ str, ...]    # See `dkb_parse_messages` and `disaggregations`
+
+@dataclass( slots = True, frozen = True)
+class RT_CatalogEntry :
+    """
+    Message of the catalog (DKA message, i.e., with placeholders).
+    """
+    key          : str
+    name         : str
+    name_spanish : str | list[str] | None
+
+@dataclass( slots = True, frozen = True)
+class DK_Records :
+    """
+    Runtime records of a drone model (see `build_records`).
+    """
+    comp    : dict[ str, RT_Component]
+    issu    : dict[ str, RT_Issue]
+    sign    : dict[ str, RT_Signal]
+    msgs    : dict[ str, RT_Message]
+    catalog : dict[ str, tuple[ RT_CatalogEntry, ...]]   # Partition -> messages
+
+def intern_all( values : list[str] | None) -> tuple[ str, ...] :
+    return tuple( intern(value) for value in values or () )
+
+def disaggregations( entry    : DKB_MessageEntry,
+                     dkb_msgs : dict[ str, DKB_MessageEntry] ) -> list[str] :
+    """
+    Messages a message disaggregates into: field `disaggregate_` (resolved by
+    `dkb_parse_messages`) or, for a DKB built without that step, the direct
+    `disaggregate` list restricted to existing message keys.
+    """
+    if entry.disaggregate_ is not None :
+        return entry.disaggregate_
+    
+    return [ key for key in entry.disaggregate or [] if key in dkb_msgs ]
+
+def build_records( dkb_comp  : dict[ str, DKB_Component],
+                   dkb_issu  : dict[ str, DKB_Issue],
+                   dkb_sign  : dict[ str, DKB_SignalEntry],
+                   dkb_msgs  : dict[ str, DKB_MessageEntry],
+                   dka_msgs  : dict[ str, DKA_Messages_File],
+                   prefix    : str ) -> DK_Records :
+    """
+    Runtime records of a drone model from its (validated) DKB topics and DKA
+    messages. \\
+    Args:
+        dkb_comp : DKB components
+        dkb_issu : DKB issues
+        dkb_sign : DKB signals
+        dkb_msgs : DKB messages
+        dka_msgs : DKA messages per file, flattened into the catalog partitions
+        prefix   : Prefix of the DKA message files, removed from the partition names
+    Returns:
+        DK_Records object
+    """
+    comp = { intern(key) : RT_Component( intern(key), float(entry.risk))
+             for key, entry in dkb_comp.items() }
+    issu = { intern(key) : RT_Issue(intern(key)) for key in dkb_issu }
+    sign = { intern(key) : RT_Signal( intern(key), intern_all(entry.path_))
+             for key, entry in dkb_sign.items() }
+    
+    msgs = {}
+    for key, entry in dkb_msgs.items() :
+        causes = entry.causes
+        msgs[intern(key)] = RT_Message( key           = intern(key),
+                                        name          = entry.name,
+                                        name_spanish  = entry.name_spanish,
+                                        signals       = intern_all( causes and causes.signals),
+                                        issues        = intern_all( causes and causes.issues),
+                                        disaggregate_ = intern_all(disaggregations( entry,
+                                                                                    dkb_msgs)) )
+    
+    catalog = {}
+    for file_key, dka_msgs_file in dka_msgs.items() :
+        catalog[file_key.removeprefix(prefix)] = tuple(
+            RT_CatalogEntry( intern(dka_msg.key), dka_msg.name, dka_msg.name_spanish)
+            for dka_msgs_group in dka_msgs_file
+            for dka_msg in dka_msgs_group.messages )
+    
+    return DK_Records( comp, issu, sign, msgs, catalog)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Message template matcher
+-----
+* Compile every DKA message template (key, name and Spanish name) into a pattern
+  with typed slots, one per placeholder. A slot accepts the rendered values of its
+  placeholder (e.g., '1' to '4' for `{SAME[ARM]}`, 'Left' or 'Right' for
+  `{ENG[SIDE]}`) and maps the value back to the set element.
+* Match a screen string or a (possibly misspelled) message code against the
+  templates and return the concrete DKB message key directly, without fuzzy
+  scoring the expanded catalog: exact pattern match first, else fuzzy match of the
+  template skeletons (slots masked) with slot values read from the input in order.
+"""
+
+import re
+from thefuzz import process
+from thefuzz.fuzz import ratio
+from typing import Iterable
+
+from .dk_records import RT_CatalogEntry
+from .dka_placeholder_database import ( PAT_PH,
+                                        PlaceHolderDatabase )
+
+
+SLOT_MARK = "#"
+
+# Non-alphanumeric runs (including underscores) collapse to a single space
+PAT_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize( text : str) -> str :
+    """
+    Case-folded text with punctuation, underscores and whitespace runs collapsed to
+    single spaces, so that screen strings and message codes compare alike.
+    """
+    return PAT_SEPARATORS.sub( " ", text.casefold()).strip()
+
+
+class TemplateSlot :
+    """
+    Placeholder slot: set name plus rendered value -> set elements.
+    """
+    
+    def __init__( self, set_name : str, values : dict[ str, set[str]]) -> None :
+        
+        self.set_name = set_name
+        self.values   = values
+        
+        return
+
+
+class MessageTemplate :
+    """
+    Compiled text (key or name) of a DKA message template.
+    """
+    
+    def __init__( self,
+                  key_template : str,
+                  text         : str,
+                  phDB         : PlaceHolderDatabase ) -> None :
+        
+        self.key_template = key_template
+        self.slots        : list[TemplateSlot] = []
+        
+        # Replace placeholders by sentinels that survive normalization
+        parts = []
+        last  = 0
+        for m_obj in PAT_PH.finditer(text) :
+            slot = self.make_slot( m_obj.group(1), m_obj.group(2), phDB)
+            if slot is None :
+                self.slots = None
+                return
+            parts.append(text[ last : m_obj.start() ])
+            parts.append(f" qqslot{len(self.slots)}qq ")
+            self.slots.append(slot)
+            last = m_obj.end()
+        parts.append(text[last:])
+        normalized = normalize("".join(parts))
+        
+        # Exact pattern with one group per slot, and skeleton for fuzzy matching
+        pattern  = re.escape(normalized)
+        skeleton = normalized
+        for i, slot in enumerate(self.slots) :
+            values   = sorted( slot.values, key = len, reverse = True)
+            group    = "(" + "|".join( map( re.escape, values)) + ")"
+            pattern  = pattern.replace( f"qqslot{i}qq", group)
+            skeleton = skeleton.replace( f"qqslot{i}qq", SLOT_MARK)
+        
+        self.pattern  = re.compile(pattern)
+        self.skeleton = skeleton
+        
+        return
+    
+    @staticmethod
+    def make_slot( name : str, arg : str | None, phDB : PlaceHolderDatabase
+                 ) -> TemplateSlot | None :
+        """
+        Slot of a set placeholder `{SET}` or function placeholder `{FUN[SET]}`.
+        """
+        set_name = arg or name
+        elements = phDB.set_map.get(set_name)
+        if not elements :
+            return None
+        
+        function = phDB.fun_map.get(f"{name}[{arg}]") if arg else None
+        if arg and ( function is None ) :
+            return None
+        
+        values : dict[ str, set[str]] = {}
+        for element in elements :
+            value = function[element] if function is not None else element
+            values.setdefault( normalize(str(value)), set()).add(element)
+        
+        return TemplateSlot( set_name, values)
+
+
+class MessageTemplateMatcher :
+    """
+    Matcher of screen strings and message codes against DKA message templates.
+    """
+    
+    def __init__( self,
+                  catalog   : dict[ str, tuple[ RT_CatalogEntry, ...]],
+                  phDB      : PlaceHolderDatabase,
+                  dkb_keys  : Iterable[str],
+                  min_score : int = 50 ) -> None :
+        
+        self.phDB      = phDB
+        self.dkb_keys  = set(dkb_keys)
+        self.min_score = min_score
+        
+        # Templates of every message key and name (skipping unresolvable ones)
+        self.templates : list[MessageTemplate] = []
+        for partition_entries in catalog.values() :
+            for entry in partition_entries :
+                texts = [ entry.key, entry.name ]
+                if isinstance( entry.name_spanish, list) :
+                    texts.extend(entry.name_spanish)
+                elif entry.name_spanish :
+                    texts.append(entry.name_spanish)
+                for text in texts :
+                    template = MessageTemplate( entry.key, text, phDB)
+                    if template.slots is not None :
+                        self.templates.append(template)
+        
+        # Templates per skeleton (numbered variants may share a skeleton)
+        self.skeletons : dict[ str, list[MessageTemplate]] = {}
+        for template in self.templates :
+            self.skeletons.setdefault( template.skeleton, []).append(template)
+        
+        # Every rendered slot value, to mask slot values in the input
+        slot_values = { value for template in self.templates
+                              for slot in template.slots
+                              for value in slot.values }
+        alternatives    = "|".join( map( re.escape,
+                                         sorted( slot_values, key = len, reverse = True)) )
+        self.pat_values = re.compile(fr'(?<!\S)({alternatives})(?!\S)') \
+                          if slot_values else None
+        
+        return
+    
+    def match( self, text : str) -> str | None :
+        """
+        Concrete DKB message key of a screen string or message code, or None if no
+        template matches or the slot values do not determine an existing key.
+        """
+        normalized = normalize(text)
+        if not normalized :
+            return None
+        
+        # Exact pattern match (first template wins)
+        for template in self.templates :
+            m_obj = template.pattern.fullmatch(normalized)
+            if m_obj :
+                key = self.resolve_key( template, m_obj.groups())
+                if key :
+                    return key
+        
+        # Fuzzy match of skeletons, with slot values masked in the input
+        if self.pat_values :
+            values   = self.pat_values.findall(normalized)
+            skeleton = self.pat_values.sub( SLOT_MARK, normalized)
+        else :
+            values, skeleton = [], normalized
+        
+        best = process.extractOne( query     = skeleton,
+                                   choices   = list(self.skeletons),
+                                   scorer    = ratio,
+                                   processor = None )
+        if ( not best ) or ( best[1] < self.min_score ) :
+            return None
+        
+        for template in self.skeletons[best[0]] :
+            key = self.resolve_key( template, self.slot_values( template, values))
+            if key :
+                return key
+        
+        return None
+    
+    @staticmethod
+    def slot_values( template : MessageTemplate, values : list[str]) -> list[str] | None :
+        """
+        Slot values of a template read from the input values in order. The template
+        skeleton may also contain literal words that are slot values elsewhere, which
+        are skipped.
+        """
+        if len(template.slots) == len(values) :
+            return values
+        
+        # Literal slot-like words of the template (e.g., a literal '2') in skeleton order
+        literal = [ token for token in template.skeleton.split() if token != SLOT_MARK ]
+        for token in literal :
+            if token in values :
+                values = list(values)
+                values.remove(token)
+            if len(template.slots) == len(values) :
+                return values
+        
+        return None
+    
+    def resolve_key( self,
+                     template : MessageTemplate,
+                     values   : list[str] | tuple[str] | None ) -> str | None :
+        """
+        Fill the key template with the set elements determined by the slot values.
+        """
+        if values is None :
+            return None
+        
+        # Candidate elements per set, intersected across slots of the same set
+        elements : dict[ str, set[str]] = {}
+        for slot, value in zip( template.slots, values) :
+            candidates = slot.values.get(value)
+            if not candidates :
+                return None
+            if slot.set_name in elements :
+                elements[slot.set_name] &= candidates
+            else :
+                elements[slot.set_name] = set(candidates)
+        
+        assignment = {}
+        for set_name, candidates in elements.items() :
+            if len(candidates) != 1 :
+                return None
+            assignment[set_name] = next(iter(candidates))
+        
+        # Fill set and function placeholders of the key template
+        def fill( m_obj : re.Match) -> str :
+            name, arg = m_obj.group(1,2)
+            element   = assignment.get( arg or name)
+            if element is None :
+                raise KeyError(arg or name)
+            return str(self.phDB.fun_map[f"{name}[{arg}]"][element]) if arg else element
+        
+        try :
+            key = PAT_PH.sub( fill, template.key_template)
+        except KeyError :
+            return None
+        
+        return key if key in self.dkb_keys else None
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Message text extractor
+-----
+* Multi-pattern (Aho-Corasick) automaton over the normalized names of every DKB
+  message of a drone model, in one language (English `name` or every Spanish
+  `name_spanish` alias).
+* Find every known message in arbitrary text (e.g., a block of error messages typed
+  or pasted by the user, or the OCR of a whole screen) in a single linear pass, and
+  return the message keys with their spans in the original text.
+* Matching is case, accent and punctuation insensitive, and only whole words match.
+"""
+
+import unicodedata
+from collections import deque
+from typing import Iterable
+
+
+LANGUAGES = ( "english", "spanish")
+
+
+def normalize_chars( text : str) -> tuple[ str, list[int]] :
+    """
+    Normalize text for matching: case-folded, accents stripped and every run of
+    non-alphanumeric characters (including underscores) collapsed to a single space,
+    with one space at each end. \\
+    Returns:
+        Tuple with the normalized text and, for each of its characters, the index of
+        the original character it comes from (-1 for the end spaces)
+    """
+    chars   = [ " " ]
+    offsets = [ -1 ]
+    
+    for i, char in enumerate(text) :
+        if char.isalnum() :
+            for norm_char in unicodedata.normalize( "NFKD", char.casefold()) :
+                if not unicodedata.combining(norm_char) :
+                    chars.append(norm_char)
+                    offsets.append(i)
+        elif chars[-1] != " " :
+            chars.append(" ")
+            offsets.append(i)
+    
+    if chars[-1] != " " :
+        chars.append(" ")
+        offsets.append(-1)
+    
+    return "".join(chars), offsets
+
+def normalize( text : str) -> str :
+    return normalize_chars(text)[0]
+
+
+class MessageTextExtractor :
+    """
+    Aho-Corasick automaton over normalized message names.
+    """
+    
+    def __init__( self, names : Iterable[ tuple[ str, str]]) -> None :
+        """
+        Args:
+            names : Pairs (message key, message name)
+        """
+        # Normalized name (with end spaces) -> message keys
+        self.patterns : dict[ str, list[str]] = {}
+        for key, name in names :
+            pattern = normalize(name)
+            if pattern.strip() :
+                keys = self.patterns.setdefault( pattern, [])
+                if key not in keys :
+                    keys.append(key)
+        
+        # Trie: transitions, failure links and output patterns per state
+        self.goto   : list[ dict[ str, int]] = [ {} ]
+        self.fail   : list[int]              = [ 0 ]
+        self.output : list[list[str]]        = [ [] ]
+        
+        for pattern in self.patterns :
+            state = 0
+            for char in pattern :
+                next_state = self.goto[state].get(char)
+                if next_state is None :
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(pattern)
+        
+        # Failure links in breadth-first order, merging outputs of suffix states
+        queue = deque(self.goto[0].values())
+        while queue :
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items() :
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ( char not in self.goto[fallback] ) :
+                    fallback = self.fail[fallback]
+                link = self.goto[fallback].get( char, 0)
+                self.fail[next_state]    = link if link != next_state else 0
+                self.output[next_state] += self.output[self.fail[next_state]]
+        
+        return
+    
+    def find_all( self, normalized : str) -> list[ tuple[ int, int, str]] :
+        """
+        Every occurrence (overlapping ones included) of every pattern. \\
+        Returns:
+            List of tuples (start, end, pattern) of positions in the normalized text
+        """
+        found = []
+        state = 0
+        for i, char in enumerate(normalized) :
+            while state and ( char not in self.goto[state] ) :
+                state = self.fail[state]
+            state = self.goto[state].get( char, 0)
+            for pattern in self.output[state] :
+                found.append( ( i + 1 - len(pattern), i + 1, pattern) )
+        
+        return found
+    
+    def extract( self, text : str) -> list[ dict[ str, str | list[int]]] :
+        """
+        Messages found in the text: leftmost-longest, non-overlapping occurrences. \\
+        A name shared by several messages yields one entry per message key. \\
+        Returns:
+            List of dicts with the message key, the matched text and its span
+            (start and end indices in the original text), in text order
+        """
+        normalized, offsets = normalize_chars(text)
+        
+        # Spans exclude the end spaces of the pattern, which adjacent matches share
+        found = sorted( self.find_all(normalized),
+                        key = lambda f : ( f[0], f[0] - f[1]) )
+        
+        result = []
+        last   = 0
+        for start, end, pattern in found :
+            if start < last :
+                continue
+            last       = end - 1
+            span_start = offsets[ start + 1 ]
+            span_end   = offsets[ end - 2 ] + 1
+            for key in self.patterns[pattern] :
+                result.append( { "message_code" : key,
+                                 "text"         : text[ span_start : span_end ],
+                                 "span"         : [ span_start, span_end ] } )
+        
+        return result
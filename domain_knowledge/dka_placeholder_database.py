@@ -4,10 +4,11 @@ Data structures for placeholder substitution
 """
 
 from collections import OrderedDict
-from re import ( findall,
-                 search,
-                 sub )
-from typing import Callable
+from collections.abc import Mapping
+from functools import lru_cache
+import re
+from typing import ( Any,
+                     Callable )
 
 from sofia_utils.io import load_json_file
 
@@ -17,6 +18,39 @@ RX_SET  = fr'{{{RX_NAME}}}'
 RX_ARG  = fr'\[{RX_NAME}\]'
 RX_FUN  = fr'{{{RX_NAME}{RX_ARG}}}'
 
+# Precompiled patterns. PAT_PH matches set and function placeholders in one pass:
+# group 1 is the set or function name and group 2 the function argument (if any).
+PAT_SET  = re.compile(RX_SET)
+PAT_ARG  = re.compile(RX_ARG)
+PAT_FUN  = re.compile(RX_FUN)
+PAT_PH   = re.compile(fr'{{{RX_NAME}(?:{RX_ARG})?}}')
+PAT_SAME = re.compile(fr'{{SAME{RX_ARG}}}')
+PAT_CALL = re.compile(fr'{RX_NAME}{RX_ARG}')
+
+
+@lru_cache( maxsize = 8192)
+def scan_placeholders( text : str) -> tuple[ tuple[ str, ...], tuple[ str, ...]] :
+    """
+    Single-pass scan of a string for placeholders. \\
+    Strings without '{' are skipped without running the pattern. Scans are cached,
+    since the same template strings are scanned once per set element. \\
+    Returns:
+        Tuple with the set placeholders (e.g., 'MOTOR') and the function placeholders
+        (e.g., 'ENG[SIDE]'), each in order of first appearance and without repeats.
+    """
+    if '{' not in text :
+        return (), ()
+    
+    ph_sets = {}
+    ph_funs = {}
+    for name, arg in PAT_PH.findall(text) :
+        if arg :
+            ph_funs[f"{name}[{arg}]"] = None
+        else :
+            ph_sets[name] = None
+    
+    return tuple(ph_sets), tuple(ph_funs)
+
 
 class BuiltInFunction(dict) :
     def __init__( self, function : Callable[ [str], str]) :
@@ -30,6 +64,117 @@ class BuiltInFunction(dict) :
         pass
 
 
+class CaseFunction(Mapping) :
+    """
+    Case-transformed view of a function: values are transformed on first lookup and
+    memoized.
+    """
+    
+    def __init__( self,
+                  function  : Mapping[ str, Any],
+                  transform : Callable[ [str], str] ) -> None :
+        
+        self.function  = function
+        self.transform = transform
+        self.values    : dict[ str, str] = {}
+        
+        return
+    
+    def __getitem__( self, key : str) -> str :
+        
+        value = self.values.get(key)
+        if value is None :
+            value = self.values[key] = self.transform(str(self.function[key]))
+        
+        return value
+    
+    def __iter__(self) :
+        return iter(self.function)
+    
+    def __len__(self) -> int :
+        return len(self.function)
+
+
+class FunctionMap(dict) :
+    """
+    Function map: function name to implementation, with built-in functions resolved
+    on demand (and memoized) instead of stored for every set and function:
+    * SAME[SET] is an identity function that returns its argument, for every set.
+    * <FUNCTION>_LOWER[SET] returns FUNCTION[SET] in lower case.
+    * <FUNCTION>_UPPER[SET] returns FUNCTION[SET] in upper case.
+    """
+    
+    IDENTITY   = BuiltInFunction(lambda x : x)
+    TRANSFORMS = { "_LOWER" : str.lower, "_UPPER" : str.upper }
+    
+    def __init__( self, set_map : dict[ str, list[str]]) -> None :
+        
+        super().__init__()
+        self.set_map = set_map
+        self.derived : dict[ str, CaseFunction] = {}
+        
+        return
+    
+    def resolve_base( self, fun_name : str) -> Mapping | None :
+        """
+        Declared function or SAME function.
+        """
+        if dict.__contains__( self, fun_name) :
+            return dict.__getitem__( self, fun_name)
+        
+        if fun_name.startswith("SAME[") :
+            m_obj = PAT_CALL.fullmatch(fun_name)
+            if m_obj and ( m_obj.group(2) in self.set_map ) :
+                return self.IDENTITY
+        
+        return None
+    
+    def resolve( self, fun_name : str) -> Mapping | None :
+        """
+        Declared, SAME or case-transformed function (None if there is none).
+        """
+        function = self.resolve_base(fun_name)
+        if function is not None :
+            return function
+        
+        function = self.derived.get(fun_name)
+        if function is not None :
+            return function
+        
+        m_obj = PAT_CALL.fullmatch(fun_name)
+        if not m_obj :
+            return None
+        name, arg = m_obj.group(1,2)
+        suffix    = name[-6:]
+        if suffix not in self.TRANSFORMS :
+            return None
+        
+        base = self.resolve_base(f"{name[:-6]}[{arg}]")
+        if base is None :
+            return None
+        
+        function = self.derived[fun_name] = CaseFunction( base, self.TRANSFORMS[suffix])
+        
+        return function
+    
+    def __missing__( self, fun_name : str) -> Mapping :
+        
+        function = self.resolve(fun_name)
+        if function is None :
+            raise KeyError(fun_name)
+        
+        return function
+    
+    def __contains__( self, fun_name : object) -> bool :
+        return isinstance( fun_name, str) and ( self.resolve(fun_name) is not None )
+    
+    def get( self, fun_name : str, default : Any = None) -> Any :
+        
+        function = self.resolve(fun_name)
+        
+        return default if function is None else function
+
+
 class PlaceHolderDatabase:
     """
     Convenience object for storing all placeholder data
@@ -48,7 +193,8 @@ class PlaceHolderDatabase:
         self.sub_map : dict[ str, list[str]] = {}
         # Function map: Function name to implementation (dict).
         # Implementation is a dict mapping a set element to function(element).
-        self.fun_map : dict[ str, dict[ str, str]] = {}
+        # Built-in functions are resolved on demand (see `FunctionMap`).
+        self.fun_map : FunctionMap = FunctionMap(self.set_map)
         
         # Build set map
         sets_data = data.get( 'sets', {})
@@ -119,45 +265,6 @@ class PlaceHolderDatabase:
         if funs_of_subsets :
             self.fun_map.update(funs_of_subsets)
         
-        # Add built-in functions
-        self.add_built_in_functions()
-        
-        return
-    
-    def add_built_in_functions( self) -> None :
-        """
-        Add built-in functions.
-        SAME[SET] is an identity function that returns its argument.
-        <FUNCTION>_LOWER[SET] returns FUNCTION[SET] in lower case.
-        <FUNCTION>_UPPER[SET] returns FUNCTION[SET] in upper case.
-        """
-        # Add SAME functions (one for each set)
-        for set_name in self.set_map :
-            same_func_name = f"SAME[{set_name}]"
-            self.fun_map[same_func_name] = BuiltInFunction(lambda x: x)
-        # Initialize list of additional functions
-        list_add_funs = []
-        # Add lower-case function versions
-        for fun_name, fun_dict in self.fun_map.items() :
-            m_obj = search( RX_FUN, f"{{{fun_name}}}")
-            fun_name, arg_name = m_obj.group(1,2)
-            new_func_name = f"{fun_name}_LOWER[{arg_name}]"
-            new_func_dict = {}
-            for key, val in fun_dict.items() :
-                new_func_dict[key] = str(val).lower()
-            list_add_funs.append( ( new_func_name, new_func_dict) )
-        # Add upper-case function versions
-        for fun_name, fun_dict in self.fun_map.items() :
-            m_obj = search( RX_FUN, f"{{{fun_name}}}")
-            fun_name, arg_name = m_obj.group(1,2)
-            new_func_name = f"{fun_name}_UPPER[{arg_name}]"
-            new_func_dict = {}
-            for key, val in fun_dict.items() :
-                new_func_dict[key] = str(val).upper()
-            list_add_funs.append( ( new_func_name, new_func_dict) )
-        # Insert additional functions into functions map
-        for fun_name, fun_implementation in list_add_funs :
-            self.fun_map[fun_name] = fun_implementation
         return
     
     def apply_ph( self,
@@ -229,12 +336,7 @@ class PlaceHolderDatabase:
     @staticmethod
     def contains_placeholders( data : str | int | float | list | dict) -> bool :
         if isinstance( data, str) :
-            match = search( RX_SET, data)
-            if match :
-                return True
-            match = search( RX_FUN, data)
-            if match :
-                return True
+            return ( '{' in data ) and ( PAT_PH.search(data) is not None )
         elif isinstance( data, int) or isinstance( data, float) :
             return False
         elif isinstance( data, list) :
@@ -264,7 +366,7 @@ class PlaceHolderDatabase:
                     result.append(item)
         else:
             raise ValueError(f"In eval_apply_funs: Invalid argument type: {type(data)}")
-
+        
         return result
     
     def get_arg_set( self, fun_call : str) -> str | None :
@@ -272,7 +374,7 @@ class PlaceHolderDatabase:
         Extract the argument set name from a function call.
         For example, from "ENG[SIDE]" extract "SIDE".
         """
-        match = search( RX_ARG, fun_call)
+        match = PAT_ARG.search(fun_call)
         return match.group(1) if match else None
     
     def get_first_placeholder( self, 
@@ -314,26 +416,26 @@ class PlaceHolderDatabase:
         """
         Get all placeholder sets in data, recursively searching through lists and dicts
         """
-        ph_sets = set()
+        ph_sets = {}
         
         if isinstance( data, str) :
-            found_sets = findall( RX_SET, data)
+            found_sets, _ = scan_placeholders(data)
             for ph in found_sets :
                 if ph not in self.set_map :
                     print(f"Error: Set '{ph}' not found in signatures")
-                ph_sets.add(ph)
+            return list(found_sets)
         
         elif isinstance( data, list) :
             for item in data :
                 item_sets = self.get_placeholder_sets( item)
-                ph_sets.update( item_sets)
+                ph_sets.update( dict.fromkeys(item_sets))
         
         elif isinstance( data, dict) :
             for key, val in data.items() :
                 key_sets = self.get_placeholder_sets( key)
                 val_sets = self.get_placeholder_sets( val)
-                ph_sets.update( key_sets)
-                ph_sets.update( val_sets)
+                ph_sets.update( dict.fromkeys(key_sets))
+                ph_sets.update( dict.fromkeys(val_sets))
         
         return list(ph_sets)
     
@@ -341,27 +443,26 @@ class PlaceHolderDatabase:
         """
         Get all placeholder functions in data, recursively searching through lists and dicts
         """
-        ph_funs = set()
+        ph_funs = {}
         
         if isinstance( data, str) :
-            found_funs = findall( RX_FUN, data)
-            ph_funs_full = [f"{func_name}[{arg_name}]" for func_name, arg_name in found_funs]
-            for ph in ph_funs_full :
+            _, found_funs = scan_placeholders(data)
+            for ph in found_funs :
                 if ph not in self.fun_map :
                     print(f"Error: Function '{ph}' not found in signatures")
-                ph_funs.add(ph)
+            return list(found_funs)
         
         elif isinstance( data, list) :
             for item in data :
                 item_funs = self.get_placeholder_funs( item)
-                ph_funs.update( item_funs)
+                ph_funs.update( dict.fromkeys(item_funs))
         
         elif isinstance( data, dict) :
             for key, val in data.items() :
                 key_funs = self.get_placeholder_funs( key)
                 val_funs = self.get_placeholder_funs( val)
-                ph_funs.update( key_funs)
-                ph_funs.update( val_funs)
+                ph_funs.update( dict.fromkeys(key_funs))
+                ph_funs.update( dict.fromkeys(val_funs))
         
         return list(ph_funs)
     
@@ -395,7 +496,7 @@ class PlaceHolderDatabase:
                 return False
         # No check failed so subset is valid
         return True
-
+    
     def is_valid_fun( self, fun_name : str, fun_dict : dict) -> bool :
         """
         Check placeholder declaration for correctness: functions
@@ -416,7 +517,10 @@ class PlaceHolderDatabase:
     @staticmethod
     def pseudo_XML( data : str) -> str :
         
-        result = sub( fr'{{SAME{RX_ARG}}}', r'{\1}', data)
-        result = sub( RX_SET, r'<\1>', result)
+        if '{' not in data :
+            return data
+        
+        result = PAT_SAME.sub( r'{\1}', data)
+        result = PAT_SET.sub( r'<\1>', result)
         
         return result
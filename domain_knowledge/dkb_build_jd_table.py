@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+DKB Materialized Joint Diagnoses
+-----
+* Compute the (verbose) joint diagnosis of every single message key of a drone
+  model, and of every frequent combination of message keys listed in
+  `<MODEL>_dka/jd_combinations.json` (a list of lists of message keys).
+* Store them in `<MODEL>_dkb/jd_table.json`, together with the fingerprint of the
+  DKB files and of the joint diagnosis code. `DomainKnowledgeDataBase` answers these
+  queries with a lookup, and ignores the table if the fingerprint does not match.
+* Must run after every other DKB build step (see `dk_processing.sh`).
+"""
+
+import json
+import os
+import sys
+
+from sofia_utils.io import load_json_file
+from sofia_utils.printing import print_ind
+
+from .dk_database import DomainKnowledgeDataBase
+
+
+COMBINATIONS_NAME = "jd_combinations.json"
+
+
+def build_jd_table( model : str) -> dict[ str, dict] :
+    
+    dkdb = DomainKnowledgeDataBase()
+    dkdb.set_model(model)
+    
+    # Single message keys plus frequent combinations
+    queries = [ [ msg_key ] for msg_key in dkdb.dkb_msgs ]
+    path_combinations = dkdb.dir_dka / COMBINATIONS_NAME
+    if path_combinations.exists() :
+        for combination in load_json_file(path_combinations) :
+            invalid = [ msg_key for msg_key in combination if msg_key not in dkdb.dkb_msgs ]
+            if invalid :
+                print_ind( f"⚠️ Skipping combination {combination}: "
+                           f"invalid message keys {invalid}", 1)
+                continue
+            queries.append(list(combination))
+    
+    results = {}
+    for messages in queries :
+        _, result = dkdb.compute_joint_diagnosis( messages, verbose = True)
+        results[dkdb.jd_table_key(messages)] = result
+    
+    return { "fingerprint" : dkdb.dkb_fingerprint(),
+             "results"     : results }
+
+if __name__ == "__main__" :
+    
+    if len(sys.argv) < 2 :
+        script_name = os.path.basename(sys.argv[0]) \
+                      if sys.argv else 'dkb_build_jd_table.py'
+        print_ind(f'Usage: python {script_name} <model>')
+        raise SystemExit(1)
+    
+    model = sys.argv[1]
+    if model not in DomainKnowledgeDataBase.MODELS_AVAILABLE :
+        print_ind(f'Invalid model: {model}')
+        raise SystemExit(1)
+    
+    print_ind(f'MATERIALIZING JOINT DIAGNOSES OF MODEL: {model}')
+    
+    table = build_jd_table(model)
+    path  = DomainKnowledgeDataBase().dk_dir / f"{model}_dkb" \
+          / DomainKnowledgeDataBase.JD_TABLE_NAME
+    with open( path, "w", encoding = "utf-8") as f :
+        json.dump( table, f, ensure_ascii = False, separators = ( ",", ":"))
+    
+    print_ind( f'Wrote {len(table["results"])} joint diagnoses to {path}', 1)
@@ -19,6 +19,8 @@ from .dk_basemodels import ( DKB_Component,
                              DKB_SignalEntry,
                              DKB_MessageEntry )
 from .dkb_graph import ComponentsGraph
+from .dkb_parse_messages import ( disaggregation_closure,
+                                  find_disaggregation_cycles )
 
 
 def load_components( dir_input     : str,
@@ -335,6 +337,7 @@ def run_messages_check( dir_input  : str,
     seen_issues   : set[str] = set()
     seen_signals  : set[str] = set()
     disagg_checks : list[ tuple[ str, list[str]]] = []
+    disagg_closed : dict[ str, list[str] | None]  = {}
     
     for filename in filenames :
         
@@ -380,6 +383,7 @@ def run_messages_check( dir_input  : str,
             
             if message_entry.disaggregate :
                 disagg_checks.append( ( msg_key, message_entry.disaggregate) )
+                disagg_closed[msg_key] = message_entry.disaggregate_
         
         if not errors_found :
             print_ind( "✅ Messages file passed validation", 1)
@@ -390,6 +394,16 @@ def run_messages_check( dir_input  : str,
                 print_ind( f"⚠️ Message {msg_key}, in 'disaggregate': "
                            f"invalid message key: {disagg_key}", 1)
     
+    relations = dict(disagg_checks)
+    relations.update( { msg_key : [] for msg_key in seen_msg_keys
+                                     if msg_key not in relations } )
+    for cycle in find_disaggregation_cycles(relations) :
+        print_ind( f"❌ Disaggregation cycle: {" -> ".join(cycle)}", 1)
+    for msg_key, closure in disagg_closed.items() :
+        if closure != disaggregation_closure( msg_key, relations) :
+            print_ind( f"⚠️ Message {msg_key}: 'disaggregate_' is missing or stale "
+                       f"(run dkb_parse_messages)", 1)
+    
     for issue_key in sorted( set(issues.keys()) - seen_issues ) :
         print_ind( f"⚠️ Issue {issue_key} does not appear in any message", 1)
     
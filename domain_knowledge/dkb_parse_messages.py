@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+DKB Message Relations Parsers
+-----
+* Resolve the transitive closure of the `disaggregate` relations of every message
+  (children, grandchildren and so on, in depth-first order and without repeats) and
+  store it in field `disaggregate_`, so that joint diagnoses expand messages with a
+  plain lookup.
+* Child keys that are not message keys are skipped, and cycles are cut (and
+  reported by `dkb_checkers`).
+"""
+
+import os
+import sys
+
+from sofia_utils.io import ( load_json_file,
+                             list_files_starting_with,
+                             write_to_json_file )
+from sofia_utils.printing import print_ind
+
+
+def disaggregation_closure( msg_key   : str,
+                            relations : dict[ str, list[str]] ) -> list[str] :
+    """
+    Messages a message disaggregates into, directly or transitively, in depth-first
+    order. Keys missing from `relations` are skipped.
+    """
+    closure = []
+    visited = { msg_key }
+    stack   = list(reversed(relations.get( msg_key) or []))
+    while stack :
+        child = stack.pop()
+        if ( child in visited ) or ( child not in relations ) :
+            continue
+        visited.add(child)
+        closure.append(child)
+        stack.extend(reversed(relations.get(child) or []))
+    
+    return closure
+
+def find_disaggregation_cycles( relations : dict[ str, list[str]]) -> list[list[str]] :
+    """
+    Cycles of the `disaggregate` relations, each as a list of message keys starting
+    and ending with the same key.
+    """
+    cycles = []
+    state  : dict[ str, int] = {}   # 1 = on the current path, 2 = done
+    
+    for root in relations :
+        if root in state :
+            continue
+        path  = [ root ]
+        stack = [ iter(relations.get(root) or []) ]
+        state[root] = 1
+        while stack :
+            child = next( stack[-1], None)
+            if child is None :
+                state[path.pop()] = 2
+                stack.pop()
+            elif state.get(child) == 1 :
+                cycles.append( path[ path.index(child) : ] + [ child ] )
+            elif ( child not in state ) and ( child in relations ) :
+                state[child] = 1
+                path.append(child)
+                stack.append(iter(relations.get(child) or []))
+    
+    return cycles
+
+def compute_disaggregations( data_messages : dict) -> None :
+    
+    relations = { msg_key : item.get('disaggregate') or []
+                  for msg_key, item in data_messages.items() }
+    
+    for msg_key, item in data_messages.items() :
+        item.pop( 'disaggregate_', None)
+        if item.get('disaggregate') :
+            item['disaggregate_'] = disaggregation_closure( msg_key, relations)
+    
+    return
+
+if __name__ == "__main__" :
+    
+    if len(sys.argv) < 2 :
+        script_name = os.path.basename(sys.argv[0]) \
+                      if sys.argv else 'dkb_parse_messages.py'
+        print_ind(f'Usage: python {script_name} <input_dir>')
+        raise SystemExit(1)
+    
+    dir_input = sys.argv[1]
+    
+    print_ind(f'PROCESSING MESSAGE RELATIONS IN: {dir_input}')
+    
+    # Load messages (relations may cross files)
+    filenames     = list_files_starting_with( dir_input, 'messages_', 'json')
+    data_files    = { filename_ : load_json_file(filename_) for filename_ in filenames }
+    data_messages = {}
+    for data_file in data_files.values() :
+        data_messages.update(data_file)
+    
+    # Resolve disaggregations (entries are shared with the file data)
+    compute_disaggregations(data_messages)
+    for filename_, data_file in data_files.items() :
+        print_ind(f'Processing file: {filename_}')
+        write_to_json_file( filename_, data_file)
+        print_ind( 'Disaggregations resolved', 1)
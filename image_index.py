@@ -0,0 +1,145 @@
+"""
+Image Index
+-----
+* Compute a perceptual difference hash (dHash) for every image analysed by the
+  image agent, so that resends of the same screenshot (re-compressed, re-scaled
+  or slightly cropped by WhatsApp) land within a small Hamming distance.
+* Store each hash together with the image agent's response, scoped per user and
+  drone model, in a local SQLite database.
+* Look up the closest earlier analysis so it can be reused instead of calling
+  the vision model again.
+"""
+
+import time
+from io import BytesIO
+from pathlib import Path
+from PIL import ( Image,
+                  UnidentifiedImageError )
+
+from sqlite_store import ( db_path_from_env,
+                           SQLiteStore )
+
+
+# Set image index database path
+IMAGE_INDEX_DB_PATH = db_path_from_env( "IMAGE_INDEX", "image_index.sqlite3")
+
+
+def compute_dhash( image_bytes : bytes, hash_size : int = 8) -> int | None :
+    """
+    Compute the difference hash of an image. \\
+    The image is converted to grayscale and shrunk to `(hash_size + 1) x hash_size`
+    pixels; each bit records whether a pixel is brighter than its right neighbour. \\
+    Args:
+        image_bytes : Raw image file contents
+        hash_size   : Number of rows (and bits per row) of the hash
+    Returns:
+        Hash as an integer with `hash_size ** 2` bits, or None if the bytes could
+        not be decoded as an image.
+    """
+    try :
+        with Image.open(BytesIO(image_bytes)) as image :
+            image = image.convert("L").resize( ( hash_size + 1, hash_size),
+                                               Image.Resampling.LANCZOS )
+            pixels = image.tobytes()
+    except ( UnidentifiedImageError, OSError, ValueError) :
+        return None
+    
+    result = 0
+    for row in range(hash_size) :
+        row_start = row * ( hash_size + 1 )
+        for col in range(hash_size) :
+            left  = pixels[ row_start + col ]
+            right = pixels[ row_start + col + 1 ]
+            result = ( result << 1 ) | int( left > right )
+    
+    return result
+
+def hamming_distance( hash_a : int, hash_b : int) -> int :
+    return ( hash_a ^ hash_b ).bit_count()
+
+
+class ImageIndex(SQLiteStore) :
+    """
+    Perceptual-hash index of analysed images, scoped per user and drone model.
+    """
+    
+    MAX_DISTANCE = 6    # Max Hamming distance (out of 64 bits) to count as a resend
+    MAX_ENTRIES  = 200  # Max entries kept per (user, model) pair
+    
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS image_index (
+            user      TEXT    NOT NULL,
+            model     TEXT    NOT NULL,
+            phash     TEXT    NOT NULL,
+            response  TEXT    NOT NULL,
+            timestamp REAL    NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS image_index_user_model
+        ON image_index ( user, model, timestamp )
+        """ )
+    
+    def __init__( self, db_path : str | Path = IMAGE_INDEX_DB_PATH) -> None :
+        
+        super().__init__(db_path)
+        
+        return
+    
+    def lookup( self,
+                user  : str,
+                model : str,
+                phash : int
+              ) -> tuple[ str, int] | None :
+        """
+        Find the closest earlier image for this user and model. \\
+        Returns:
+            Tuple with the stored response and its Hamming distance to `phash`,
+            or None if no stored hash is within `MAX_DISTANCE`.
+        """
+        with self.connect() as conn :
+            rows = conn.execute(
+                """
+                SELECT phash, response FROM image_index
+                WHERE user = ? AND model = ?
+                ORDER BY timestamp DESC
+                """, ( user, model) ).fetchall()
+        
+        best = None
+        for phash_hex, response in rows :
+            distance = hamming_distance( phash, int( phash_hex, 16))
+            if ( distance <= self.MAX_DISTANCE ) \
+            and ( ( best is None ) or ( distance < best[1] ) ) :
+                best = ( response, distance)
+                if distance == 0 :
+                    break
+        
+        return best
+    
+    def insert( self,
+                user     : str,
+                model    : str,
+                phash    : int,
+                response : str ) -> None :
+        """
+        Store the response for an image and prune the oldest entries beyond
+        `MAX_ENTRIES` for this user and model.
+        """
+        with self.connect() as conn :
+            conn.execute(
+                """
+                INSERT INTO image_index ( user, model, phash, response, timestamp)
+                VALUES ( ?, ?, ?, ?, ?)
+                """, ( user, model, f"{phash:016x}", response, time.time()) )
+            conn.execute(
+                """
+                DELETE FROM image_index
+                WHERE user = ? AND model = ? AND rowid NOT IN (
+                    SELECT rowid FROM image_index
+                    WHERE user = ? AND model = ?
+                    ORDER BY timestamp DESC LIMIT ?
+                )
+                """, ( user, model, user, model, self.MAX_ENTRIES) )
+        
+        return
@@ -0,0 +1,148 @@
+"""
+Metrics
+-----
+* Time CaseHandler FSM actions and their sub-phases (agent calls, tool calls,
+  image fetches, message sends) with spans, tagged by span name, FSM state, drone
+  model and agent.
+* Aggregate span durations in process as Prometheus histograms and export them to
+  a local text file in the Prometheus exposition format (e.g., for the textfile
+  collector of `node_exporter`).
+* The file is rewritten atomically at most once every `METRICS_FLUSH_SECONDS` and
+  on exit. Forked worker processes (see `run_queue_worker`) each export their own
+  file, with a `worker` label.
+"""
+
+import atexit
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from threading import ( get_ident,
+                        Lock )
+
+from sofia_utils.io import ensure_dir
+
+
+# Set metrics file path and flush period
+METRICS_DIR           = os.getenv( "METRICS_DIR", str(Path(__file__).parent))
+METRICS_NAME          = os.getenv( "METRICS_NAME", "metrics.prom")
+METRICS_PATH          = Path(METRICS_DIR).expanduser().resolve() / Path(METRICS_NAME)
+METRICS_FLUSH_SECONDS = float(os.getenv( "METRICS_FLUSH_SECONDS", "10"))
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = ( 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0 )
+
+LABELS = ( "span", "state", "model", "agent")
+
+
+class SpanMetrics :
+    """
+    Histograms of span durations per label set, exported as a Prometheus text file.
+    """
+    
+    METRIC = "casehandler_span_seconds"
+    
+    def __init__( self,
+                  path          : str | Path = METRICS_PATH,
+                  flush_seconds : float      = METRICS_FLUSH_SECONDS ) -> None :
+        
+        self.path          = Path(path)
+        self.flush_seconds = flush_seconds
+        self.last_flush    = time.monotonic()
+        self.lock          = Lock()
+        self.worker        = None
+        
+        # Label values -> [ bucket counts, sum, count ]
+        self.histograms : dict[ tuple[ str, ...], list] = {}
+        
+        return
+    
+    def set_worker( self, worker : str) -> None :
+        """
+        Tag the metrics of a forked worker process with label `worker` and export them
+        to a file of their own (e.g., `metrics.2.prom`), dropping anything recorded
+        before the fork.
+        """
+        with self.lock :
+            self.worker = worker
+            self.path   = self.path.with_name(f"{self.path.stem}.{worker}{self.path.suffix}")
+            self.histograms.clear()
+        
+        return
+    
+    def observe( self, seconds : float, **labels : str | None) -> None :
+        
+        key = tuple( labels.get(label) or "" for label in LABELS )
+        
+        with self.lock :
+            hist = self.histograms.get(key)
+            if hist is None :
+                hist = self.histograms[key] = [ [0] * len(BUCKETS), 0.0, 0 ]
+            for i, bound in enumerate(BUCKETS) :
+                if seconds <= bound :
+                    hist[0][i] += 1
+            hist[1] += seconds
+            hist[2] += 1
+        
+        return
+    
+    @contextmanager
+    def span( self, name : str, **labels : str | None) :
+        """
+        Time the enclosed block and record it under span `name`, even if it raises.
+        """
+        start = time.perf_counter()
+        try :
+            yield
+        finally :
+            self.observe( time.perf_counter() - start, span = name, **labels)
+    
+    def render(self) -> str :
+        """
+        Histograms in the Prometheus text exposition format.
+        """
+        lines = [ f"# HELP {self.METRIC} Duration of CaseHandler FSM actions and phases",
+                  f"# TYPE {self.METRIC} histogram" ]
+        
+        with self.lock :
+            items = sorted( ( key, ( list(hist[0]), hist[1], hist[2]) )
+                            for key, hist in self.histograms.items() )
+        
+        worker = f'worker="{escape(self.worker)}",' if self.worker else ""
+        for key, ( buckets, total, count ) in items :
+            labels = worker + ",".join( f'{label}="{escape(value)}"'
+                                        for label, value in zip( LABELS, key) )
+            for bound, n in zip( BUCKETS, buckets) :
+                lines.append(f'{self.METRIC}_bucket{{{labels},le="{bound}"}} {n}')
+            lines.append(f'{self.METRIC}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.METRIC}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{self.METRIC}_count{{{labels}}} {count}")
+        
+        return "\n".join(lines) + "\n"
+    
+    def flush( self, force : bool = False) -> None :
+        """
+        Write the metrics file (atomically), unless it was written less than
+        `flush_seconds` ago and `force` is False.
+        """
+        with self.lock :
+            now = time.monotonic()
+            if ( not force ) and ( now - self.last_flush < self.flush_seconds ) :
+                return
+            self.last_flush = now
+        
+        ensure_dir(self.path.parent)
+        path_tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.{get_ident()}.tmp")
+        path_tmp.write_text( self.render(), encoding = "utf-8")
+        os.replace( path_tmp, self.path)
+        
+        return
+
+
+def escape( value : str) -> str :
+    return value.replace( "\\", "\\\\").replace( '"', '\\"').replace( "\n", "\\n")
+
+
+# Metrics shared by all case handlers of the process
+METRICS = SpanMetrics()
+atexit.register( METRICS.flush, True)
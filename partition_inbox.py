@@ -0,0 +1,98 @@
+"""
+Partition Inbox
+-----
+* Hand queued messages from the dispatcher of `run_queue_worker` to the worker of
+  each user's partition through a local SQLite database, so that handing off never
+  blocks on a busy worker (whatever the size of the media) and messages survive
+  worker crashes and supervisor restarts.
+* Each partition has a single consumer, which takes its oldest message, processes it
+  and only then deletes it (at-least-once delivery, in order). A message whose worker
+  died while processing it is processed again by the restarted worker;
+  `CaseHandler.dedup_and_ingest_message` drops it if it was already ingested.
+"""
+
+import pickle
+import time
+from pathlib import Path
+from typing import Any
+
+from sqlite_store import ( db_path_from_env,
+                           SQLiteStore )
+
+
+# Set partition inbox database path
+INBOX_DB_PATH = db_path_from_env( "INBOX", "inbox.sqlite3")
+
+
+class PartitionInbox(SQLiteStore) :
+    """
+    Messages waiting for the worker of their partition, in a local SQLite database.
+    """
+    
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS inbox (
+            id        INTEGER PRIMARY KEY AUTOINCREMENT,
+            partition INTEGER NOT NULL,
+            timestamp REAL    NOT NULL,
+            item      BLOB    NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS inbox_partition
+        ON inbox ( partition, id )
+        """ )
+    
+    def __init__( self, db_path : str | Path = INBOX_DB_PATH) -> None :
+        
+        super().__init__(db_path)
+        
+        return
+    
+    def put( self, partition : int, item : Any) -> None :
+        """
+        Append an item (any picklable object) to the inbox of a partition.
+        """
+        with self.connect() as conn :
+            conn.execute( "INSERT INTO inbox ( partition, timestamp, item) VALUES ( ?, ?, ?)",
+                          ( partition, time.time(), pickle.dumps(item)) )
+        
+        return
+    
+    def next( self, partition : int) -> tuple[ int, Any] | None :
+        """
+        Oldest item of a partition, left in the inbox until `done` is called. \\
+        Returns:
+            Tuple (item id, item), or None if the inbox of the partition is empty
+        """
+        with self.connect() as conn :
+            row = conn.execute( "SELECT id, item FROM inbox WHERE partition = ? "
+                                "ORDER BY id LIMIT 1",
+                                ( partition,) ).fetchone()
+        
+        if not row :
+            return None
+        
+        return row[0], pickle.loads(row[1])
+    
+    def done( self, item_id : int) -> None :
+        """
+        Delete a processed item.
+        """
+        with self.connect() as conn :
+            conn.execute( "DELETE FROM inbox WHERE id = ?", ( item_id,) )
+        
+        return
+    
+    def depth( self, partition : int | None = None) -> int :
+        """
+        Number of items waiting (in one partition, or in all of them).
+        """
+        with self.connect() as conn :
+            if partition is None :
+                row = conn.execute("SELECT COUNT(*) FROM inbox").fetchone()
+            else :
+                row = conn.execute( "SELECT COUNT(*) FROM inbox WHERE partition = ?",
+                                    ( partition,) ).fetchone()
+        
+        return row[0]
@@ -1,6 +1,22 @@
 #!/usr/bin/env python3
 """
 Import and run the app's queue worker
+-----
+* With `QUEUE_WORKERS` = 1 (default), run a single queue worker in this process.
+* With `QUEUE_WORKERS` > 1, run as a preforking supervisor: load everything case
+  handlers share (see `CaseHandler.preload`), freeze it out of the garbage
+  collector and fork the workers, which then keep it in shared copy-on-write
+  pages. Dead workers are replaced, and SIGTERM/SIGINT are forwarded to them.
+* Users are partitioned across workers (CRC32 of the user id modulo the number of
+  workers): a single forked dispatcher drains the queue, in queue order, and hands
+  every message to the worker of its user through the partition inbox (see
+  `partition_inbox`). Hence no message is claimed twice and the messages of a user
+  are processed one at a time and in order, whatever the claim semantics of
+  `QueueDB` under concurrent consumers. Handing off never waits for a busy worker,
+  and a message leaves the inbox only once its worker has processed it.
+* The supervisor logs the unique and shared memory of every worker (from
+  `/proc/<pid>/smaps_rollup`) and the inbox depth of every partition every
+  `MEMORY_REPORT_SECONDS`.
 """
 
 import gc
@@ -8,10 +24,17 @@ import logging
 import os
 import signal
 import sys
+import time
+import zlib
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import Callable
 
 from sofia_utils.io import ensure_dir
+from wa_agents.basemodels import ( MediaContent,
+                                   WhatsAppContact,
+                                   WhatsAppMetaData,
+                                   WhatsAppMsg )
 from wa_agents.queue_db import QueueDB
 
 # Load enviroment variables to be used by QueueWorker and CaseHandler
@@ -19,6 +42,8 @@ load_dotenv()
 
 from wa_agents.queue_worker import QueueWorker
 from casehandler import CaseHandler
+from metrics import METRICS
+from partition_inbox import PartitionInbox
 
 
 # Set queue database path
@@ -27,25 +52,267 @@ QUEUE_DB_NAME = os.getenv( "QUEUE_DB_NAME", "queue.sqlite3")
 QUEUE_DB_PATH = Path(QUEUE_DB_DIR).expanduser().resolve() / Path(QUEUE_DB_NAME)
 ensure_dir(QUEUE_DB_PATH.parent)
 
+# Set number of worker processes and memory report period
+QUEUE_WORKERS         = int(os.getenv( "QUEUE_WORKERS", "1"))
+MEMORY_REPORT_SECONDS = float(os.getenv( "MEMORY_REPORT_SECONDS", "300"))
 
-# Instantiate and run queue worker
-def main() -> int :
+# Seconds to wait before replacing a dead worker
+RESPAWN_DELAY = 1.0
+# Seconds between checks of an empty partition inbox (and for a stop signal)
+POLL_SECONDS  = 0.1
+
+
+def serve() -> int :
+    """
+    Run a queue worker until SIGTERM or SIGINT.
+    """
+    queue  = QueueDB(QUEUE_DB_PATH)
+    worker = QueueWorker( queue, CaseHandler)
     
-    logging.basicConfig( level  = logging.INFO,
-                         format = "%(asctime)s %(levelname)s %(message)s")
+    signal.signal( signal.SIGTERM, worker.stop)
+    signal.signal( signal.SIGINT,  worker.stop)
+    
+    worker.serve_forever()
+    
+    gc.collect()
+    
+    return 0
+
+def partition( user_id : str, n_partitions : int) -> int :
+    """
+    Partition (worker index) of a user, stable across processes and restarts.
+    """
+    return zlib.crc32(user_id.encode()) % n_partitions
+
+
+class PartitionDispatcher :
+    """
+    Stand-in for `CaseHandler` in the dispatcher's queue worker: puts every message
+    in the inbox of its user's partition (see `serve_partition`) and leaves the
+    response to the partition's worker.
+    """
+    
+    # Partition inbox and number of partitions (see `dispatch`)
+    inbox        : PartitionInbox | None = None
+    n_partitions : int                   = 1
+    
+    def __init__( self,
+                  operator : WhatsAppMetaData,
+                  user     : WhatsAppContact,
+                  debug    : bool = False ) -> None :
+        
+        self.operator = operator
+        self.user     = user
+        
+        return
+    
+    def process_message( self,
+                         message       : WhatsAppMsg,
+                         media_content : MediaContent | None = None
+                       ) -> bool :
+        
+        index = partition( self.user.wa_id, self.n_partitions)
+        self.inbox.put( index, ( self.operator, self.user, message, media_content))
+        
+        return False
+    
+    def generate_response( self,
+                           max_tokens : int | None = None ) -> bool :
+        
+        return False
+
+
+def dispatch( n_partitions : int) -> int :
+    """
+    Drain the queue until SIGTERM or SIGINT, handing every message to the worker of
+    its user (see `PartitionDispatcher`).
+    """
+    PartitionDispatcher.inbox        = PartitionInbox()
+    PartitionDispatcher.n_partitions = n_partitions
     
     queue  = QueueDB(QUEUE_DB_PATH)
-    worker = QueueWorker( queue, CaseHandler)
+    worker = QueueWorker( queue, PartitionDispatcher)
     
     signal.signal( signal.SIGTERM, worker.stop)
     signal.signal( signal.SIGINT,  worker.stop)
     
     worker.serve_forever()
     
+    return 0
+
+def serve_partition( index : int) -> int :
+    """
+    Process the messages of partition `index` (see `PartitionDispatcher`), one at a
+    time and in the order received, as the queue worker would, until SIGTERM or
+    SIGINT. A message is removed from the inbox only after it is processed.
+    """
+    inbox    = PartitionInbox()
+    stopping = False
+    
+    def stop( signum : int, _frame) -> None :
+        nonlocal stopping
+        stopping = True
+        return
+    
+    signal.signal( signal.SIGTERM, stop)
+    signal.signal( signal.SIGINT,  stop)
+    
+    while not stopping :
+        entry = inbox.next(index)
+        if entry is None :
+            time.sleep(POLL_SECONDS)
+            continue
+        item_id, ( operator, user, message, media_content ) = entry
+        try :
+            handler = CaseHandler( operator, user)
+            if handler.process_message( message, media_content) :
+                while handler.generate_response() :
+                    pass
+        except Exception :
+            logging.exception(f"Failed to process message of user {user.wa_id}")
+        inbox.done(item_id)
+    
+    gc.collect()
+    
+    return 0
+
+def memory_usage( pid : int) -> dict[ str, int] | None :
+    """
+    Memory of a process in kB: resident (`rss`), proportional (`pss`), unique to the
+    process (`unique`, i.e., private pages) and shared with other processes
+    (`shared`, e.g., copy-on-write pages of the supervisor). \\
+    Returns:
+        Dict of sizes, or None if unavailable (e.g., not on Linux)
+    """
+    fields = {}
+    try :
+        with open(f"/proc/{pid}/smaps_rollup") as f :
+            for line in f :
+                parts = line.split()
+                if ( len(parts) == 3 ) and ( parts[2] == "kB" ) :
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except ( OSError, ValueError) :
+        return None
+    
+    return { "rss"    : fields.get( "Rss", 0),
+             "pss"    : fields.get( "Pss", 0),
+             "unique" : fields.get( "Private_Clean", 0) + fields.get( "Private_Dirty", 0),
+             "shared" : fields.get( "Shared_Clean", 0)  + fields.get( "Shared_Dirty", 0) }
+
+def log_memory( workers : dict[ int, str]) -> None :
+    
+    for name, pid in [ ( "supervisor", os.getpid()) ] \
+                   + [ ( name, pid) for pid, name in sorted(workers.items()) ] :
+        usage = memory_usage(pid)
+        if usage :
+            logging.info( f"Memory of {name} (pid {pid}): "
+                          f"unique {usage["unique"]} kB, shared {usage["shared"]} kB, "
+                          f"rss {usage["rss"]} kB, pss {usage["pss"]} kB")
+    
+    return
+
+def log_inbox( inbox : PartitionInbox, n_partitions : int) -> None :
+    
+    depths = [ inbox.depth(index) for index in range(n_partitions) ]
+    logging.info(f"Inbox depth per partition: {depths}")
+    
+    return
+
+def spawn( name : str, label : str, run : Callable[ [], int]) -> int :
+    """
+    Fork a process that exports its metrics with worker label `label` and runs
+    `run`. The child never returns.
+    """
+    pid = os.fork()
+    if pid :
+        return pid
+    
+    code = 1
+    try :
+        # Drop the supervisor's signal handlers (see `dispatch` and `serve_partition`)
+        signal.signal( signal.SIGTERM, signal.SIG_DFL)
+        signal.signal( signal.SIGINT,  signal.SIG_DFL)
+        METRICS.set_worker(label)
+        code = run()
+    except BaseException :
+        logging.exception(f"Process {name} crashed")
+    finally :
+        METRICS.flush( force = True)
+        logging.shutdown()
+        os._exit(code)
+
+def supervise( n_workers : int) -> int :
+    """
+    Preload shared data, fork `n_workers` workers and their dispatcher and keep them
+    running until SIGTERM or SIGINT.
+    """
+    # Load shared data once and keep the collector away from it, so that workers
+    # do not touch (and thus copy) its pages
+    CaseHandler.preload()
     gc.collect()
+    gc.freeze()
+    
+    # One partition per worker, all fed by the dispatcher through the inbox (which
+    # outlives them, so a restarted worker resumes its partition where it stopped)
+    inbox = PartitionInbox()
+    roles : dict[ str, tuple[ str, Callable[ [], int]]] = {
+        f"worker {index}" : ( str(index), lambda index = index : serve_partition(index))
+        for index in range(n_workers) }
+    roles["dispatcher"] = ( "dispatcher", lambda : dispatch(n_workers))
+    
+    workers  : dict[ int, str] = {}   # pid -> process name
+    stopping = False
+    
+    def stop( signum : int, _frame) -> None :
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers) :
+            os.kill( pid, signum)
+        return
+    
+    signal.signal( signal.SIGTERM, stop)
+    signal.signal( signal.SIGINT,  stop)
+    
+    for name, ( label, run ) in roles.items() :
+        workers[spawn( name, label, run)] = name
+    logging.info(f"Started {n_workers} workers and their dispatcher: {sorted(workers)}")
+    
+    next_report = time.monotonic() + min( 10.0, MEMORY_REPORT_SECONDS)
+    while workers :
+        
+        pid, status = os.waitpid( -1, os.WNOHANG)
+        if pid :
+            name = workers.pop(pid)
+            if not stopping :
+                logging.warning( f"Process {name} (pid {pid}) exited with status "
+                                 f"{os.waitstatus_to_exitcode(status)}; restarting it")
+                time.sleep(RESPAWN_DELAY)
+                workers[spawn( name, *roles[name])] = name
+            continue
+        
+        if time.monotonic() >= next_report :
+            log_memory(workers)
+            log_inbox( inbox, n_workers)
+            next_report = time.monotonic() + MEMORY_REPORT_SECONDS
+        
+        time.sleep(0.5)
+    
+    logging.info("All workers stopped")
     
     return 0
 
 
+# Instantiate and run queue worker(s)
+def main() -> int :
+    
+    logging.basicConfig( level  = logging.INFO,
+                         format = "%(asctime)s %(levelname)s %(message)s")
+    
+    if ( QUEUE_WORKERS > 1 ) and hasattr( os, "fork") :
+        return supervise(QUEUE_WORKERS)
+    
+    return serve()
+
+
 if __name__ == "__main__" :
     sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+SQLite Store
+-----
+* Base class of the app's local SQLite stores (image index, case checkpoints,
+  usage ledger and partition inbox): database path, schema creation and short-lived
+  connections (one per operation, so stores are safe to share across threads and
+  forked workers).
+* Database paths are read from environment variables `<PREFIX>_DB_DIR` (default:
+  repo directory) and `<PREFIX>_DB_NAME`.
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+from sofia_utils.io import ensure_dir
+
+
+def db_path_from_env( prefix : str, default_name : str) -> Path :
+    """
+    Database path from environment variables `<prefix>_DB_DIR` and `<prefix>_DB_NAME`.
+    """
+    db_dir  = os.getenv( f"{prefix}_DB_DIR", str(Path(__file__).parent))
+    db_name = os.getenv( f"{prefix}_DB_NAME", default_name)
+    
+    return Path(db_dir).expanduser().resolve() / Path(db_name)
+
+
+class SQLiteStore :
+    """
+    Local SQLite database whose tables and indices (statements in `SCHEMA`) are
+    created on construction.
+    """
+    
+    SCHEMA : tuple[ str, ...] = ()
+    
+    def __init__( self, db_path : str | Path) -> None :
+        
+        self.db_path = Path(db_path)
+        ensure_dir(self.db_path.parent)
+        
+        with self.connect() as conn :
+            for statement in self.SCHEMA :
+                conn.execute(statement)
+        
+        return
+    
+    @contextmanager
+    def connect(self) :
+        """
+        Open a connection, commit on success and always close it.
+        """
+        conn = sqlite3.connect( self.db_path, timeout = 30)
+        try :
+            with conn :
+                yield conn
+        finally :
+            conn.close()
@@ -1,64 +1,420 @@
 """
 CaseHander Tool Server
+-----
+* Tools are registered with decorator `tool`, which declares the tool name,
+  description, input schema and the agents that use it.
+* Tool calls are dispatched by exact name; fuzzy matching is only a fallback for
+  unknown names, and its result is memoized.
+* Tool inputs are validated against the declared schema before dispatch.
+* Tool calls run concurrently in a shared thread pool with per-tool timeouts. A
+  timeout does not cancel the call (Python threads cannot be interrupted): it keeps
+  running in its worker, and once `MAX_HUNG_CALLS` timed-out calls are still running
+  the pool is replaced, so hung calls cannot starve later turns.
+* The agent tool schemas in `agent_tools/` are generated from the registry (see
+  `agent_tools/translate_tools.py`), so schemas and handlers cannot drift.
 """
 
+import time
+from concurrent.futures import ( Future,
+                                 ThreadPoolExecutor,
+                                 TimeoutError )
+from threading import Lock
+from typing import ( Any,
+                     Callable )
+
 from wa_agents.basemodels import ( ToolCall,
                                    ToolResult )
 
 from domain_knowledge.dk_database import DomainKnowledgeDataBase
 
 
+class ToolSpec :
+    """
+    Registered tool: schema (in Anthropic format) plus handler.
+    """
+    
+    def __init__( self,
+                  name        : str,
+                  description : str,
+                  agents      : list[str],
+                  properties  : dict[ str, dict],
+                  required    : list[str],
+                  handler     : Callable ) -> None :
+        
+        self.name        = name
+        self.description = description
+        self.agents      = agents
+        self.properties  = properties
+        self.required    = required
+        self.handler     = handler
+        
+        return
+    
+    def definition(self) -> dict[ str, Any] :
+        """
+        Tool definition in Anthropic format.
+        """
+        input_schema = { "type" : "object", "properties" : self.properties }
+        if self.required :
+            input_schema["required"] = self.required
+        input_schema["additionalProperties"] = False
+        
+        return { "name"         : self.name,
+                 "description"  : self.description,
+                 "input_schema" : input_schema }
+
+
+TOOL_REGISTRY : dict[ str, ToolSpec] = {}
+
+
+def tool( name        : str,
+          description : str,
+          agents      : list[str],
+          properties  : dict[ str, dict] | None = None,
+          required    : list[str] | None = None ) -> Callable :
+    """
+    Decorator registering a `ToolServer` method as a tool. \\
+    Args:
+        name        : Tool name
+        description : Tool description (for the agents)
+        agents      : Agents that use the tool (one tool schema file per agent)
+        properties  : JSON schema of each tool argument
+        required    : Required tool arguments
+    """
+    def decorator( handler : Callable) -> Callable :
+        TOOL_REGISTRY[name] = ToolSpec( name, description, agents,
+                                        properties or {}, required or [], handler )
+        return handler
+    
+    return decorator
+
+def validate_input( spec : ToolSpec, tool_input : Any) -> str | None :
+    """
+    Validate tool call input against the tool schema. \\
+    Returns:
+        Error message, or None if the input is valid
+    """
+    if not isinstance( tool_input, dict) :
+        return f"Tool '{spec.name}' input must be an object"
+    
+    for arg in spec.required :
+        if not tool_input.get(arg) :
+            return f"Tool '{spec.name}' called without '{arg}'"
+    
+    json_types = { "array"   : list,
+                   "boolean" : bool,
+                   "integer" : int,
+                   "number"  : ( int, float),
+                   "object"  : dict,
+                   "string"  : str }
+    
+    for arg, value in tool_input.items() :
+        arg_schema = spec.properties.get(arg)
+        if arg_schema is None :
+            return f"Tool '{spec.name}' called with unexpected argument '{arg}'"
+        
+        arg_type = json_types.get(arg_schema.get("type"))
+        if arg_type and not isinstance( value, arg_type) :
+            return f"Tool '{spec.name}' argument '{arg}' must be of type " \
+                   f"'{arg_schema["type"]}'"
+        
+        item_type = json_types.get(arg_schema.get( "items", {}).get("type"))
+        if isinstance( value, list) and item_type \
+        and not all( isinstance( item, item_type) for item in value ) :
+            return f"Tool '{spec.name}' argument '{arg}' must contain items of type " \
+                   f"'{arg_schema["items"]["type"]}'"
+        
+        if ( "enum" in arg_schema ) and ( value not in arg_schema["enum"] ) :
+            return f"Tool '{spec.name}' argument '{arg}' must be one of " \
+                   f"{", ".join(arg_schema["enum"])}"
+    
+    return None
+
+
 class ToolServer :
     
+    # Thread pool shared by all tool servers (created on first use)
+    MAX_WORKERS   = 4
+    executor      : ThreadPoolExecutor | None = None
+    executor_lock = Lock()
+    
+    # Timed-out tool calls still running in the current thread pool, and how many of
+    # them it takes to replace the pool
+    MAX_HUNG_CALLS = 2
+    hung_calls     = 0
+    
+    # Per-tool timeouts in seconds
+    DEFAULT_TIMEOUT = 10.0
+    TOOL_TIMEOUTS   = { "get_joint_diagnosis" : 20.0 }
+    
+    # Memoized fuzzy matches of unknown tool names (shared by the tool call threads)
+    MAX_FUZZY_MATCHES  = 256
+    fuzzy_matches      : dict[ str, str | None] = {}
+    fuzzy_matches_lock = Lock()
+    
     def __init__( self, debug : bool = False) -> None :
         
         self.dkdb  = DomainKnowledgeDataBase(debug)
-        self.tools = [ "dummy_tool",
-                       "get_component_data",
-                       "get_joint_diagnosis",
-                       "mark_as_resolved" ]
+        self.tools = list(TOOL_REGISTRY)
+        
+        return
+    
+    @classmethod
+    def submit( cls,
+                fn   : Callable,
+                *args : Any ) -> tuple[ ThreadPoolExecutor, Future] :
+        """
+        Submit a call to the shared thread pool (created on first use). \\
+        Returns:
+            Tuple with the thread pool and the future of the call
+        """
+        with cls.executor_lock :
+            if cls.executor is None :
+                cls.executor   = ThreadPoolExecutor( max_workers        = cls.MAX_WORKERS,
+                                                     thread_name_prefix = "tool_server" )
+                cls.hung_calls = 0
+            
+            return cls.executor, cls.executor.submit( fn, *args)
+    
+    @classmethod
+    def mark_hung( cls, executor : ThreadPoolExecutor, future : Future) -> None :
+        """
+        Count a timed-out call that is still running in `executor` until it finishes.
+        Once `MAX_HUNG_CALLS` are running, stop sending calls to that pool: it is shut
+        down without waiting (its workers finish what they hold and exit) and the next
+        call creates a new one.
+        """
+        with cls.executor_lock :
+            # Calls of an already replaced pool are no longer counted
+            if executor is not cls.executor :
+                return
+            
+            cls.hung_calls += 1
+            if cls.hung_calls >= cls.MAX_HUNG_CALLS :
+                executor.shutdown( wait = False)
+                cls.executor = None
+                return
+        
+        future.add_done_callback( lambda _ : cls.release_hung(executor) )
         
         return
     
+    @classmethod
+    def release_hung( cls, executor : ThreadPoolExecutor) -> None :
+        
+        with cls.executor_lock :
+            if executor is cls.executor :
+                cls.hung_calls -= 1
+        
+        return
+    
+    @staticmethod
+    def tool_definitions( agent : str) -> list[ dict[ str, Any]] :
+        """
+        Definitions (in Anthropic format) of the tools used by an agent.
+        """
+        return [ spec.definition() for spec in TOOL_REGISTRY.values()
+                 if agent in spec.agents ]
+    
+    @staticmethod
+    def tool_agents() -> list[str] :
+        """
+        Agents that use at least one tool, in order of first appearance.
+        """
+        agents = []
+        for spec in TOOL_REGISTRY.values() :
+            agents.extend( agent for agent in spec.agents if agent not in agents )
+        
+        return agents
+    
+    def resolve_tool( self, name : str) -> ToolSpec | None :
+        """
+        Tool spec by exact name, else by (memoized) fuzzy match.
+        """
+        spec = TOOL_REGISTRY.get(name)
+        if spec :
+            return spec
+        
+        with self.fuzzy_matches_lock :
+            if name in self.fuzzy_matches :
+                return TOOL_REGISTRY.get(self.fuzzy_matches[name])
+        
+        # Match outside the lock; concurrent misses of the same name just match twice
+        match = self.dkdb.get_match( name, self.tools)
+        with self.fuzzy_matches_lock :
+            if len(self.fuzzy_matches) >= self.MAX_FUZZY_MATCHES :
+                self.fuzzy_matches.clear()
+            self.fuzzy_matches[name] = match
+        
+        return TOOL_REGISTRY.get(match)
+    
     def process( self, tool_calls : list[ToolCall]) -> list[ToolResult] :
+        """
+        Process tool calls concurrently. \\
+        Each tool call runs in the shared thread pool with its own timeout (see
+        `TOOL_TIMEOUTS`); a tool call that fails or times out yields an error result
+        without affecting the others. Results keep the order of the tool calls. \\
+        A timed-out call is not cancelled: it keeps running in the pool (see
+        `mark_hung`) and its eventual result is discarded.
+        """
+        if not tool_calls :
+            return []
         
-        tool_results = []
+        start     = time.monotonic()
+        submitted = [ self.submit( self.process_one, tc) for tc in tool_calls ]
         
-        for tc in tool_calls :
-            matched_tool = self.dkdb.get_match( tc.name, self.tools)
-            error  = True
-            result = None
-            e_msg  = None
-            
-            match matched_tool :
-
-                case "dummy_tool" :
-                    error, result = False, "Executed successfully"
-                
-                case "get_component_data" :
-                    component_keys = tc.input.get("component_keys")
-                    if component_keys :
-                        error, result = self.dkdb.get_components(component_keys)
-                    else :
-                        e_msg = f"Tool 'get_component_data' called without 'component_keys'"
-                
-                case "get_joint_diagnosis" :
-                    message_codes = tc.input.get("message_codes")
-                    if message_codes :
-                        error, result = self.dkdb.get_joint_diagnosis(message_codes)
-                    else :
-                        e_msg = f"Tool 'get_joint_diagnosis' called without 'message_codes'"
-                
-                case "mark_as_resolved" :
-                    error, result = False, "Successfully marked case as resolved."
-                
-                case _ :
-                    e_msg = f"Tool name '{tc.name}' could not be matched"
-            
-            if error and e_msg :
-                result = f"In class AgentToolServer method process: {e_msg}"
-            
-            tr = ToolResult( id = tc.id, error = error, content = result)
+        tool_results = []
+        for tc, ( executor, future) in zip( tool_calls, submitted) :
+            timeout   = self.TOOL_TIMEOUTS.get( tc.name, self.DEFAULT_TIMEOUT)
+            remaining = max( 0.0, start + timeout - time.monotonic())
+            try :
+                tr = future.result( timeout = remaining)
+            except TimeoutError :
+                self.mark_hung( executor, future)
+                e_msg = f"Tool '{tc.name}' timed out after {timeout} seconds"
+                tr    = self.error_result( tc, e_msg)
+            except Exception as ex :
+                e_msg = f"Tool '{tc.name}' raised {type(ex).__name__}: {ex}"
+                tr    = self.error_result( tc, e_msg)
             tool_results.append(tr)
         
         return tool_results
+    
+    @staticmethod
+    def error_result( tc : ToolCall, e_msg : str) -> ToolResult :
+        
+        result = f"In class AgentToolServer method process: {e_msg}"
+        
+        return ToolResult( id = tc.id, error = True, content = result)
+    
+    def process_one( self, tc : ToolCall) -> ToolResult :
+        
+        spec = self.resolve_tool(tc.name)
+        if not spec :
+            return self.error_result( tc, f"Tool name '{tc.name}' could not be matched")
+        
+        tool_input = tc.input if tc.input is not None else {}
+        e_msg      = validate_input( spec, tool_input)
+        if e_msg :
+            return self.error_result( tc, e_msg)
+        
+        error, result = spec.handler( self, **tool_input)
+        
+        return ToolResult( id = tc.id, error = error, content = result)
+    
+    # =====================================================================================
+    # TOOLS
+    # =====================================================================================
+    
+    @tool( name        = "dummy_tool",
+           description = "Dummy Tool for Debugging Purposes",
+           agents      = [] )
+    def dummy_tool(self) -> tuple[ bool, Any] :
+        return False, "Executed successfully"
+    
+    @tool( name        = "get_component_data",
+           description = "DKDB: Get detailed data for one or more component keys",
+           agents      = [ "main" ],
+           properties  = {
+               "component_keys" : {
+                   "type"        : "array",
+                   "items"       : { "type" : "string" },
+                   "description" : "List of component keys. If component keys are "
+                                   "associated with motors, ESCs, pumps or nozzles then "
+                                   "keys must be indexed and cannot have placeholders. "
+                                   "Examples:\n"
+                                   "* Correct: ['motor_centrifugal_2','board_esc_6']\n"
+                                   "* Incorrect: ['motor_centrifugal_{NOZZLE}',"
+                                   "'board_esc_{MOTOR}']" } },
+           required    = [ "component_keys" ] )
+    def get_component_data( self, component_keys : list[str]) -> tuple[ bool, Any] :
+        return self.dkdb.get_components(component_keys)
+    
+    @tool( name        = "get_issue_data",
+           description = "DKDB: Get detailed data for one or more issue keys",
+           agents      = [ "main" ],
+           properties  = {
+               "issue_keys" : {
+                   "type"        : "array",
+                   "items"       : { "type" : "string" },
+                   "description" : "List of issue keys, as listed by tool "
+                                   "get_joint_diagnosis" } },
+           required    = [ "issue_keys" ] )
+    def get_issue_data( self, issue_keys : list[str]) -> tuple[ bool, Any] :
+        return self.dkdb.get_issues(issue_keys)
+    
+    @tool( name        = "extract_message_codes",
+           description = "DKDB: Extract the message codes of every known message found "
+                         "in a block of text (e.g., several error messages pasted by the "
+                         "user or read from a whole screen)",
+           agents      = [ "match" ],
+           properties  = {
+               "text" : {
+                   "type"        : "string",
+                   "description" : "Free text with one or more messages" },
+               "language" : {
+                   "type"        : "string",
+                   "enum"        : [ "english", "spanish" ],
+                   "description" : "Language of the text, if known. By default message "
+                                   "names in both languages are matched" } },
+           required    = [ "text" ] )
+    def extract_message_codes( self,
+                               text     : str,
+                               language : str | None = None ) -> tuple[ bool, Any] :
+        return self.dkdb.extract_messages( text, language)
+    
+    @tool( name        = "get_message_catalog",
+           description = "DKDB: Get the message catalog of one or more partitions "
+                         "(for messages missing from a partial catalog)",
+           agents      = [ "match" ],
+           properties  = {
+               "partitions" : {
+                   "type"        : "array",
+                   "items"       : { "type" : "string" },
+                   "description" : "List of catalog partitions, as listed under OTHER "
+                                   "PARTITIONS in the partial catalog. Example: "
+                                   "['propulsion','spraying']" },
+               "language" : {
+                   "type"        : "string",
+                   "enum"        : [ "english", "spanish" ],
+                   "description" : "Language of the message names, if known. By "
+                                   "default names in both languages are listed" } },
+           required    = [ "partitions" ] )
+    def get_message_catalog( self,
+                             partitions : list[str],
+                             language   : str | None = None ) -> tuple[ bool, Any] :
+        return self.dkdb.get_message_catalog( partitions, language)
+    
+    @tool( name        = "get_joint_diagnosis",
+           description = "DKDB: Get joint diagnosis for one or more message codes",
+           agents      = [ "match" ],
+           properties  = {
+               "message_codes" : {
+                   "type"        : "array",
+                   "items"       : { "type" : "string" },
+                   "description" : "List of message codes. If messages are associated "
+                                   "with motors, ESCs, pumps or nozzles then message "
+                                   "codes must be indexed and cannot have placeholders. "
+                                   "Examples:\n"
+                                   "* Correct: ['error_pump_1_stuck', "
+                                   "'error_esc_4_throttle']\n"
+                                   "* Incorrect: ['error_pump_{PUMP}_stuck', "
+                                   "'error_esc_{MOTOR}_stuck']" },
+               "verbose" : {
+                   "type"        : "boolean",
+                   "description" : "If true then every component and issue is returned "
+                                   "in full detail. By default only the first few of "
+                                   "each are returned in full detail and the rest as "
+                                   "key, name and score (number of messages it may "
+                                   "explain)" } },
+           required    = [ "message_codes" ] )
+    def get_joint_diagnosis( self,
+                             message_codes : list[str],
+                             verbose       : bool = False ) -> tuple[ bool, Any] :
+        return self.dkdb.get_joint_diagnosis( message_codes, verbose)
+    
+    @tool( name        = "mark_as_resolved",
+           description = "Mark the current case as resolved and close it",
+           agents      = [ "main" ] )
+    def mark_as_resolved(self) -> tuple[ bool, Any] :
+        return False, "Successfully marked case as resolved."
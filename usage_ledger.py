@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Usage Ledger
+-----
+* Record the token usage (prompt, completion and cached prompt tokens) of every
+  agent call, tagged by user, case, agent role and model, in a local SQLite
+  database.
+* Token counts are taken from the usage reported by the provider when the agent
+  response carries it; otherwise they are estimated from the size of the context
+  and the response (and flagged as estimated).
+* Offline report: token totals and cost (from the per-model prices in
+  `MODEL_PRICES`) per case, agent, model or any combination of them.
+
+Usage:
+    python3 usage_ledger.py                        # Totals per agent and model
+    python3 usage_ledger.py --by case              # Totals per case
+    python3 usage_ledger.py --by agent --since 7   # Last 7 days, per agent
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Any
+
+from wa_agents.basemodels import Message
+
+from context_compaction import estimate_tokens
+from sqlite_store import ( db_path_from_env,
+                           SQLiteStore )
+
+
+# Set usage database path
+USAGE_DB_PATH = db_path_from_env( "USAGE", "usage.sqlite3")
+
+GROUP_FIELDS = ( "user", "case_id", "agent", "model")
+
+# Model prices in USD per million tokens: ( prompt, cached prompt, completion ). \
+# Models not listed here (including 'unknown') are reported without cost.
+MODEL_PRICES : dict[ str, tuple[ float, float, float]] = {
+    "openai/gpt-5-mini"                 : ( 0.25, 0.025, 2.00),
+    "openai/gpt-5-nano"                 : ( 0.05, 0.005, 0.40),
+    "qwen/qwen2.5-vl-32b-instruct:free" : ( 0.00, 0.000, 0.00),
+    "mistralai/pixtral-12b"             : ( 0.10, 0.100, 0.10),
+}
+
+
+def usage_fields( usage : Any) -> dict[ str, Any] :
+    """
+    Provider usage (dict or model) as a flat dict.
+    """
+    if usage is None :
+        return {}
+    if hasattr( usage, "model_dump") :
+        return usage.model_dump()
+    if isinstance( usage, dict) :
+        return usage
+    
+    return dict(vars(usage))
+
+def parse_usage( usage : Any) -> tuple[ int, int, int] | None :
+    """
+    Token counts from provider usage, in either OpenAI format (`prompt_tokens`,
+    `completion_tokens`, `prompt_tokens_details.cached_tokens`) or Anthropic format
+    (`input_tokens`, `output_tokens`, `cache_read_input_tokens`). \\
+    Returns:
+        Tuple (prompt tokens including cached, completion tokens, cached tokens), or
+        None if no token counts are found.
+    """
+    fields = usage_fields(usage)
+    
+    if "prompt_tokens" in fields :
+        details = usage_fields(fields.get("prompt_tokens_details")) \
+               or usage_fields(fields.get("input_tokens_details"))
+        cached  = fields.get("cached_tokens") or details.get( "cached_tokens") or 0
+        return ( int(fields["prompt_tokens"] or 0),
+                 int(fields.get("completion_tokens") or 0),
+                 int(cached) )
+    
+    if "input_tokens" in fields :
+        cached  = int(fields.get("cache_read_input_tokens") or 0)
+        written = int(fields.get("cache_creation_input_tokens") or 0)
+        return ( int(fields["input_tokens"] or 0) + cached + written,
+                 int(fields.get("output_tokens") or 0),
+                 cached )
+    
+    return None
+
+def usage_cost( model      : str,
+                prompt     : int,
+                completion : int,
+                cached     : int ) -> float | None :
+    """
+    Cost in USD of the given token counts of a model (cached prompt tokens at the
+    cached price), or None if the model has no price in `MODEL_PRICES`.
+    """
+    prices = MODEL_PRICES.get(model)
+    if prices is None :
+        return None
+    
+    p_prompt, p_cached, p_completion = prices
+    
+    return ( ( prompt - cached ) * p_prompt
+             + cached * p_cached
+             + completion * p_completion ) / 1e6
+
+
+class UsageLedger(SQLiteStore) :
+    """
+    Token usage of every agent call, in a local SQLite database.
+    """
+    
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS usage (
+            timestamp  REAL    NOT NULL,
+            user       TEXT    NOT NULL,
+            case_id    TEXT    NOT NULL,
+            agent      TEXT    NOT NULL,
+            model      TEXT    NOT NULL,
+            prompt     INTEGER NOT NULL,
+            completion INTEGER NOT NULL,
+            cached     INTEGER NOT NULL,
+            estimated  INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS usage_user_case
+        ON usage ( user, case_id )
+        """ )
+    
+    def __init__( self, db_path : str | Path = USAGE_DB_PATH) -> None :
+        
+        super().__init__(db_path)
+        
+        return
+    
+    def record( self,
+                user     : str,
+                case_id  : str | None,
+                agent    : str,
+                model    : str,
+                context  : list[Message],
+                response : Message ) -> tuple[ int, int, int] :
+        """
+        Record the token usage of an agent call. \\
+        Args:
+            user     : User identifier
+            case_id  : Case identifier
+            agent    : Agent role (e.g., 'image', 'match' or 'main')
+            model    : Model that answered
+            context  : Agent context sent with the call (for estimates)
+            response : Agent response (with provider usage, if available)
+        Returns:
+            Tuple with the prompt, completion and cached token counts recorded
+        """
+        tokens    = parse_usage(getattr( response, "usage", None))
+        estimated = tokens is None
+        if estimated :
+            tokens = ( sum( map( estimate_tokens, context) ),
+                       estimate_tokens(response),
+                       0 )
+        
+        with self.connect() as conn :
+            conn.execute(
+                """
+                INSERT INTO usage ( timestamp, user, case_id, agent, model,
+                                    prompt, completion, cached, estimated )
+                VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, ( time.time(), user, str(case_id or ""), agent, model,
+                       *tokens, int(estimated)) )
+        
+        return tokens
+    
+    def totals( self,
+                group_by : list[str],
+                since    : float | None = None ) -> list[ dict[ str, Any]] :
+        """
+        Token totals and cost per group, largest prompt totals first. \\
+        Args:
+            group_by : Fields to group by (from `GROUP_FIELDS`)
+            since    : If given, only count calls after this UNIX timestamp
+        Returns:
+            List of dicts with the group fields plus `calls`, `prompt`, `completion`,
+            `cached`, `estimated` (number of calls with estimated counts), `cost` (USD)
+            and `unpriced` (number of calls of models without a price)
+        """
+        for field in group_by :
+            if field not in GROUP_FIELDS :
+                raise ValueError(f"In UsageLedger.totals: Invalid field '{field}'")
+        
+        # Cost depends on the model, so sum per group and model first
+        columns = ", ".join( [ *group_by, "model" ] if "model" not in group_by
+                             else group_by )
+        query   = f"""
+                  SELECT {columns}, COUNT(*), SUM(prompt), SUM(completion),
+                         SUM(cached), SUM(estimated)
+                  FROM usage WHERE timestamp >= ?
+                  GROUP BY {columns}
+                  """
+        with self.connect() as conn :
+            rows = conn.execute( query, ( since or 0.0,) ).fetchall()
+        
+        counts = [ "calls", "prompt", "completion", "cached", "estimated" ]
+        keys   = [ *columns.split(", "), *counts ]
+        totals : dict[ tuple, dict[ str, Any]] = {}
+        for values in rows :
+            row   = dict(zip( keys, values))
+            group = tuple( row[field] for field in group_by )
+            total = totals.setdefault( group,
+                                       { **dict(zip( group_by, group)),
+                                         **dict.fromkeys( counts, 0),
+                                         "cost" : 0.0, "unpriced" : 0 } )
+            for count in counts :
+                total[count] += row[count]
+            cost = usage_cost( row["model"], row["prompt"], row["completion"],
+                               row["cached"])
+            if cost is None :
+                total["unpriced"] += row["calls"]
+            else :
+                total["cost"] += cost
+        
+        return sorted( totals.values(), key = lambda t : t["prompt"], reverse = True)
+
+
+def print_report( rows : list[ dict[ str, Any]], group_by : list[str]) -> None :
+    
+    total_prompt = sum( row["prompt"] for row in rows ) or 1
+    
+    header = "".join( f"{field.upper():<24}" for field in group_by )
+    print(f"{header}{'CALLS':>7} {'PROMPT':>11} {'COMPLETION':>11} {'CACHED':>11} "
+          f"{'CACHED %':>9} {'SHARE %':>8} {'EST.':>5} {'COST USD':>10} {'UNPR.':>6}")
+    for row in rows :
+        groups = "".join( f"{str(row[field]):<24}" for field in group_by )
+        cached = 100 * row["cached"] / row["prompt"] if row["prompt"] else 0.0
+        share  = 100 * row["prompt"] / total_prompt
+        print(f"{groups}{row["calls"]:>7} {row["prompt"]:>11} {row["completion"]:>11} "
+              f"{row["cached"]:>11} {cached:>9.1f} {share:>8.1f} {row["estimated"]:>5} "
+              f"{row["cost"]:>10.4f} {row["unpriced"]:>6}")
+    
+    return
+
+
+def main() -> None :
+    
+    parser = argparse.ArgumentParser( description = "Report agent token usage." )
+    parser.add_argument( "--by",
+                         nargs   = "+",
+                         default = [ "agent", "model" ],
+                         choices = [ "user", "case", "agent", "model" ],
+                         help    = "Fields to group by." )
+    parser.add_argument( "--since",
+                         type    = float,
+                         default = None,
+                         help    = "Only count calls of the last N days." )
+    parser.add_argument( "--db",
+                         type    = Path,
+                         default = USAGE_DB_PATH,
+                         help    = "Usage database path." )
+    args = parser.parse_args()
+    
+    group_by = [ "case_id" if field == "case" else field for field in args.by ]
+    if "case_id" in group_by and "user" not in group_by :
+        group_by.insert( 0, "user")
+    since    = time.time() - args.since * 86400 if args.since else None
+    
+    print_report( UsageLedger(args.db).totals( group_by, since), group_by)
+    
+    return
+
+
+if __name__ == "__main__" :
+    main()